@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Measure PIFX throughput and latency against a local mock LIFX API.
+
+    python benchmarks/bench_client.py --lights 200 --requests 100 --latency 0.02
+
+Each scenario reports calls per second and p50/p99 call latency (per
+request for the batched scenario, whose calls are operations), so
+changes to the client (pooling, caching, batching, coalescing) can be
+compared under the same simulated network conditions.
+"""
+
+from __future__ import print_function
+
+import argparse
+import sys
+import time
+
+sys.path.insert(1, '.')
+
+from pifx import PIFX
+from pifx.client import HOOK_AFTER_RESPONSE
+from pifx.retry import RetryPolicy
+from pifx.testing import MockLIFXServer
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+def timed(function):
+    start = time.time()
+    function()
+    return time.time() - start
+
+def report(name, calls, latencies, elapsed):
+    print('{:<28} {:>6} calls {:>9.1f} req/s  p50 {:>7.2f} ms  p99 {:>7.2f} ms'.format(
+        name, calls, calls / elapsed if elapsed else 0.0,
+        percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000))
+
+def bench_sequential(p, name, requests, call):
+    latencies = []
+    start = time.time()
+    for i in range(requests):
+        latencies.append(timed(lambda: call(i)))
+    report(name, requests, latencies, time.time() - start)
+
+def bench_threaded(p, requests, ids):
+    latencies = []
+
+    def record(submitted):
+        # time from submit() to the result, including time queued for a thread
+        return lambda future: latencies.append(time.time() - submitted)
+
+    start = time.time()
+    futures = []
+    for i in range(requests):
+        future = p.submit('set_state', 'id:' + ids[i % len(ids)], power='on')
+        future.add_done_callback(record(time.time()))
+        futures.append(future)
+    for future in futures:
+        future.result()
+    report('set_state (threaded)', requests, latencies, time.time() - start)
+
+def bench_batched(p, requests, ids):
+    operations = [
+        {'selector': 'id:' + ids[i % len(ids)], 'power': 'on', 'brightness': 0.5}
+        for i in range(requests)
+    ]
+
+    # latency of each lights/states request, throughput in operations
+    latencies = []
+    record = lambda request, response, elapsed: latencies.append(elapsed)
+    p.client.add_hook(HOOK_AFTER_RESPONSE, record)
+    try:
+        elapsed = timed(lambda: p.set_states(operations))
+    finally:
+        p.client.remove_hook(HOOK_AFTER_RESPONSE, record)
+    report('set_states (batched)', requests, latencies, elapsed)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--lights', type=int, default=100,
+        help='number of lights served by the mock API')
+    parser.add_argument('--requests', type=int, default=100,
+        help='calls made per scenario')
+    parser.add_argument('--latency', type=float, default=0.01,
+        help='seconds added to every mock API response')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+        help='fraction of requests answered with a 503')
+    parser.add_argument('--rate-limit', type=int, default=None,
+        help='requests allowed per period before answering 429')
+    parser.add_argument('--rate-limit-period', type=float, default=60.0,
+        help='seconds after which the rate limit resets')
+    parser.add_argument('--workers', type=int, default=10,
+        help='threads used by the threaded scenario')
+    args = parser.parse_args(argv)
+
+    server = MockLIFXServer(light_count=args.lights, latency=args.latency,
+        rate_limit=args.rate_limit, rate_limit_period=args.rate_limit_period,
+        error_rate=args.error_rate)
+
+    with server:
+        p = PIFX('benchmark', http_endpoint=server.endpoint,
+            retry_policy=RetryPolicy(max_attempts=5, backoff_base=0.01),
+            max_workers=args.workers)
+        ids = [light['id'] for light in p.list_lights()]
+
+        print('{} lights, {:g} ms latency, {:g} error rate, rate limit {}'.format(
+            args.lights, args.latency * 1000, args.error_rate, args.rate_limit))
+
+        bench_sequential(p, 'list_lights', args.requests,
+            lambda i: p.list_lights())
+        bench_sequential(p, 'iter_lights (streamed)', args.requests,
+            lambda i: list(p.iter_lights()))
+        bench_sequential(p, 'set_state (sequential)', args.requests,
+            lambda i: p.set_state('id:' + ids[i % len(ids)], power='on'))
+        bench_threaded(p, args.requests, ids)
+        bench_batched(p, args.requests, ids)
+
+        p.shutdown()
+
+    print('{} requests served'.format(len(server.requests)))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,4 +15,15 @@
 # limitations under the License.
 #
 
-from pifx.core import PIFX
+import sys
+
+if sys.version_info >= (3, 7):
+    # imported on first use, so that modules which do not need PIFX (e.g
+    # the daemon client used by the pifx command) do not load requests
+    def __getattr__(name):
+        if name == 'PIFX':
+            from pifx.core import PIFX
+            return PIFX
+        raise AttributeError("module 'pifx' has no attribute {!r}".format(name))
+else:
+    from pifx.core import PIFX
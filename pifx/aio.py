@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""asyncio support for PIFX.
+
+Requires Python 3.5+ and aiohttp (``pip install pifx[async]``).
+"""
+
+import asyncio
+import time
+
+import aiohttp
+
+from pifx import models, scenes, util
+from pifx.cache import KEY_SCENES
+from pifx.core import PIFX
+from pifx.exceptions import DeadlineExceeded
+from pifx.inventory import LightIndex
+
+
+class AsyncLIFXWebAPIClient:
+    """Coroutine counterpart of :class:`pifx.client.LIFXWebAPIClient`.
+
+    Requests share one pooled aiohttp session, so many calls can be in
+    flight concurrently from a single event loop. The session is created
+    lazily on first use, inside the running loop.
+
+    pool_size: Integer
+        Maximum number of simultaneous connections to the API.
+        default: 100
+    """
+    def __init__(self, api_key, http_endpoint=None, pool_size=100):
+        if http_endpoint is None:
+            self.http_base = "https://api.lifx.com/v1/"
+        else:
+            self.http_base = http_endpoint
+
+        self.api_key = api_key
+        self.headers = util.generate_auth_header(self.api_key)
+        self.pool_size = pool_size
+        self._s = None
+
+    def _full_http_endpoint(self, suffix):
+        return self.http_base + suffix
+
+    def _session(self):
+        if self._s is None or self._s.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self._s = aiohttp.ClientSession(
+                connector=connector, headers=self.headers)
+        return self._s
+
+    async def close(self):
+        """Close the underlying connection pool."""
+        if self._s is not None and not self._s.closed:
+            await self._s.close()
+        self._s = None
+
+    async def perform_request(
+        self,
+        method,
+        endpoint,
+        endpoint_args=[],
+        argument_tuples=None,
+        json_body=False,
+        parse_data=True,
+        priority=0,
+        deadline=None
+    ):
+        # requests are not queued, so priority has no effect here
+        timeout = None
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise DeadlineExceeded("Deadline passed before sending")
+            timeout = aiohttp.ClientTimeout(total=remaining)
+
+        http_endpoint = self._full_http_endpoint(
+            endpoint.format(*endpoint_args)
+        )
+
+        data = None
+        if argument_tuples is not None:
+            data = util.arg_tup_to_dict(argument_tuples)
+
+        if json_body:
+            request_kwargs = {'json': data}
+        else:
+            request_kwargs = {'data': data}
+
+        if timeout is not None:
+            request_kwargs['timeout'] = timeout
+
+        async with self._session().request(
+                method, http_endpoint, **request_kwargs) as res:
+            body = await res.read()
+            status_code = res.status
+            headers = dict(res.headers)
+
+        util.handle_status(status_code, headers, body)
+
+        parsed_response = util.parse_text(body)
+
+        if parse_data:
+            return util.parse_data(parsed_response)
+
+        return parsed_response
+
+
+def _unavailable(name, hint):
+    """Hide a synchronous PIFX method which has no coroutine version"""
+    def method(self):
+        raise AttributeError("AsyncPIFX has no {}, {}".format(name, hint))
+    return property(method)
+
+
+class AsyncPIFX(PIFX):
+    """asyncio version of :class:`pifx.PIFX`.
+
+    Every API method is a coroutine taking the same arguments as its
+    synchronous counterpart, so many selectors can be driven concurrently:
+
+    .. code-block:: python
+
+        async with AsyncPIFX(api_key) as p:
+            await asyncio.gather(*[
+                p.set_state(selector, color='red') for selector in selectors
+            ])
+    """
+    def __init__(self, api_key, http_endpoint=None, pool_size=100):
+        PIFX.__init__(self, api_key, client=AsyncLIFXWebAPIClient(
+            api_key, http_endpoint, pool_size=pool_size))
+
+    async def close(self):
+        """Close the underlying connection pool."""
+        await self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _write(self, affected_selectors, finish=True, **request_kwargs):
+        self._validate_selectors(affected_selectors)
+
+        results = await self.client.perform_request(**request_kwargs)
+        if self.reissue_policy is not None:
+            results = await self._reissue_failed(request_kwargs, results)
+
+        return self._after_write(affected_selectors, request_kwargs, results, finish)
+
+    async def _reissue_failed(self, request_kwargs, results):
+        policy = self.reissue_policy
+        attempt = 1
+        while policy.should_reissue(request_kwargs['endpoint'], attempt):
+            reissue_kwargs, origins = self._reissue_request(request_kwargs, results)
+            if reissue_kwargs is None:
+                break
+
+            if policy.delay:
+                await asyncio.sleep(policy.delay)
+            try:
+                new_results = await self.client.perform_request(**reissue_kwargs)
+            except DeadlineExceeded:
+                break
+
+            results = self._merge_reissued(results, origins, new_results)
+            attempt += 1
+
+        return results
+
+    async def _fetch_lights(self, selector, refresh=False, **options):
+        lights = None
+        if self.cache is not None and not refresh:
+            lights = self.cache.get_lights(selector)
+
+        if lights is None:
+            lights = await self.client.perform_request(
+                method='get', endpoint='lights/{}',
+                endpoint_args=[selector], parse_data=False, **options)
+            self._remember_lights(selector, lights)
+
+        return lights
+
+    async def list_lights(self, selector='all', priority=None, deadline=None):
+        """Coroutine version of :meth:`pifx.PIFX.list_lights`."""
+        lights = await self._fetch_lights(
+            selector, **self._request_options(priority, deadline))
+
+        if self.models:
+            return models.parse_lights(lights, self.keep_raw)
+
+        return lights
+
+    async def get_state(self, selector='all', priority=None, deadline=None):
+        """Coroutine version of :meth:`pifx.PIFX.get_state`."""
+        lights = None
+        if self.store is not None:
+            lights = self.store.get(selector)
+
+        if lights is None:
+            lights = await self._fetch_lights(selector, refresh=True,
+                **self._request_options(priority, deadline))
+
+        if self.models:
+            return models.parse_lights(lights, self.keep_raw)
+
+        return lights
+
+    # the thread based helpers have no coroutine versions, gather
+    # coroutines with asyncio instead
+    iter_lights = _unavailable('iter_lights',
+        'the async client does not stream responses, use list_lights')
+    watch = _unavailable('watch', 'poll get_state from a task')
+    submit = _unavailable('submit', 'use asyncio.ensure_future')
+    map = _unavailable('map', 'use asyncio.gather')
+
+    async def build_index(self, selector='all', priority=None, deadline=None):
+        """Coroutine version of :meth:`pifx.PIFX.build_index`."""
+        self.index = LightIndex(await self._fetch_lights(
+            selector, **self._request_options(priority, deadline)))
+        return self.index
+
+    async def set_state(self, *args, **kwargs):
+        """Coroutine version of :meth:`pifx.PIFX.set_state`."""
+        return await PIFX.set_state(self, *args, **kwargs)
+
+    async def set_states(self, operations, defaults=None, priority=None,
+        deadline=None):
+        """Coroutine version of :meth:`pifx.PIFX.set_states`.
+        Chunks are sent concurrently.
+        """
+        self._check_state_colors(list(operations) + [defaults])
+        options = self._request_options(priority, deadline)
+
+        affected_selectors = [operation['selector'] for operation in operations]
+        responses = await asyncio.gather(*[
+            self._write(
+                affected_selectors, finish=False, method='put',
+                endpoint='lights/states', argument_tuples=argument_tuples,
+                json_body=True, **options)
+            for argument_tuples
+            in util.states_argument_tuples(operations, defaults)
+        ])
+
+        return self._finish_write(
+            [result for response in responses for result in response])
+
+    async def state_delta(self, *args, **kwargs):
+        """Coroutine version of :meth:`pifx.PIFX.state_delta`."""
+        return await PIFX.state_delta(self, *args, **kwargs)
+
+    async def toggle_power(self, *args, **kwargs):
+        """Coroutine version of :meth:`pifx.PIFX.toggle_power`."""
+        return await PIFX.toggle_power(self, *args, **kwargs)
+
+    async def breathe_lights(self, *args, **kwargs):
+        """Coroutine version of :meth:`pifx.PIFX.breathe_lights`."""
+        return await PIFX.breathe_lights(self, *args, **kwargs)
+
+    async def pulse_lights(self, *args, **kwargs):
+        """Coroutine version of :meth:`pifx.PIFX.pulse_lights`."""
+        return await PIFX.pulse_lights(self, *args, **kwargs)
+
+    async def cycle_lights(self, *args, **kwargs):
+        """Coroutine version of :meth:`pifx.PIFX.cycle_lights`."""
+        return await PIFX.cycle_lights(self, *args, **kwargs)
+
+    async def list_scenes(self, priority=None, deadline=None):
+        """Coroutine version of :meth:`pifx.PIFX.list_scenes`."""
+        scenes_list = None
+        if self.cache is not None:
+            scenes_list = self.cache.get(KEY_SCENES)
+
+        if scenes_list is None:
+            scenes_list = await self.client.perform_request(
+                method='get', endpoint='scenes', parse_data=False,
+                **self._request_options(priority, deadline))
+
+            if self.cache is not None:
+                self.cache.set(KEY_SCENES, scenes_list)
+
+        if self.models:
+            return models.parse_scenes(scenes_list, self.keep_raw)
+
+        return scenes_list
+
+    async def activate_scene(self, *args, **kwargs):
+        """Coroutine version of :meth:`pifx.PIFX.activate_scene`."""
+        return await PIFX.activate_scene(self, *args, **kwargs)
+
+    async def apply_scene(self, targets, snapshot=None, duration=None,
+        priority=None, deadline=None):
+        """Coroutine version of :meth:`pifx.PIFX.apply_scene`."""
+        options = self._request_options(priority, deadline)
+
+        lights = snapshot
+        if lights is None and self.store is not None:
+            lights = self.store.get('all')
+        if lights is None:
+            lights = await self._fetch_lights('all', **options)
+
+        operations = scenes.diff_scene(lights, targets)
+        if not operations:
+            return []
+
+        if deadline is not None:
+            # what is left of the deadline after reading the current state
+            deadline = options['deadline'] - time.time()
+
+        defaults = {'duration': duration} if duration is not None else None
+        return await self.set_states(operations, defaults,
+            priority=priority, deadline=deadline)
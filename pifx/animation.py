@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Client-side animations driven by set_state transitions.
+
+.. code-block:: python
+
+    timeline = Timeline([
+        (0, {'color': 'red', 'brightness': 1.0}),
+        (5, {'color': 'blue', 'brightness': 0.2}),
+        (10, {'color': 'red', 'brightness': 1.0}),
+    ])
+    Animator(p, timeline, selector='group:Living Room').run()
+"""
+
+import bisect
+import time
+from collections import namedtuple
+
+from pifx.color import InvalidColor, parse_hsbk
+
+Keyframe = namedtuple('Keyframe', 'time state')
+
+# color components interpolated between keyframes
+_COMPONENTS = ('hue', 'saturation', 'brightness', 'kelvin')
+
+
+def _color_components(state):
+    """Return the HSBK components set by a keyframe state, or None if the
+    state's color cannot be interpolated."""
+    components = dict()
+    if state.get('color') is not None:
+        try:
+            hsbk = parse_hsbk(state['color'])
+        except InvalidColor:
+            return None
+        components.update(
+            (name, value) for name, value in hsbk._asdict().items()
+            if value is not None)
+    if state.get('brightness') is not None:
+        components['brightness'] = float(state['brightness'])
+    return components
+
+def _interpolate_state(start, end, fraction):
+    if fraction <= 0:
+        return dict(start)
+    if fraction >= 1:
+        return dict(end)
+
+    start_components = _color_components(start)
+    end_components = _color_components(end)
+    if start_components is None or end_components is None:
+        # step to the next keyframe once it is reached
+        return dict(start)
+
+    state = dict(start)
+    state.pop('color', None)
+
+    components = dict()
+    for name in _COMPONENTS:
+        if name not in start_components or name not in end_components:
+            if name in end_components:
+                components[name] = end_components[name]
+            continue
+        begin = start_components[name]
+        delta = end_components[name] - begin
+        if name == 'hue':
+            delta = (delta + 180.0) % 360.0 - 180.0
+        components[name] = begin + delta * fraction
+    if 'hue' in components:
+        components['hue'] %= 360.0
+
+    if 'brightness' in components:
+        state['brightness'] = components.pop('brightness')
+    if components:
+        state['color'] = ' '.join(
+            '{}:{:g}'.format(name, components[name])
+            for name in _COMPONENTS if name in components)
+
+    return state
+
+
+class Timeline:
+    """A list of keyframes, each a time in seconds from the start of the
+    animation and a dict of set_state arguments (power, color, brightness).
+    States between keyframes are interpolated."""
+    def __init__(self, keyframes):
+        self.keyframes = sorted(
+            (Keyframe(float(t), dict(state)) for t, state in keyframes),
+            key=lambda keyframe: keyframe.time)
+        if not self.keyframes:
+            raise ValueError("A timeline needs at least one keyframe")
+        self._times = [keyframe.time for keyframe in self.keyframes]
+
+    @property
+    def duration(self):
+        return self.keyframes[-1].time
+
+    def state_at(self, t):
+        """Return the set_state arguments in effect at time t"""
+        index = bisect.bisect_right(self._times, t)
+        if index == 0:
+            return dict(self.keyframes[0].state)
+        if index == len(self.keyframes):
+            return dict(self.keyframes[-1].state)
+
+        start = self.keyframes[index - 1]
+        end = self.keyframes[index]
+        fraction = (t - start.time) / (end.time - start.time)
+        return _interpolate_state(start.state, end.state, fraction)
+
+    def next_keyframe_time(self, t):
+        """Return the time of the first keyframe after t, or None"""
+        index = bisect.bisect_right(self._times, t)
+        if index == len(self._times):
+            return None
+        return self._times[index]
+
+
+class Animator:
+    """Play a Timeline on lights with as few set_state calls as possible.
+
+    Each frame sends the state the lights should reach at the next frame,
+    with a matching transition duration, so the bulbs interpolate smoothly
+    on their own. Frames are only sent at keyframes, unless keyframes are
+    closer together than the frame rate allows; that rate is capped by
+    max_fps and by the client's rate limit (budget_share of the quota).
+    Frame times come from the clock, so when a frame is late the animation
+    skips ahead instead of queuing a backlog.
+
+    frames_sent: Integer
+        Number of set_state calls made.
+
+    frames_dropped: Integer
+        Number of keyframes merged into a later frame.
+    """
+    def __init__(self, pifx, timeline, selector='all', max_fps=10.0,
+        budget_share=1.0, clock=time.time, sleep=time.sleep):
+        self.pifx = pifx
+        self.timeline = timeline
+        self.selector = selector
+        self.max_fps = max_fps
+        self.budget_share = budget_share
+
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+        self._clock = clock
+        self._sleep = sleep
+
+    def min_frame_interval(self):
+        """Return the shortest time allowed between two frames"""
+        interval = 1.0 / self.max_fps
+
+        limiter = getattr(self.pifx.client, 'rate_limiter', None)
+        if limiter is not None and limiter.limit:
+            interval = max(interval,
+                limiter.period / (limiter.limit * self.budget_share))
+
+        return interval
+
+    def _send(self, state, duration):
+        self.pifx.set_state(self.selector, duration=duration, **state)
+        self.frames_sent += 1
+
+    def run(self):
+        """Play the timeline, returning once it has finished"""
+        start = self._clock()
+        now = 0.0
+
+        # start from the first keyframe rather than the current state
+        self._send(self.timeline.state_at(0.0), 0.0)
+
+        while now < self.timeline.duration:
+            target = now + self.min_frame_interval()
+            next_keyframe = self.timeline.next_keyframe_time(now)
+            if next_keyframe is not None and next_keyframe > target:
+                target = next_keyframe
+            target = min(target, self.timeline.duration)
+
+            self._send(self.timeline.state_at(target), target - now)
+
+            self._sleep(max(0.0, target - (self._clock() - start)))
+
+            previous = now
+            now = self._clock() - start
+            # keyframes passed without being the target of a frame
+            for keyframe in self.timeline.keyframes:
+                if previous < keyframe.time < now and keyframe.time != target:
+                    self.frames_dropped += 1
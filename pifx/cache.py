@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import time
+from collections import OrderedDict
+
+from pifx import selector as selectors
+
+KEY_SCENES = ('scenes', None)
+
+
+def lights_key(selector):
+    return ('lights', selector)
+
+
+class ResponseCache:
+    """In-memory TTL cache for list_lights and list_scenes responses.
+
+    Entries expire after ttl seconds, and the least recently used entry is
+    evicted once max_entries is reached. A cached `all` lights response also
+    answers narrower selectors (id:, label:, group_id:, ...) locally.
+
+    hits: Integer
+        Number of lookups answered from the cache.
+
+    misses: Integer
+        Number of lookups which required a request.
+    """
+    def __init__(self, ttl=5.0, max_entries=128, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires, value = entry
+        if self._clock() >= expires:
+            del self._entries[key]
+            return None
+
+        # mark as most recently used
+        del self._entries[key]
+        self._entries[key] = entry
+        return value
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        with self._lock:
+            value = self._lookup(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self._clock() + self.ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_lights(self, selector):
+        """Return the cached lights matching selector, or None"""
+        with self._lock:
+            lights = self._lookup(lights_key(selector))
+            if lights is None and selector != selectors.SELECTOR_ALL:
+                all_lights = self._lookup(lights_key(selectors.SELECTOR_ALL))
+                if all_lights is not None:
+                    # nothing matching is a 404 from the API, let it raise
+                    lights = selectors.filter_lights(all_lights, selector) or None
+
+            if lights is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return lights
+
+    def set_lights(self, selector, lights):
+        self.set(lights_key(selector), lights)
+
+    def invalidate_lights(self, selector=selectors.SELECTOR_ALL):
+        """Drop every cached lights response that may include a light
+        matched by selector."""
+        with self._lock:
+            light_keys = [key for key in self._entries if key[0] == 'lights']
+
+            affected_ids = None
+            parsed_selector = selectors.parse_selector(selector)
+            if parsed_selector is not None:
+                for key in light_keys:
+                    lights = self._lookup(key)
+                    if lights is None:
+                        continue
+                    if key[1] == selectors.SELECTOR_ALL or key[1] == selector:
+                        affected_ids = set(
+                            light['id'] for light in lights
+                            if selectors.light_matches(light, parsed_selector))
+                        break
+
+            for key in light_keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if affected_ids is None or any(
+                        light.get('id') in affected_ids for light in entry[1]):
+                    del self._entries[key]
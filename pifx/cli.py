@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""The pifx command.
+
+    pifx daemon &
+    pifx state label:Desk --power on --color red
+    pifx list group:Office
+
+Commands are sent to a running daemon when one listens on the socket, so
+they reuse its warm connections, cache and rate limit state. Otherwise
+they are sent directly. The API key is read from --api-key or the
+LIFX_API_KEY environment variable.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+
+# only the daemon client is imported up front, so that commands sent to a
+# daemon do not pay for importing requests
+from pifx import daemon
+from pifx.exceptions import PIFXError
+
+
+def _state_arguments(parser):
+    parser.add_argument('selector', nargs='?', default='all')
+    parser.add_argument('--power', choices=('on', 'off'))
+    parser.add_argument('--color')
+    parser.add_argument('--brightness', type=float)
+    parser.add_argument('--duration', type=float)
+
+def _effect_arguments(parser):
+    parser.add_argument('color')
+    parser.add_argument('selector', nargs='?', default='all')
+    parser.add_argument('--from-color')
+    parser.add_argument('--period', type=float, default=1.0)
+    parser.add_argument('--cycles', type=float, default=1.0)
+    parser.add_argument('--persist', action='store_true')
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pifx',
+        description='Control LIFX lights.')
+    parser.add_argument('--api-key', default=os.environ.get('LIFX_API_KEY'),
+        help='LIFX API key, defaults to $LIFX_API_KEY')
+    parser.add_argument('--http-endpoint', default=None,
+        help='base URL of the API, defaults to https://api.lifx.com/v1/')
+    parser.add_argument('--socket', default=None,
+        help='daemon socket path, defaults to $PIFX_SOCKET or a per-user path')
+    parser.add_argument('--no-daemon', action='store_true',
+        help='send the command directly even if a daemon is running')
+    commands = parser.add_subparsers(dest='command')
+
+    serve = commands.add_parser('daemon',
+        help='run a daemon answering commands on the socket')
+    serve.add_argument('--cache-ttl', type=float, default=5.0,
+        help='seconds list_lights and list_scenes responses are cached')
+
+    listing = commands.add_parser('list', help='list lights')
+    listing.add_argument('selector', nargs='?', default='all')
+
+    _state_arguments(commands.add_parser('state', help='set the state of lights'))
+
+    toggle = commands.add_parser('toggle', help='toggle the power of lights')
+    toggle.add_argument('selector', nargs='?', default='all')
+    toggle.add_argument('--duration', type=float, default=1.0)
+
+    delta = commands.add_parser('delta', help='change the state of lights')
+    delta.add_argument('selector', nargs='?', default='all')
+    delta.add_argument('--power', choices=('on', 'off'))
+    delta.add_argument('--duration', type=float, default=1.0)
+    for component in ('hue', 'saturation', 'brightness', 'kelvin'):
+        delta.add_argument('--' + component, type=float)
+
+    _effect_arguments(commands.add_parser('breathe', help='breathe effect'))
+    _effect_arguments(commands.add_parser('pulse', help='pulse effect'))
+
+    commands.add_parser('scenes', help='list scenes')
+
+    activate = commands.add_parser('activate', help='activate a scene')
+    activate.add_argument('scene_uuid')
+    activate.add_argument('--duration', type=float, default=1.0)
+
+    return parser
+
+def command_call(args):
+    """Given parsed arguments, return the PIFX method name, args and kwargs"""
+    if args.command == 'list':
+        return 'list_lights', [args.selector], {}
+    if args.command == 'state':
+        return 'set_state', [args.selector], {
+            'power': args.power, 'color': args.color,
+            'brightness': args.brightness, 'duration': args.duration}
+    if args.command == 'toggle':
+        return 'toggle_power', [args.selector], {'duration': args.duration}
+    if args.command == 'delta':
+        return 'state_delta', [args.selector], dict(
+            (name, getattr(args, name)) for name in (
+                'power', 'duration', 'hue', 'saturation', 'brightness', 'kelvin'))
+    if args.command in ('breathe', 'pulse'):
+        return args.command + '_lights', [args.color, args.selector], {
+            'from_color': args.from_color, 'period': args.period,
+            'cycles': args.cycles, 'persist': args.persist}
+    if args.command == 'scenes':
+        return 'list_scenes', [], {}
+    if args.command == 'activate':
+        return 'activate_scene', [args.scene_uuid], {'duration': args.duration}
+    raise ValueError("Unknown command: {}".format(args.command))
+
+def _make_pifx(args, **kwargs):
+    from pifx.core import PIFX
+
+    if not args.api_key:
+        raise SystemExit("pifx: an API key is required, set --api-key or LIFX_API_KEY")
+    return PIFX(args.api_key, http_endpoint=args.http_endpoint, **kwargs)
+
+def run(args):
+    """Run a parsed command, return its result"""
+    if args.command == 'daemon':
+        from pifx.cache import ResponseCache
+
+        p = _make_pifx(args, cache=ResponseCache(ttl=args.cache_ttl))
+        daemon.PIFXDaemon(p, args.socket).serve_forever()
+        return None
+
+    method, call_args, call_kwargs = command_call(args)
+
+    if not args.no_daemon:
+        try:
+            return daemon.DaemonClient(args.socket).call(
+                method, *call_args, **call_kwargs)
+        except daemon.DaemonUnavailable:
+            pass
+
+    return getattr(_make_pifx(args), method)(*call_args, **call_kwargs)
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        build_parser().print_help()
+        return 2
+
+    try:
+        result = run(args)
+    except PIFXError as e:
+        print('pifx: {}'.format(e), file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+
+    if result is not None:
+        print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
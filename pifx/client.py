@@ -1,10 +1,27 @@
+import logging
+import time
+
 import requests
 
-from pifx import util
+from pifx import ratelimit, util
+from pifx.exceptions import DeadlineExceeded
+
+# bytes read at a time from streamed responses
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_logger = logging.getLogger(__name__)
+
+# hook events, see LIFXWebAPIClient.add_hook
+HOOK_BEFORE_REQUEST = 'before_request'
+HOOK_AFTER_RESPONSE = 'after_response'
+HOOK_ON_ERROR = 'on_error'
+HOOK_ON_RETRY = 'on_retry'
+HOOKS = (HOOK_BEFORE_REQUEST, HOOK_AFTER_RESPONSE, HOOK_ON_ERROR, HOOK_ON_RETRY)
 
 
 class LIFXWebAPIClient:
-    def __init__(self, api_key, http_endpoint=None):
+    def __init__(self, api_key, http_endpoint=None, rate_limit=True,
+        retry_policy=None, pool_size=None):
         if http_endpoint == None:
             self.http_base = "https://api.lifx.com/v1/"
         else:
@@ -14,9 +31,113 @@ class LIFXWebAPIClient:
         self.headers = util.generate_auth_header(self.api_key)
         self._s = requests.Session()
 
+        # size the connection pool for concurrent use from several threads
+        if pool_size is not None:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size)
+            self._s.mount('https://', adapter)
+            self._s.mount('http://', adapter)
+
+        # requests made with the same API key share one rate limit budget
+        self.rate_limiter = None
+        if rate_limit:
+            self.rate_limiter = ratelimit.limiter_for_key(api_key)
+
+        # transient failures are raised immediately unless a RetryPolicy is set
+        self.retry_policy = retry_policy
+
+        self._hooks = dict((event, []) for event in HOOKS)
+
+    @property
+    def budget(self):
+        """Requests that can be sent now without waiting (None if unknown)"""
+        if self.rate_limiter is None:
+            return None
+        return self.rate_limiter.budget
+
+    @property
+    def queue_depth(self):
+        """Number of requests waiting for rate limit budget"""
+        if self.rate_limiter is None:
+            return 0
+        return self.rate_limiter.queue_depth
+
+    def add_hook(self, event, callback):
+        """Call callback at a point of every request's life cycle.
+
+        Every callback receives the request, a dict with the method, the
+        endpoint template, the full url, whether the response is streamed
+        and the attempt number.
+
+        event: required String
+            One of:
+            'before_request': callback(request), before each attempt
+            'after_response': callback(request, response, elapsed), after
+                each attempt which received a response, with the
+                requests.Response and the seconds from sending the request
+                to the response, not counting time waiting for rate limit
+                budget
+            'on_retry': callback(request, attempt, delay), when a failed
+                attempt will be retried after delay seconds
+            'on_error': callback(request, error), when the request fails
+                with the exception error
+
+        Hooks only observe requests: an exception raised by a callback is
+        logged and does not affect the request or the other callbacks.
+        """
+        if event not in self._hooks:
+            raise ValueError("Unknown hook event: {}".format(event))
+        self._hooks[event].append(callback)
+
+    def remove_hook(self, event, callback):
+        """Stop calling a callback added with add_hook"""
+        self._hooks[event].remove(callback)
+
+    def _run_hooks(self, event, *args):
+        for callback in self._hooks[event]:
+            try:
+                callback(*args)
+            except Exception:
+                _logger.exception("Error in %s hook %r", event, callback)
+
     def _full_http_endpoint(self, suffix):
         return self.http_base + suffix
 
+    def _should_retry(self, method, attempt, status_code, retry):
+        if self.retry_policy is None:
+            return False
+        return self.retry_policy.should_retry(method, attempt, status_code, retry)
+
+    def _send(self, method, http_endpoint, data, json_body, stream=False,
+        priority=0, deadline=None):
+        """Send a request once rate limit budget allows, return the response
+        and the seconds from sending it to receiving the response."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(priority, deadline)
+
+        start = time.time()
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - start
+            if timeout <= 0:
+                raise DeadlineExceeded("Deadline passed before sending")
+
+        if json_body:
+            res = self._s.request(
+                method=method, url=http_endpoint, json=data,
+                headers=self.headers, stream=stream, timeout=timeout)
+        else:
+            res = self._s.request(
+                method=method, url=http_endpoint, data=data,
+                headers=self.headers, stream=stream, timeout=timeout)
+
+        elapsed = time.time() - start
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.update(res.headers)
+
+        return res, elapsed
+
     def perform_request(
         self,
         method,
@@ -24,8 +145,21 @@ class LIFXWebAPIClient:
         endpoint_args=[],
         argument_tuples=None,
         json_body=False,
-        parse_data=True
+        parse_data=True,
+        retry=None,
+        stream=False,
+        priority=0,
+        deadline=None
     ):
+        """Send a request to the API, return its parsed response.
+
+        With stream=True, the response must be a JSON array, and a generator
+        yielding its items while the body is downloaded is returned instead.
+
+        Requests waiting for rate limit budget are sent by decreasing
+        priority. A request which cannot be sent before deadline (a Unix
+        time) raises DeadlineExceeded, and is not retried past it.
+        """
         http_endpoint = self._full_http_endpoint(
             endpoint.format(*endpoint_args)
         )
@@ -34,16 +168,53 @@ class LIFXWebAPIClient:
         if argument_tuples is not None:
             data = util.arg_tup_to_dict(argument_tuples)
 
-        if json_body:
-            res = self._s.request(
-                method=method, url=http_endpoint, json=data, headers=self.headers)
-        else:
-            res = self._s.request(
-                method=method, url=http_endpoint, data=data, headers=self.headers)
+        request = {
+            'method': method,
+            'endpoint': endpoint,
+            'url': http_endpoint,
+            'stream': stream,
+            'attempt': 1,
+        }
 
-        parsed_response = util.parse_response(res)
+        attempt = 1
+        while True:
+            request['attempt'] = attempt
+            self._run_hooks(HOOK_BEFORE_REQUEST, request)
+            try:
+                res, elapsed = self._send(method, http_endpoint, data,
+                    json_body, stream, priority or 0, deadline)
+            except DeadlineExceeded as e:
+                self._run_hooks(HOOK_ON_ERROR, request, e)
+                raise
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not self._should_retry(method, attempt, None, retry):
+                    self._run_hooks(HOOK_ON_ERROR, request, e)
+                    raise
+                delay = self.retry_policy.backoff(attempt)
+                if deadline is not None and time.time() + delay > deadline:
+                    self._run_hooks(HOOK_ON_ERROR, request, e)
+                    raise
+            else:
+                self._run_hooks(HOOK_AFTER_RESPONSE, request, res, elapsed)
+                if not self._should_retry(method, attempt, res.status_code, retry):
+                    break
+                delay = self.retry_policy.backoff(attempt, res.headers, res.status_code)
+                if deadline is not None and time.time() + delay > deadline:
+                    break
+            self._run_hooks(HOOK_ON_RETRY, request, attempt, delay)
+            self.retry_policy.sleep(delay)
+            attempt += 1
+
+        try:
+            util.handle_error(res)
+        except Exception as e:
+            self._run_hooks(HOOK_ON_ERROR, request, e)
+            raise
 
-        util.handle_error(res)
+        if stream:
+            return util.iter_json_array(res.iter_content(STREAM_CHUNK_SIZE))
+
+        parsed_response = util.parse_response(res)
 
         if parse_data:
             return util.parse_data(parsed_response)
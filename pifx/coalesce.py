@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+from collections import OrderedDict
+
+KIND_STATE = 'state'
+KIND_DELTA = 'delta'
+
+# (method, endpoint) => kind of write that can be merged
+COALESCED_ENDPOINTS = {
+    ('put', 'lights/{}/state'): KIND_STATE,
+    ('post', 'lights/{}/state/delta'): KIND_DELTA,
+}
+
+# state_delta arguments which are added together when merged
+DELTA_FIELDS = ('hue', 'saturation', 'brightness', 'kelvin')
+
+
+class _PendingWrite:
+    def __init__(self, kind, request_kwargs):
+        self.kind = kind
+        self.request_kwargs = request_kwargs
+        self.arguments = OrderedDict()
+
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def accepts(self, kind, request_kwargs):
+        """Return whether a write can be merged into this one"""
+        return kind == self.kind and all(
+            request_kwargs.get(name) == self.request_kwargs.get(name)
+            for name in ('priority', 'deadline'))
+
+    def merge(self, argument_tuples):
+        for arg_name, arg_val in argument_tuples or []:
+            if arg_val is None:
+                continue
+            if (self.kind == KIND_DELTA and arg_name in DELTA_FIELDS
+                    and arg_name in self.arguments):
+                self.arguments[arg_name] += arg_val
+            else:
+                self.arguments[arg_name] = arg_val
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class Coalescer:
+    """Merge concurrent writes to the same selector into one request.
+
+    set_state and state_delta requests are held for window seconds. Further
+    writes of the same kind, priority and deadline to the same selector
+    during that time are merged into the held request: set_state arguments
+    are last-writer-wins, while state_delta hue, saturation, brightness and
+    kelvin changes are summed.
+    Every merged caller receives the result of the single request sent.
+    Other requests are passed straight through to the wrapped client,
+    other writes only after the held writes are sent.
+
+    coalesced: Integer
+        Number of requests saved by merging.
+    """
+    def __init__(self, client, window=0.05):
+        self.client = client
+        self.window = window
+        self.coalesced = 0
+
+        self._pending = dict()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # expose the wrapped client's attributes (budget, queue_depth, ...)
+        if name == 'client':
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def perform_request(self, method, endpoint, endpoint_args=[],
+        argument_tuples=None, **kwargs):
+        kind = COALESCED_ENDPOINTS.get((method.lower(), endpoint))
+        if kind is None:
+            if method.lower() != 'get':
+                # held writes may target the same lights, keep them in order
+                self.flush()
+            return self.client.perform_request(
+                method=method, endpoint=endpoint, endpoint_args=endpoint_args,
+                argument_tuples=argument_tuples, **kwargs)
+
+        selector = endpoint_args[0]
+        superseded = None
+
+        with self._lock:
+            pending = self._pending.get(selector)
+            if pending is not None and not pending.accepts(kind, kwargs):
+                # writes of another kind, priority or deadline cannot be
+                # merged, send them first
+                superseded = self._pending.pop(selector)
+                pending = None
+
+            if pending is None:
+                request_kwargs = dict(kwargs, method=method, endpoint=endpoint,
+                    endpoint_args=endpoint_args)
+                pending = self._pending[selector] = _PendingWrite(
+                    kind, request_kwargs)
+                timer = threading.Timer(
+                    self.window, self._flush, [selector, pending])
+                timer.daemon = True
+                timer.start()
+            else:
+                self.coalesced += 1
+
+            pending.merge(argument_tuples)
+
+        if superseded is not None:
+            self._send(superseded)
+
+        return pending.wait()
+
+    def flush(self):
+        """Send every held write immediately"""
+        with self._lock:
+            pending_writes = list(self._pending.values())
+            self._pending.clear()
+
+        for pending in pending_writes:
+            self._send(pending)
+
+    def _flush(self, selector, pending):
+        with self._lock:
+            if self._pending.get(selector) is not pending:
+                # already sent by flush() or a write of another kind
+                return
+            del self._pending[selector]
+
+        self._send(pending)
+
+    def _send(self, pending):
+        try:
+            pending.result = self.client.perform_request(
+                argument_tuples=list(pending.arguments.items()),
+                **pending.request_kwargs)
+        except Exception as e:
+            pending.error = e
+        finally:
+            pending.done.set()
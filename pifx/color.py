@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Parsing, validation and conversion of LIFX color strings.
+
+Every color syntax accepted by the API (names, #hex, rgb:, hue:,
+saturation:, brightness: and kelvin:, alone or combined) parses to an
+HSBK tuple, where components the string does not set are None.
+See http://api.developer.lifx.com/v1/docs/colors
+"""
+
+import colorsys
+import math
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from pifx.exceptions import InvalidParameters
+
+KELVIN_MIN = 1500
+KELVIN_MAX = 9000
+KELVIN_DEFAULT = 3500
+
+# number of parsed color strings remembered
+CACHE_SIZE = 1024
+
+HSBK = namedtuple('HSBK', 'hue saturation brightness kelvin')
+
+# color name => components it sets
+NAMED_COLORS = {
+    'white': {'saturation': 0.0},
+    'red': {'hue': 0.0, 'saturation': 1.0},
+    'orange': {'hue': 36.0, 'saturation': 1.0},
+    'yellow': {'hue': 60.0, 'saturation': 1.0},
+    'cyan': {'hue': 180.0, 'saturation': 1.0},
+    'green': {'hue': 120.0, 'saturation': 1.0},
+    'blue': {'hue': 250.0, 'saturation': 1.0},
+    'purple': {'hue': 280.0, 'saturation': 1.0},
+    'pink': {'hue': 325.0, 'saturation': 1.0},
+}
+
+_HEX_REGEX = re.compile(r'^#?([0-9a-fA-F]{6})$')
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class InvalidColor(InvalidParameters):
+    """Raised for color strings the API would reject"""
+
+
+def _parse_number(name, value, minimum, maximum):
+    try:
+        number = float(value)
+    except ValueError:
+        raise InvalidColor("Invalid {} in color: {}".format(name, value))
+
+    if not minimum <= number <= maximum:
+        raise InvalidColor("{} must be between {} and {}: {}".format(
+            name, minimum, maximum, value))
+
+    return number
+
+def rgb_to_components(red, green, blue):
+    """Given 0-255 RGB values, return hue, saturation and brightness"""
+    hue, saturation, brightness = colorsys.rgb_to_hsv(
+        red / 255.0, green / 255.0, blue / 255.0)
+    return {
+        'hue': hue * 360.0,
+        'saturation': saturation,
+        'brightness': brightness,
+    }
+
+def rgb_to_hsbk(red, green, blue, kelvin=KELVIN_DEFAULT):
+    """Given 0-255 RGB values, return an HSBK tuple"""
+    components = rgb_to_components(red, green, blue)
+    return HSBK(components['hue'], components['saturation'],
+        components['brightness'], kelvin)
+
+def kelvin_to_rgb(kelvin):
+    """Approximate the 0-255 RGB values of white light at a color
+    temperature (Tanner Helland's fit of the blackbody curve)."""
+    temperature = kelvin / 100.0
+
+    if temperature <= 66:
+        red = 255.0
+        green = 99.4708025861 * math.log(temperature) - 161.1195681661
+    else:
+        red = 329.698727446 * ((temperature - 60) ** -0.1332047592)
+        green = 288.1221695283 * ((temperature - 60) ** -0.0755148492)
+
+    if temperature >= 66:
+        blue = 255.0
+    elif temperature <= 19:
+        blue = 0.0
+    else:
+        blue = 138.5177312231 * math.log(temperature - 10) - 305.0447927307
+
+    return tuple(max(0.0, min(255.0, channel)) for channel in (red, green, blue))
+
+def hsbk_to_rgb(hue, saturation, brightness, kelvin=KELVIN_DEFAULT):
+    """Given an HSBK color, return approximate 0-255 RGB values. The white
+    point of unsaturated colors follows the kelvin temperature."""
+    red, green, blue = colorsys.hsv_to_rgb((hue % 360) / 360.0, saturation, 1.0)
+    white = [channel / 255.0 for channel in kelvin_to_rgb(kelvin)]
+
+    return tuple(
+        int(round(255 * brightness * (
+            saturation * channel + (1 - saturation) * white_channel)))
+        for channel, white_channel in zip((red, green, blue), white)
+    )
+
+def _parse(color):
+    components = dict()
+
+    for token in color.strip().lower().split():
+        if token in NAMED_COLORS:
+            components.update(NAMED_COLORS[token])
+            continue
+
+        hex_match = _HEX_REGEX.match(token)
+        if hex_match:
+            hex_value = hex_match.group(1)
+            components.update(rgb_to_components(
+                int(hex_value[0:2], 16),
+                int(hex_value[2:4], 16),
+                int(hex_value[4:6], 16)))
+            continue
+
+        if ':' not in token:
+            raise InvalidColor("Unknown color: {}".format(token))
+
+        name, value = token.split(':', 1)
+        if name == 'rgb':
+            channels = value.split(',')
+            if len(channels) != 3:
+                raise InvalidColor("Invalid rgb color: {}".format(token))
+            components.update(rgb_to_components(*[
+                _parse_number('rgb', channel, 0, 255) for channel in channels
+            ]))
+        elif name == 'hue':
+            components['hue'] = _parse_number(name, value, 0, 360)
+        elif name in ('saturation', 'brightness'):
+            components[name] = _parse_number(name, value, 0, 1)
+        elif name == 'kelvin':
+            components['kelvin'] = _parse_number(
+                name, value, KELVIN_MIN, KELVIN_MAX)
+            # a color temperature alone means white light
+            components.setdefault('saturation', 0.0)
+        else:
+            raise InvalidColor("Unknown color attribute: {}".format(token))
+
+    if not components:
+        raise InvalidColor("Empty color")
+
+    return HSBK(components.get('hue'), components.get('saturation'),
+        components.get('brightness'), components.get('kelvin'))
+
+def parse_hsbk(color):
+    """Given a LIFX color string, return an HSBK tuple of the components it
+    sets (None for the others). Results are cached. Raise InvalidColor if
+    the color string is malformed."""
+    with _cache_lock:
+        hsbk = _cache.get(color)
+        if hsbk is not None:
+            return hsbk
+
+    hsbk = _parse(color)
+
+    with _cache_lock:
+        _cache[color] = hsbk
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return hsbk
+
+def parse_color(color):
+    """Given a LIFX color string, return a dict of the components it sets,
+    among hue (degrees), saturation (0-1), brightness (0-1) and kelvin.
+    Raise InvalidColor if the color string is malformed."""
+    return dict((name, value) for name, value
+                in parse_hsbk(color)._asdict().items() if value is not None)
+
+def validate_color(color):
+    """Raise InvalidColor if color is not a valid LIFX color string"""
+    if color is not None:
+        parse_hsbk(color)
+
+def _format_number(value):
+    return '{:.4f}'.format(value).rstrip('0').rstrip('.')
+
+def normalize_color(color):
+    """Return the canonical form of a color string, so that equivalent
+    colors (e.g "red" and "saturation:1 hue:0") compare equal."""
+    hsbk = parse_hsbk(color)
+    return ' '.join(
+        '{}:{}'.format(name, _format_number(value))
+        for name, value in hsbk._asdict().items() if value is not None)
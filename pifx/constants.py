@@ -34,3 +34,39 @@ A_ERROR_HTTP_CODES = {
     503: "API currently unavailable",
     523: "API currently unavailable"
 }
+
+# see https://api.developer.lifx.com/docs/set-states
+A_MAX_STATES_PER_REQUEST = 50
+
+# length in seconds of the API's rate limit window
+# see http://api.developer.lifx.com/v1/docs/rate-limits
+A_RATE_LIMIT_PERIOD = 60.0
+
+# rate limit response headers
+A_HEADER_RATE_LIMIT = 'X-RateLimit-Limit'
+A_HEADER_RATE_LIMIT_REMAINING = 'X-RateLimit-Remaining'
+A_HEADER_RATE_LIMIT_RESET = 'X-RateLimit-Reset'
+
+# transient failures, which may succeed if the request is sent again
+A_RETRY_HTTP_CODES = [
+    429,
+    500,
+    502,
+    503,
+    523
+]
+
+# methods which can safely be sent more than once
+A_IDEMPOTENT_HTTP_METHODS = [
+    'get',
+    'head',
+    'put',
+    'delete',
+    'options'
+]
+
+# per-light statuses in the results of writes
+# see http://api.developer.lifx.com/v1/docs/set-state
+A_RESULT_OK = 'ok'
+A_RESULT_TIMED_OUT = 'timed_out'
+A_RESULT_OFFLINE = 'offline'
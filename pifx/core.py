@@ -15,25 +15,430 @@
 # limitations under the License.
 #
 
+import concurrent.futures
+import threading
+import time
+import weakref
+
+from pifx.cache import KEY_SCENES
 from pifx.client import LIFXWebAPIClient
+from pifx.coalesce import Coalescer
+from pifx.color import validate_color
+from pifx.exceptions import DeadlineExceeded, PartialFailure
+from pifx.inventory import LightIndex
+from pifx.store import StateStore
+from pifx.watch import Watcher
+from pifx import models, scenes, util
+from pifx import selector as selectors
 
 
-class PIFX:
-    """Main PIFX class"""
-    def __init__(self, api_key, http_endpoint=None):
-        self.client = LIFXWebAPIClient(api_key, http_endpoint)
+def _is_queued(results):
+    """Return whether a write returned a handle to its future results, as
+    an Outbox does, rather than the results."""
+    return hasattr(results, 'add_done_callback')
+
 
-    def list_lights(self, selector='all'):
+class PIFX:
+    """Main PIFX class
+
+    cache: ResponseCache
+        Optional cache for list_lights and list_scenes responses, which is
+        invalidated by calls changing the state of lights.
+        See pifx.cache.ResponseCache
+
+    client: Object
+        Optional client to send requests with, instead of a
+        LIFXWebAPIClient created from the other arguments,
+        e.g pifx.lan.LIFXLANClient to control lights over the LAN, or
+        pifx.outbox.Outbox to queue writes, which then return handles.
+
+    coalesce_window: Double
+        If set, hold set_state and state_delta calls for this many seconds
+        and merge concurrent calls for the same selector into one request.
+        See pifx.coalesce.Coalescer
+
+    max_workers: Integer
+        Number of threads used by submit and map, and size of the HTTP
+        connection pool shared by them.
+        default: 10
+
+    models: Boolean
+        If true, return lights, scenes and write results as the slotted
+        classes in pifx.models instead of dicts.
+        default: false
+
+    keep_raw: Boolean
+        If true, keep the response dict of each model as its raw attribute.
+        default: false
+
+    reissue_policy: ReissuePolicy
+        If set, writes which some lights timed out on are sent again to
+        those lights only, using id: selectors.
+        See pifx.retry.ReissuePolicy
+
+    raise_partial_failures: Boolean
+        If true, writes which some lights did not apply (timed out or
+        offline) raise pifx.exceptions.PartialFailure, carrying the
+        per-light results, instead of returning them.
+        default: false
+
+    state_store: Boolean
+        If true, keep a local copy of the state of lights, predicted after
+        each write, so get_state can answer without a request.
+        See pifx.store.StateStore
+        default: false
+
+    validate_colors: Boolean
+        If true, check color strings locally and raise
+        pifx.color.InvalidColor instead of sending malformed colors.
+        default: false
+
+    Besides their own arguments, every API method also accepts two
+    optional arguments:
+
+    priority: Integer
+        Requests with a higher priority are sent first when several wait
+        for rate limit budget.
+        default: 0
+
+    deadline: Double
+        Seconds after which the request is pointless. Requests which
+        cannot be sent in time raise pifx.exceptions.DeadlineExceeded
+        instead of being sent late.
+    """
+    def __init__(self, api_key=None, http_endpoint=None, rate_limit=True,
+        retry_policy=None, cache=None, client=None, coalesce_window=None,
+        max_workers=10, models=False, keep_raw=False, state_store=False,
+        validate_colors=False, reissue_policy=None, raise_partial_failures=False):
+        if client is None:
+            client = LIFXWebAPIClient(
+                api_key, http_endpoint, rate_limit=rate_limit,
+                retry_policy=retry_policy, pool_size=max_workers)
+
+        if coalesce_window is not None:
+            client = Coalescer(client, window=coalesce_window)
+
+        self.client = client
+        self.cache = cache
+        self.models = models
+        self.keep_raw = keep_raw
+        self.store = StateStore() if state_store else None
+        self.validate_colors = validate_colors
+        self.reissue_policy = reissue_policy
+        self.raise_partial_failures = raise_partial_failures
+
+        # set by build_index, used to reject selectors matching no lights
+        self.index = None
+
+        # watchers poll faster after writes
+        self._watchers = weakref.WeakSet()
+
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _request_options(self, priority, deadline):
+        """Return the perform_request arguments for a call's priority and
+        deadline, the latter as an absolute time."""
+        options = dict()
+        if priority is not None:
+            options['priority'] = priority
+        if deadline is not None:
+            options['deadline'] = time.time() + deadline
+        return options
+
+    def _check_colors(self, *colors):
+        if self.validate_colors:
+            for color in colors:
+                validate_color(color)
+
+    def _check_state_colors(self, states):
+        for state in states:
+            if state:
+                self._check_colors(state.get('color'), state.get('from_color'))
+
+    def _write(self, affected_selectors, finish=True, **request_kwargs):
+        """Perform a request changing the state of the lights matched by
+        affected_selectors, and invalidate cached responses about them.
+        With finish=False, the raw results are returned for the caller to
+        pass to _finish_write once its other requests were sent."""
+        self._validate_selectors(affected_selectors)
+
+        results = self.client.perform_request(**request_kwargs)
+        if self.reissue_policy is not None and not _is_queued(results):
+            results = self._reissue_failed(request_kwargs, results)
+
+        return self._after_write(affected_selectors, request_kwargs, results, finish)
+
+    def _validate_selectors(self, affected_selectors):
+        if self.index is not None:
+            for selector in affected_selectors:
+                self.index.validate(selector)
+
+    def _after_write(self, affected_selectors, request_kwargs, results, finish):
+        """Update the cache, state store and watchers after a write, return
+        its results as _write does."""
+        # queued by an Outbox, the results are not known yet
+        queued = _is_queued(results)
+
+        if self.cache is not None:
+            self._invalidate_lights(affected_selectors)
+            if queued:
+                # lights may be listed and cached again before it is sent
+                results.add_done_callback(
+                    lambda handle: self._invalidate_lights(affected_selectors))
+
+        if self.store is not None:
+            self.store.apply_write(
+                request_kwargs['endpoint'], affected_selectors[0],
+                util.arg_tup_to_dict(request_kwargs.get('argument_tuples') or []),
+                None if queued else results)
+
+        for watcher in list(self._watchers):
+            watcher.notify_write()
+
+        if queued or not finish:
+            return results
+
+        return self._finish_write(results)
+
+    def _invalidate_lights(self, affected_selectors):
+        for selector in affected_selectors:
+            self.cache.invalidate_lights(selector)
+
+    def _finish_write(self, results):
+        """Raise PartialFailure if enabled and some lights failed, return
+        the results of a write as models if enabled."""
+        if self.raise_partial_failures:
+            failed = util.failed_results(results)
+            if failed:
+                raise PartialFailure("{} of {} lights failed".format(
+                    len(failed), len(list(util.iter_results(results)))),
+                    results=results)
+
+        if self.models:
+            return models.parse_results(results, self.keep_raw)
+
+        return results
+
+    def _reissue_request(self, request_kwargs, results):
+        """Return the request_kwargs re-issuing a write to its failed
+        lights, or None if no light needs another attempt. For set_states,
+        also return the index of the operation each new operation retries."""
+        failed_ids = self.reissue_policy.failed_ids
+
+        if request_kwargs['endpoint'] == 'lights/states':
+            arguments = dict(request_kwargs['argument_tuples'])
+            states = []
+            origins = []
+            for index, (state, result) in enumerate(
+                    zip(arguments['states'], results)):
+                ids = failed_ids(result.get('results'))
+                if ids:
+                    state = dict(state)
+                    state['selector'] = selectors.id_selector(ids)
+                    states.append(state)
+                    origins.append(index)
+            if not states:
+                return None, None
+            argument_tuples = [('states', states),
+                ('defaults', arguments.get('defaults'))]
+            return dict(request_kwargs, argument_tuples=argument_tuples), origins
+
+        ids = failed_ids(results)
+        if not ids:
+            return None, None
+        return dict(request_kwargs,
+            endpoint_args=[selectors.id_selector(ids)]), None
+
+    def _merge_results(self, results, new_results):
+        """Replace per-light results with those of a later attempt"""
+        by_id = dict((result.get('id'), result) for result in new_results)
+        return [by_id.get(result.get('id'), result) for result in results]
+
+    def _reissue_failed(self, request_kwargs, results):
+        """Send a write again to the lights it failed on, as allowed by
+        the reissue policy, return the merged results."""
+        policy = self.reissue_policy
+        attempt = 1
+        while policy.should_reissue(request_kwargs['endpoint'], attempt):
+            reissue_kwargs, origins = self._reissue_request(request_kwargs, results)
+            if reissue_kwargs is None:
+                break
+
+            if policy.delay:
+                policy.sleep(policy.delay)
+            try:
+                new_results = self.client.perform_request(**reissue_kwargs)
+            except DeadlineExceeded:
+                # keep the results of the attempts made in time
+                break
+
+            results = self._merge_reissued(results, origins, new_results)
+            attempt += 1
+
+        return results
+
+    def _merge_reissued(self, results, origins, new_results):
+        """Merge the results of a re-issued write into the previous ones"""
+        if origins is None:
+            return self._merge_results(results, new_results)
+
+        results = list(results)
+        for index, new_result in zip(origins, new_results):
+            results[index] = dict(results[index], results=self._merge_results(
+                results[index].get('results') or [],
+                new_result.get('results') or []))
+        return results
+
+    def _fetch_lights(self, selector, refresh=False, **options):
+        """Return the list_lights response dicts for selector. With
+        refresh=True, bypass the cache but still update it."""
+        lights = None
+        if self.cache is not None and not refresh:
+            lights = self.cache.get_lights(selector)
+
+        if lights is None:
+            lights = self.client.perform_request(
+                method='get', endpoint='lights/{}',
+                endpoint_args=[selector], parse_data=False, **options)
+            self._remember_lights(selector, lights)
+
+        return lights
+
+    def _remember_lights(self, selector, lights):
+        """Update the cache and state store with a list_lights response"""
+        if self.cache is not None:
+            self.cache.set_lights(selector, lights)
+
+        if self.store is not None:
+            self.store.reconcile(lights, selector)
+
+    def list_lights(self, selector='all', priority=None, deadline=None):
         """Given a selector (defaults to all), return a list of lights.
         Without a selector provided, return list of all lights.
         """
 
-        return self.client.perform_request(
+        lights = self._fetch_lights(
+            selector, **self._request_options(priority, deadline))
+
+        if self.models:
+            return models.parse_lights(lights, self.keep_raw)
+
+        return lights
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers)
+            return self._executor
+
+    def submit(self, method, *args, **kwargs):
+        """Run a PIFX method on the thread pool, return a Future.
+
+        method: required String
+            Name of the PIFX method to call, e.g "set_state".
+            Further arguments are passed to the method.
+        """
+
+        return self._get_executor().submit(getattr(self, method), *args, **kwargs)
+
+    def map(self, calls):
+        """Run many PIFX method calls concurrently on the thread pool.
+        Returns their results in input order. A call which raised has
+        the exception in place of its result, and does not stop the others.
+
+        calls: required List of Tuples
+            (method name, kwargs dict) pairs,
+            e.g [("set_state", {"selector": "label:Desk", "power": "on"})]
+        """
+
+        futures = [self.submit(method, **kwargs) for method, kwargs in calls]
+        concurrent.futures.wait(futures)
+
+        results = []
+        for future in futures:
+            error = future.exception()
+            results.append(error if error is not None else future.result())
+
+        return results
+
+    def shutdown(self, wait=True):
+        """Stop the thread pool used by submit and map"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+    def get_state(self, selector='all', priority=None, deadline=None):
+        """Given a selector (defaults to all), return the lights it matches
+        as list_lights does, but answered from the local state store when
+        their state is known. Requires state_store=True.
+        """
+
+        lights = None
+        if self.store is not None:
+            lights = self.store.get(selector)
+
+        if lights is None:
+            lights = self._fetch_lights(selector, refresh=True,
+                **self._request_options(priority, deadline))
+
+        if self.models:
+            return models.parse_lights(lights, self.keep_raw)
+
+        return lights
+
+    def iter_lights(self, selector='all', priority=None, deadline=None):
+        """Given a selector (defaults to all), return a generator yielding
+        lights one at a time while the response is downloaded and parsed.
+        Uses less memory than list_lights for accounts with many lights.
+        """
+
+        lights = self.client.perform_request(
             method='get', endpoint='lights/{}',
-            endpoint_args=[selector], parse_data=False)
+            endpoint_args=[selector], parse_data=False, stream=True,
+            **self._request_options(priority, deadline))
+
+        if self.models:
+            return models.iter_models(models.Light, lights, self.keep_raw)
+
+        return iter(lights)
+
+    def watch(self, selector='all', interval=5.0, max_interval=None):
+        """Return a Watcher polling the lights matched by selector.
+        Iterate over it to receive change events (power, color, brightness,
+        connected), or subscribe callbacks and start it in the background.
+        See pifx.watch.Watcher
+
+        interval: Double
+            Seconds between polls while lights are changing.
+            default: 5.0
+
+        max_interval: Double
+            Longest time between polls while nothing changes.
+            default: 8 times interval
+        """
+
+        watcher = Watcher(self, selector, interval, max_interval)
+        self._watchers.add(watcher)
+        return watcher
+
+    def build_index(self, selector='all', priority=None, deadline=None):
+        """Build a LightIndex from list_lights, and use it to reject
+        selectors which do not match any lights before sending requests.
+        Returns the index. Call again to refresh it when lights change.
+        See pifx.inventory.LightIndex
+        """
+
+        self.index = LightIndex(self._fetch_lights(
+            selector, **self._request_options(priority, deadline)))
+        return self.index
 
     def set_state(self, selector='all',
-        power=None, color=None, brightness=None, duration=None):
+        power=None, color=None, brightness=None, duration=None,
+        priority=None, deadline=None):
         """Given a selector (defaults to all), set the state of a light.
         Selector can be based on id, scene_id, group_id, label, etc.
         Returns list of lightbulb statuses if successful.
@@ -61,6 +466,8 @@ class PIFX:
             3155760000.0 (100 years).
         """
 
+        self._check_colors(color)
+
         argument_tuples = [
             ('power', power),
             ('color', color),
@@ -68,13 +475,55 @@ class PIFX:
             ('duration', duration)
         ]
 
-        return self.client.perform_request(
-            method='put', endpoint='lights/{}/state',
-            endpoint_args=[selector], argument_tuples=argument_tuples)
+        return self._write(
+            [selector], method='put', endpoint='lights/{}/state',
+            endpoint_args=[selector], argument_tuples=argument_tuples,
+            **self._request_options(priority, deadline))
+
+    def set_states(self, operations, defaults=None, priority=None, deadline=None):
+        """Set the state of many selectors using the bulk states endpoint.
+        Operations are split into as few requests as the API allows, and
+        the per-operation results of every request are returned as one list.
+        See https://api.developer.lifx.com/docs/set-states
+
+        operations: required List of Dicts
+            Each entry must contain a selector, plus any arguments named
+            as per set_state, e.g {"selector": "label:Desk", "power": "on"}
+
+        defaults: Dict
+            Default values to use when not specified in each operation.
+            Argument names as per set_state.
+        """
+
+        self._check_state_colors(list(operations) + [defaults])
+        # the deadline applies to every request
+        options = self._request_options(priority, deadline)
+
+        affected_selectors = [operation['selector'] for operation in operations]
+
+        results = []
+        handles = []
+        for argument_tuples in util.states_argument_tuples(operations, defaults):
+            chunk_results = self._write(
+                affected_selectors, finish=False, method='put',
+                endpoint='lights/states', argument_tuples=argument_tuples,
+                json_body=True, **options)
+            if _is_queued(chunk_results):
+                # one handle per request sent by an Outbox
+                handles.append(chunk_results)
+            else:
+                results.extend(chunk_results)
+
+        if handles:
+            return handles
+
+        # every request is sent before failures of earlier ones are raised
+        return self._finish_write(results)
 
     def state_delta(self, selector='all',
         power=None, duration=1.0, infrared=None, hue=None,
-        saturation=None, brightness=None, kelvin=None):
+        saturation=None, brightness=None, kelvin=None,
+        priority=None, deadline=None):
         """Given a state delta, apply the modifications to lights' state
         over a given period of time.
 
@@ -117,24 +566,27 @@ class PIFX:
             ("kelvin", kelvin)
         ]
 
-        return self.client.perform_request(
-            method='post', endpoint='lights/{}/state/delta',
-            endpoint_args=[selector], argument_tuples=argument_tuples)
+        return self._write(
+            [selector], method='post', endpoint='lights/{}/state/delta',
+            endpoint_args=[selector], argument_tuples=argument_tuples,
+            **self._request_options(priority, deadline))
 
-    def toggle_power(self, selector='all', duration=1.0):
+    def toggle_power(self, selector='all', duration=1.0,
+        priority=None, deadline=None):
         """Given a selector and transition duration, toggle lights (on/off)"""
 
         argument_tuples = [
             ("duration", duration)
         ]
 
-        return self.client.perform_request(
-            method='post', endpoint='lights/{}/toggle',
-            endpoint_args=[selector], argument_tuples=argument_tuples)
+        return self._write(
+            [selector], method='post', endpoint='lights/{}/toggle',
+            endpoint_args=[selector], argument_tuples=argument_tuples,
+            **self._request_options(priority, deadline))
 
     def breathe_lights(self, color, selector='all',
         from_color=None, period=1.0, cycles=1.0,
-        persist=False, power_on=True, peak=0.5):
+        persist=False, power_on=True, peak=0.5, priority=None, deadline=None):
         """Perform breathe effect on lights.
 
         selector: String
@@ -171,6 +623,8 @@ class PIFX:
             default: 0.5
         """
 
+        self._check_colors(color, from_color)
+
         argument_tuples = [
             ("color", color),
             ("from_color", from_color),
@@ -181,13 +635,14 @@ class PIFX:
             ("peak", peak),
         ]
 
-        return self.client.perform_request(
-            method='post', endpoint='lights/{}/effects/breathe',
-            endpoint_args=[selector], argument_tuples=argument_tuples)
+        return self._write(
+            [selector], method='post', endpoint='lights/{}/effects/breathe',
+            endpoint_args=[selector], argument_tuples=argument_tuples,
+            **self._request_options(priority, deadline))
 
     def pulse_lights(self, color, selector='all',
         from_color=None, period=1.0, cycles=1.0,
-        persist=False, power_on=True):
+        persist=False, power_on=True, priority=None, deadline=None):
         """Perform pulse effect on lights.
 
         selector: String
@@ -219,6 +674,8 @@ class PIFX:
             default: true
         """
 
+        self._check_colors(color, from_color)
+
         argument_tuples = [
             ("color", color),
             ("from_color", from_color),
@@ -228,12 +685,14 @@ class PIFX:
             ("power_on", power_on),
         ]
 
-        return self.client.perform_request(
-            method='post', endpoint='lights/{}/effects/pulse',
-            endpoint_args=[selector], argument_tuples=argument_tuples)
+        return self._write(
+            [selector], method='post', endpoint='lights/{}/effects/pulse',
+            endpoint_args=[selector], argument_tuples=argument_tuples,
+            **self._request_options(priority, deadline))
 
     def cycle_lights(self, states,
-        defaults, direction='forward', selector='all'):
+        defaults, direction='forward', selector='all',
+        priority=None, deadline=None):
         """Cycle through list of effects.
 
         Provide array states as a list of dictionaries with set_state arguments.
@@ -255,25 +714,43 @@ class PIFX:
             default: forward
         """
 
+        self._check_state_colors(list(states) + [defaults])
+
         argument_tuples = [
             ("states", states),
             ("defaults", defaults),
             ("direction", direction)
         ]
 
-        return self.client.perform_request(
-            method='post', endpoint='lights/{}/cycle', endpoint_args=[selector],
-            argument_tuples=argument_tuples, json_body=True)
+        return self._write(
+            [selector], method='post', endpoint='lights/{}/cycle', endpoint_args=[selector],
+            argument_tuples=argument_tuples, json_body=True,
+            **self._request_options(priority, deadline))
 
-    def list_scenes(self):
+    def list_scenes(self, priority=None, deadline=None):
         """Return a list of scenes.
         See http://api.developer.lifx.com/docs/list-scenes
         """
 
-        return self.client.perform_request(
-            method='get', endpoint='scenes', parse_data=False)
+        scenes = None
+        if self.cache is not None:
+            scenes = self.cache.get(KEY_SCENES)
+
+        if scenes is None:
+            scenes = self.client.perform_request(
+                method='get', endpoint='scenes', parse_data=False,
+                **self._request_options(priority, deadline))
+
+            if self.cache is not None:
+                self.cache.set(KEY_SCENES, scenes)
+
+        if self.models:
+            return models.parse_scenes(scenes, self.keep_raw)
 
-    def activate_scene(self, scene_uuid, duration=1.0):
+        return scenes
+
+    def activate_scene(self, scene_uuid, duration=1.0,
+        priority=None, deadline=None):
         """Activate a scene.
 
         See http://api.developer.lifx.com/docs/activate-scene
@@ -290,6 +767,47 @@ class PIFX:
             ("duration", duration),
         ]
 
-        return self.client.perform_request(
-            method='put', endpoint='scenes/scene_id:{}/activate',
-            endpoint_args=[scene_uuid], argument_tuples=argument_tuples)
+        return self._write(
+            ['all'], method='put', endpoint='scenes/scene_id:{}/activate',
+            endpoint_args=[scene_uuid], argument_tuples=argument_tuples,
+            **self._request_options(priority, deadline))
+
+    def apply_scene(self, targets, snapshot=None, duration=None,
+        priority=None, deadline=None):
+        """Bring lights to a target state, sending only what differs from
+        their current state. Lights needing the same changes are grouped
+        into one selector, and the changes sent with set_states.
+        Returns its results, or an empty list if every light matches.
+        See pifx.scenes
+
+        targets: required Dict
+            Light id => target state, with arguments named as per
+            set_state, e.g {"d073d5000001": {"power": "on", "color": "red"}}
+
+        snapshot: List of Dicts
+            Current state of the lights, as returned by list_lights.
+            default: the state store if enabled, otherwise list_lights
+
+        duration: Double
+            Transition time, in seconds, of every change.
+        """
+
+        options = self._request_options(priority, deadline)
+
+        lights = snapshot
+        if lights is None and self.store is not None:
+            lights = self.store.get('all')
+        if lights is None:
+            lights = self._fetch_lights('all', **options)
+
+        operations = scenes.diff_scene(lights, targets)
+        if not operations:
+            return []
+
+        if deadline is not None:
+            # what is left of the deadline after reading the current state
+            deadline = options['deadline'] - time.time()
+
+        defaults = {'duration': duration} if duration is not None else None
+        return self.set_states(operations, defaults,
+            priority=priority, deadline=deadline)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Long-running PIFX process answering commands over a Unix socket.
+
+The daemon keeps one PIFX instance alive, so its HTTP connections,
+caches and rate limit state are reused by every command instead of being
+set up again by each short-lived script.
+
+The protocol is one JSON object per line. Requests name a PIFX method and
+its arguments:
+
+    {"method": "set_state", "args": ["label:Desk"], "kwargs": {"power": "on"}}
+
+and are answered with {"result": ...}, or {"error": message, "type":
+exception class name, "status": HTTP status or null}.
+"""
+
+import errno
+import json
+import os
+import socket
+import stat
+import tempfile
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    # Python 2, six.moves is not used to keep the client import light
+    import SocketServer as socketserver
+
+from pifx import exceptions
+
+# PIFX methods which can be called through the daemon
+DAEMON_METHODS = (
+    'list_lights',
+    'get_state',
+    'set_state',
+    'set_states',
+    'state_delta',
+    'toggle_power',
+    'breathe_lights',
+    'pulse_lights',
+    'cycle_lights',
+    'list_scenes',
+    'activate_scene',
+    'apply_scene',
+)
+
+
+def default_socket_path():
+    """Return the socket path used when none is given, which can be set
+    with the PIFX_SOCKET environment variable. Otherwise the socket is in
+    $XDG_RUNTIME_DIR, or a directory of the temporary directory only the
+    current user can access."""
+    path = os.environ.get('PIFX_SOCKET')
+    if path:
+        return path
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'pifx.sock')
+    return os.path.join(_private_dir(), 'pifx.sock')
+
+
+def _private_dir():
+    """Create or check the current user's directory for the socket in the
+    temporary directory, which other users can write to."""
+    if not hasattr(os, 'getuid'):
+        return tempfile.gettempdir()
+
+    uid = os.getuid()
+    path = os.path.join(tempfile.gettempdir(), 'pifx-{}'.format(uid))
+    try:
+        os.mkdir(path, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    # another user may have created it first
+    info = os.lstat(path)
+    if (not stat.S_ISDIR(info.st_mode) or info.st_uid != uid
+            or info.st_mode & 0o077):
+        raise InsecureSocket(
+            "{} is not a private directory of the current user".format(path))
+    return path
+
+
+def _check_owner(path):
+    """Raise InsecureSocket unless the socket at path belongs to the
+    current user, so commands are not sent to another user's process."""
+    if not hasattr(os, 'getuid'):
+        return
+    try:
+        info = os.stat(path)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            raise DaemonUnavailable("No daemon listening on {}".format(path))
+        raise
+    if info.st_uid != os.getuid():
+        raise InsecureSocket(
+            "{} is owned by another user".format(path))
+
+
+def _error_response(error):
+    return {
+        'error': str(error),
+        'type': type(error).__name__,
+        'status': getattr(error, 'status', None),
+    }
+
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.pifx_daemon.execute(line)
+            try:
+                encoded = json.dumps(response)
+            except (TypeError, ValueError) as e:
+                # e.g models, which are not JSON serializable
+                encoded = json.dumps(_error_response(e))
+            self.wfile.write(encoded.encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class PIFXDaemon:
+    """Serve PIFX method calls on a Unix domain socket.
+
+    .. code-block:: python
+
+        PIFXDaemon(PIFX(api_key, cache=ResponseCache())).serve_forever()
+
+    pifx: required PIFX
+        Instance whose methods are called.
+
+    path: String
+        Path of the socket, only accessible by the current user.
+        default: default_socket_path()
+    """
+    def __init__(self, pifx, path=None):
+        self.pifx = pifx
+        self.path = path or default_socket_path()
+
+        if os.path.exists(self.path):
+            if _is_listening(self.path):
+                raise RuntimeError(
+                    "A daemon is already listening on {}".format(self.path))
+            # left behind by a daemon which did not shut down cleanly
+            os.unlink(self.path)
+
+        old_umask = os.umask(0o077)
+        try:
+            self._server = _UnixServer(self.path, _CommandHandler)
+        finally:
+            os.umask(old_umask)
+        self._server.pifx_daemon = self
+        self._thread = None
+
+    def execute(self, line):
+        """Run the command encoded in a protocol line, return its response"""
+        try:
+            command = json.loads(line.decode('utf-8'))
+            method = command.get('method')
+            if method not in DAEMON_METHODS:
+                raise ValueError("Unknown method: {}".format(method))
+            result = getattr(self.pifx, method)(
+                *command.get('args', []), **command.get('kwargs', {}))
+        except Exception as e:
+            return _error_response(e)
+        return {'result': result}
+
+    def serve_forever(self):
+        try:
+            self._server.serve_forever()
+        finally:
+            self._close()
+
+    def start(self):
+        """Serve in a background thread, return the daemon"""
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _close(self):
+        self._server.server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def _is_listening(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+class DaemonUnavailable(exceptions.PIFXError):
+    """No daemon is listening on the socket"""
+
+
+class InsecureSocket(DaemonUnavailable):
+    """The socket, or its directory, belongs to another user"""
+
+
+class DaemonClient:
+    """Call PIFX methods through a running PIFXDaemon.
+
+    Methods are called as on PIFX, e.g client.set_state('all', power='on').
+    Errors raised by the daemon are raised again as the matching
+    pifx.exceptions class, or PIFXError for others.
+
+    path: String
+        Path of the daemon's socket.
+        default: default_socket_path()
+
+    timeout: Double
+        Seconds to wait for the daemon's answer.
+        default: 30
+    """
+    def __init__(self, path=None, timeout=30.0):
+        self.path = path or default_socket_path()
+        self.timeout = timeout
+
+    def call(self, method, *args, **kwargs):
+        request = json.dumps({'method': method, 'args': args, 'kwargs': kwargs})
+
+        _check_owner(self.path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            try:
+                sock.connect(self.path)
+            except socket.error as e:
+                if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                    raise DaemonUnavailable(
+                        "No daemon listening on {}".format(self.path))
+                raise
+            sock.sendall(request.encode('utf-8') + b'\n')
+            response = sock.makefile('rb').readline()
+        finally:
+            sock.close()
+
+        response = json.loads(response.decode('utf-8'))
+        if 'error' in response:
+            exception_class = getattr(exceptions, response['type'], None)
+            if not (isinstance(exception_class, type)
+                    and issubclass(exception_class, exceptions.PIFXError)):
+                exception_class = exceptions.PIFXError
+            raise exception_class(response['error'], status=response['status'])
+        return response['result']
+
+    def __getattr__(self, name):
+        if name not in DAEMON_METHODS:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Exceptions raised by PIFX.
+
+Every error response of the API raises a subclass of PIFXError carrying
+the response's status, headers and body, so callers can decide whether to
+retry without parsing messages:
+
+.. code-block:: python
+
+    try:
+        p.set_state('all', power='on')
+    except RateLimited as e:
+        time.sleep(e.retry_after)
+"""
+
+import time
+from email.utils import mktime_tz, parsedate_tz
+
+from pifx.constants import A_ERROR_HTTP_CODES, A_HEADER_RATE_LIMIT_RESET
+
+
+def server_retry_delay(headers, rate_limited=False, clock=time.time):
+    """Return the seconds a response's headers ask to wait before retrying,
+    or None. The API sends X-RateLimit-Reset with every response, so it is
+    only a wait time when the request was rate limited."""
+    retry_after = headers.get('Retry-After')
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            parsed_date = parsedate_tz(retry_after)
+            if parsed_date is not None:
+                return max(0.0, mktime_tz(parsed_date) - clock())
+
+    reset = headers.get(A_HEADER_RATE_LIMIT_RESET)
+    if rate_limited and reset is not None:
+        try:
+            return max(0.0, float(reset) - clock())
+        except ValueError:
+            pass
+
+    return None
+
+
+class PIFXError(Exception):
+    """Base class of PIFX errors.
+
+    status: Integer
+        HTTP status code of the response, if any.
+
+    headers: Dict
+        Headers of the response, if any.
+
+    body: Bytes
+        Body of the response, if any.
+
+    results: List
+        Per-light results of the request, if any.
+    """
+    def __init__(self, message, status=None, headers=None, body=None, results=None):
+        Exception.__init__(self, message)
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+        self.results = results
+
+    @property
+    def retry_after(self):
+        """Seconds the server asked to wait before retrying, or None"""
+        return server_retry_delay(self.headers, isinstance(self, RateLimited))
+
+    @property
+    def reset_time(self):
+        """Unix time at which the rate limit resets, or None"""
+        reset = self.headers.get(A_HEADER_RATE_LIMIT_RESET)
+        if reset is None:
+            return None
+        try:
+            return float(reset)
+        except ValueError:
+            return None
+
+
+class BadRequest(PIFXError):
+    """The API rejected the request as invalid (400, 426)"""
+
+class InvalidParameters(BadRequest, ValueError):
+    """Missing or malformed parameters (422), also raised for parameters
+    rejected before sending"""
+
+class AuthError(PIFXError):
+    """Invalid API key or OAuth scope (401, 403)"""
+
+class InvalidSelector(PIFXError, ValueError):
+    """The selector did not match any lights (404), also raised for
+    selectors the light index knows match nothing"""
+
+class RateLimited(PIFXError):
+    """The rate limit was exceeded (429), retry after retry_after seconds"""
+
+class ServerUnavailable(PIFXError):
+    """The API failed or is unavailable (5xx), retrying may succeed"""
+
+class DeadlineExceeded(PIFXError):
+    """The request could not be sent before its deadline, and was dropped"""
+
+class PartialFailure(PIFXError):
+    """Some lights did not apply a write, see results for their status"""
+
+
+STATUS_EXCEPTIONS = {
+    400: BadRequest,
+    401: AuthError,
+    403: AuthError,
+    404: InvalidSelector,
+    422: InvalidParameters,
+    426: BadRequest,
+    429: RateLimited,
+}
+
+
+def exception_for_status(status_code, headers=None, body=None):
+    """Return the exception to raise for an error status code"""
+    exception_class = STATUS_EXCEPTIONS.get(status_code)
+    if exception_class is None:
+        exception_class = ServerUnavailable if status_code >= 500 else PIFXError
+
+    message = "{}: {}".format(status_code, A_ERROR_HTTP_CODES.get(status_code))
+    return exception_class(message, status=status_code, headers=headers, body=body)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+from collections import OrderedDict
+
+from pifx import selector as selectors
+from pifx.exceptions import InvalidSelector
+
+
+class LightIndex:
+    """In-memory index over a list_lights response, used to resolve,
+    validate and expand selectors without a request.
+
+    Lights are indexed by id, uuid, label, group id and name, location id
+    and name, power state and multizone capability.
+    """
+    def __init__(self, lights):
+        self.lights = list(lights)
+
+        self.by_id = dict()
+        self.by_uuid = dict()
+        self.by_power = dict()
+        self.by_multizone = dict()
+        self._by_selector_type = dict(
+            (selector_type, dict()) for selector_type in selectors.SELECTOR_FIELDS)
+
+        for light in self.lights:
+            self.by_id[light.get('id')] = light
+            self.by_uuid[light.get('uuid')] = light
+            self.by_power.setdefault(light.get('power'), []).append(light)
+
+            capabilities = (light.get('product') or {}).get('capabilities') or {}
+            multizone = bool(capabilities.get('has_multizone'))
+            self.by_multizone.setdefault(multizone, []).append(light)
+
+            for selector_type, field in selectors.SELECTOR_FIELDS.items():
+                self._by_selector_type[selector_type].setdefault(
+                    field(light), []).append(light)
+
+    def __len__(self):
+        return len(self.lights)
+
+    def __contains__(self, light_id):
+        return light_id in self.by_id
+
+    def lookup(self, selector_type, value):
+        """Return the lights whose selector_type (e.g label) equals value"""
+        return list(self._by_selector_type[selector_type].get(value, []))
+
+    def resolve(self, selector):
+        """Given a selector, return the list of lights it matches, or None
+        if the selector cannot be evaluated locally (e.g scene_id:)."""
+        parsed_selector = selectors.parse_selector(selector)
+        if parsed_selector is None:
+            return None
+
+        matches = OrderedDict()
+        for selector_type, value in parsed_selector:
+            if selector_type == selectors.SELECTOR_ALL:
+                return list(self.lights)
+            for light in self._by_selector_type[selector_type].get(value, []):
+                matches[light.get('id')] = light
+
+        return list(matches.values())
+
+    def validate(self, selector):
+        """Raise InvalidSelector if selector is known not to match any lights"""
+        lights = self.resolve(selector)
+        if lights is not None and not lights:
+            raise InvalidSelector(
+                "Selector did not match any lights: {}".format(selector))
+
+    def expand(self, selector):
+        """Given a selector, return an equivalent selector listing the
+        matched lights by id, or the selector itself if it cannot be
+        evaluated locally."""
+        lights = self.resolve(selector)
+        if lights is None:
+            return selector
+        return selectors.id_selector(light.get('id') for light in lights)
+
+    def group_by_location(self, selector='all'):
+        """Return an ordered dict of location id => lights matched by
+        selector in that location."""
+        lights = self.resolve(selector)
+        if lights is None:
+            lights = []
+
+        locations = OrderedDict()
+        for light in lights:
+            location_id = (light.get('location') or {}).get('id')
+            locations.setdefault(location_id, []).append(light)
+
+        return locations
@@ -0,0 +1,721 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Direct control of bulbs with the LIFX LAN protocol over UDP.
+
+LIFXLANClient can be used in place of LIFXWebAPIClient, so the same PIFX
+methods control lights on the local network without the cloud round trip:
+
+.. code-block:: python
+
+    p = pifx.PIFX(client=pifx.lan.LIFXLANClient())
+    p.set_state('label:Bedroom', color='blue')
+
+See https://lan.developer.lifx.com/docs
+"""
+
+import binascii
+import random
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from pifx import exceptions, util
+from pifx import selector as selectors
+from pifx.color import parse_color
+
+LAN_PORT = 56700
+
+PROTOCOL_NUMBER = 1024
+FLAG_ADDRESSABLE = 1 << 12
+FLAG_TAGGED = 1 << 13
+FLAG_RES_REQUIRED = 1
+FLAG_ACK_REQUIRED = 2
+
+# frame, frame address and protocol header
+HEADER_FORMAT = '<HHIQ6sBBQHH'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+SERVICE_UDP = 1
+
+MSG_GET_SERVICE = 2
+MSG_STATE_SERVICE = 3
+MSG_ACKNOWLEDGEMENT = 45
+MSG_GET_LOCATION = 48
+MSG_STATE_LOCATION = 50
+MSG_GET_GROUP = 51
+MSG_STATE_GROUP = 53
+MSG_LIGHT_GET = 101
+MSG_SET_COLOR = 102
+MSG_SET_WAVEFORM = 103
+MSG_LIGHT_STATE = 107
+MSG_LIGHT_SET_POWER = 117
+MSG_LIGHT_STATE_POWER = 118
+
+# message type => struct format of its payload
+PAYLOAD_FORMATS = {
+    MSG_STATE_SERVICE: '<BI',
+    MSG_STATE_LOCATION: '<16s32sQ',
+    MSG_STATE_GROUP: '<16s32sQ',
+    MSG_SET_COLOR: '<BHHHHI',
+    MSG_SET_WAVEFORM: '<BBHHHHIfhB',
+    MSG_LIGHT_STATE: '<HHHHhH32sQ',
+    MSG_LIGHT_SET_POWER: '<HI',
+    MSG_LIGHT_STATE_POWER: '<H',
+}
+
+WAVEFORM_SINE = 1
+WAVEFORM_PULSE = 4
+
+POWER_ON = 65535
+POWER_OFF = 0
+
+Packet = namedtuple('Packet', 'msg_type target source sequence flags tagged payload')
+
+
+def encode_packet(msg_type, payload=(), target=0, source=0, sequence=0,
+    tagged=False, ack_required=False, res_required=False):
+    """Return the bytes of a LAN protocol packet. payload is a tuple of
+    values for the message type's payload format."""
+    payload_format = PAYLOAD_FORMATS.get(msg_type)
+    payload_bytes = b''
+    if payload_format is not None:
+        payload_bytes = struct.pack(payload_format, *payload)
+
+    protocol = PROTOCOL_NUMBER | FLAG_ADDRESSABLE
+    if tagged:
+        protocol |= FLAG_TAGGED
+
+    flags = 0
+    if res_required:
+        flags |= FLAG_RES_REQUIRED
+    if ack_required:
+        flags |= FLAG_ACK_REQUIRED
+
+    header = struct.pack(HEADER_FORMAT,
+        HEADER_SIZE + len(payload_bytes), protocol, source,
+        target, b'\x00' * 6, flags, sequence,
+        0, msg_type, 0)
+
+    return header + payload_bytes
+
+def decode_packet(data):
+    """Given the bytes of a LAN protocol packet, return a Packet.
+    The payload is a tuple for known message types, bytes otherwise."""
+    if len(data) < HEADER_SIZE:
+        raise ValueError("Packet too short: {} bytes".format(len(data)))
+
+    (size, protocol, source, target, _, flags, sequence,
+        _, msg_type, _) = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
+
+    payload = data[HEADER_SIZE:size]
+    payload_format = PAYLOAD_FORMATS.get(msg_type)
+    if payload_format is not None:
+        payload = struct.unpack(payload_format, payload)
+
+    return Packet(msg_type, target, source, sequence, flags,
+        bool(protocol & FLAG_TAGGED), payload)
+
+def id_to_target(light_id):
+    """Given a light id (its MAC address in hex), return the packet target"""
+    return struct.unpack('<Q', binascii.unhexlify(light_id) + b'\x00\x00')[0]
+
+def target_to_id(target):
+    return binascii.hexlify(struct.pack('<Q', target)[:6]).decode('ascii')
+
+def decode_label(label):
+    return label.rstrip(b'\x00').decode('utf-8', 'replace')
+
+def encode_label(label):
+    return label.encode('utf-8')[:32]
+
+def components_to_hsbk(components):
+    """Given hue (degrees), saturation, brightness (0-1) and kelvin, return
+    the 16 bit values used by the LAN protocol."""
+    return (
+        int(round(components['hue'] / 360.0 * 65535)) % 65536,
+        int(round(components['saturation'] * 65535)),
+        int(round(components['brightness'] * 65535)),
+        int(components['kelvin']),
+    )
+
+def hsbk_to_components(hue, saturation, brightness, kelvin):
+    return {
+        'hue': hue * 360.0 / 65535,
+        'saturation': saturation / 65535.0,
+        'brightness': brightness / 65535.0,
+        'kelvin': kelvin,
+    }
+
+# selector type => light info it is matched against, and the messages
+# asking a light for it
+SELECTOR_INFO = {
+    'group': 'group',
+    'group_id': 'group',
+    'location': 'location',
+    'location_id': 'location',
+}
+INFO_MESSAGES = {
+    'group': (MSG_GET_GROUP, MSG_STATE_GROUP),
+    'location': (MSG_GET_LOCATION, MSG_STATE_LOCATION),
+}
+
+HSBK_COMPONENTS = ('hue', 'saturation', 'brightness', 'kelvin')
+
+
+def _is_complete(components):
+    return all(name in components for name in HSBK_COMPONENTS)
+
+def _state_components(data):
+    """Return the color components a set_state sets, brightness included"""
+    components = dict()
+    if data.get('color') is not None:
+        components.update(parse_color(data['color']))
+    if data.get('brightness') is not None:
+        components['brightness'] = float(data['brightness'])
+    return components
+
+
+class UnsupportedOverLAN(exceptions.PIFXError, ValueError):
+    """The request needs the cloud API, e.g scenes"""
+
+
+class LIFXLANClient:
+    """Client implementing the PIFX request surface over the LAN protocol.
+
+    Lights are found by broadcasting to discovery_addresses, and addressed
+    directly once known. Scenes are stored in the cloud, so list_scenes and
+    activate_scene are not available over LAN.
+
+    Only the packets a request needs are sent: id selectors are matched
+    against discovered lights, labels, groups and locations are asked once
+    per light, and the current state is only read from the matched lights
+    when a write depends on it (state_delta, toggle_power, cycle_lights,
+    partial colors). Packets to several lights are sent together, so an
+    unresponsive light does not delay the others.
+
+    discovery_addresses: List of Tuples
+        (host, port) pairs to send discovery packets to.
+        default: [('255.255.255.255', 56700)]
+
+    timeout: Double
+        Seconds to wait for a bulb to answer a packet.
+        default: 0.5
+
+    attempts: Integer
+        Times a packet is sent before a bulb is reported as timed out.
+        default: 3
+
+    discovery_timeout: Double
+        Seconds to wait for bulbs to answer discovery.
+        default: 1.0
+    """
+    def __init__(self, discovery_addresses=None, timeout=0.5, attempts=3,
+        discovery_timeout=1.0):
+        if discovery_addresses is None:
+            discovery_addresses = [('255.255.255.255', LAN_PORT)]
+
+        self.discovery_addresses = discovery_addresses
+        self.timeout = timeout
+        self.attempts = attempts
+        self.discovery_timeout = discovery_timeout
+
+        # light id => (host, port)
+        self.devices = OrderedDict()
+        # light id => {'label': ..., 'group': {...}, 'location': {...}}
+        self._device_info = dict()
+
+        self._source = random.randint(2, 0xFFFFFFFF)
+        self._sequence = 0
+        self._sequence_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self._sock.bind(('', 0))
+
+        # each thread sends and receives on its own socket, so concurrent
+        # requests do not wait for each other's answers
+        self._local = threading.local()
+        self._sockets = []
+
+    def close(self):
+        self._sock.close()
+        with self._lock:
+            for sock in self._sockets:
+                sock.close()
+            del self._sockets[:]
+
+    def _thread_socket(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(('', 0))
+            self._local.sock = sock
+            with self._lock:
+                self._sockets.append(sock)
+        return sock
+
+    def _next_sequence(self):
+        with self._sequence_lock:
+            self._sequence = (self._sequence + 1) % 256
+            return self._sequence
+
+    def _receive(self, sock, deadline):
+        """Return the next (Packet, address) addressed to this client before
+        deadline, or None."""
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+
+            sock.settimeout(remaining)
+            try:
+                data, address = sock.recvfrom(1024)
+            except socket.timeout:
+                return None
+
+            try:
+                packet = decode_packet(data)
+            except (ValueError, struct.error):
+                continue
+
+            if packet.source == self._source:
+                return packet, address
+
+    def discover(self):
+        """Find bulbs answering on discovery_addresses, return their ids"""
+        with self._lock:
+            sequence = self._next_sequence()
+            packet = encode_packet(MSG_GET_SERVICE, source=self._source,
+                sequence=sequence, tagged=True, res_required=True)
+            for address in self.discovery_addresses:
+                self._sock.sendto(packet, address)
+
+            deadline = time.time() + self.discovery_timeout
+            while True:
+                received = self._receive(self._sock, deadline)
+                if received is None:
+                    break
+
+                response, address = received
+                if response.msg_type != MSG_STATE_SERVICE:
+                    continue
+
+                service, port = response.payload
+                if service == SERVICE_UDP:
+                    self.devices[target_to_id(response.target)] = (
+                        address[0], port)
+
+        return list(self.devices)
+
+    def _transact(self, messages):
+        """Send (light id, message type, payload, response type) messages
+        together, and wait for their responses (or acknowledgements if the
+        response type is None). Return one response Packet per message, or
+        None for messages which were not answered."""
+        responses = [None] * len(messages)
+        if not messages:
+            return responses
+
+        sock = self._thread_socket()
+        # (target, sequence) => index of the message, for every attempt
+        sent = dict()
+        unanswered = list(range(len(messages)))
+
+        for attempt in range(self.attempts):
+            for index in unanswered:
+                light_id, msg_type, payload, response_type = messages[index]
+                sequence = self._next_sequence()
+                target = id_to_target(light_id)
+                sock.sendto(encode_packet(msg_type, payload,
+                    target=target, source=self._source, sequence=sequence,
+                    ack_required=response_type is None,
+                    res_required=response_type is not None),
+                    self.devices[light_id])
+                sent[(target, sequence)] = index
+
+            deadline = time.time() + self.timeout
+            while unanswered:
+                received = self._receive(sock, deadline)
+                if received is None:
+                    break
+                response = received[0]
+                index = sent.get((response.target, response.sequence))
+                if index is None or responses[index] is not None:
+                    continue
+                expected_type = messages[index][3] or MSG_ACKNOWLEDGEMENT
+                if response.msg_type == expected_type:
+                    responses[index] = response
+                    unanswered.remove(index)
+
+            if not unanswered:
+                break
+
+        return responses
+
+    def _light(self, light_id):
+        """Return a list_lights style dict with what is known of a light"""
+        light = {'id': light_id}
+        light.update(self._device_info.get(light_id, {}))
+        return light
+
+    def _learn(self, lights, keys):
+        """Ask lights for the group and location info named in keys which
+        is not known yet, and add it to them."""
+        messages = []
+        for light in lights:
+            for key in keys:
+                if key not in light:
+                    get_type, state_type = INFO_MESSAGES[key]
+                    messages.append((light, key, get_type, state_type))
+
+        responses = self._transact([(light['id'], get_type, (), state_type)
+            for light, _, get_type, state_type in messages])
+
+        for (light, key, _, _), response in zip(messages, responses):
+            if response is not None:
+                uid, label, _ = response.payload
+                light[key] = self._device_info.setdefault(light['id'], {})[key] = {
+                    'id': binascii.hexlify(uid).decode('ascii'),
+                    'name': decode_label(label),
+                }
+
+    def _read_states(self, lights):
+        """Read the current state of lights, and add it to them. Lights
+        which do not answer are marked as not connected."""
+        responses = self._transact([(light['id'], MSG_LIGHT_GET, (), MSG_LIGHT_STATE)
+            for light in lights])
+
+        for light, response in zip(lights, responses):
+            if response is None:
+                light['connected'] = False
+                continue
+
+            hue, saturation, brightness, kelvin, _, power, label, _ = \
+                response.payload
+            components = hsbk_to_components(hue, saturation, brightness, kelvin)
+            light.update({
+                'label': decode_label(label),
+                'connected': True,
+                'power': 'on' if power else 'off',
+                'color': {
+                    'hue': components['hue'],
+                    'saturation': components['saturation'],
+                    'kelvin': kelvin,
+                },
+                'brightness': components['brightness'],
+            })
+            self._device_info.setdefault(light['id'], {})['label'] = light['label']
+
+    def _resolve(self, selector, state=False, describe=False):
+        """Return list_lights style dicts for the lights matched by selector.
+
+        state: Boolean
+            Read the current state of the matched lights.
+
+        describe: Boolean
+            Add the group and location of the matched lights.
+        """
+        if not self.devices:
+            self.discover()
+
+        parsed_selector = selectors.parse_selector(selector)
+        if parsed_selector is None:
+            raise exceptions.InvalidSelector(
+                "Selector cannot be used over LAN: {}".format(selector))
+
+        lights = [self._light(light_id) for light_id in self.devices]
+
+        keys = set(SELECTOR_INFO[selector_type] for selector_type, _
+                   in parsed_selector if selector_type in SELECTOR_INFO)
+        if keys:
+            self._learn(lights, keys)
+        if any(selector_type == 'label' for selector_type, _ in parsed_selector):
+            self._read_states([light for light in lights if 'label' not in light])
+
+        matched = [light for light in lights
+                   if selectors.light_matches(light, parsed_selector)]
+        if not matched:
+            util.handle_status(404)
+
+        if describe:
+            self._learn(matched, INFO_MESSAGES)
+        if state:
+            # lights asked for their label above already have their state
+            self._read_states([light for light in matched if 'connected' not in light])
+
+        return matched
+
+    def _results(self, lights, failed_ids):
+        """Return the per-light results of a write. Lights which answered
+        before but not to the write timed out, others are offline."""
+        results = []
+        for light in lights:
+            if light.get('connected') is False:
+                status = 'offline'
+            elif light['id'] not in failed_ids:
+                status = 'ok'
+            elif light.get('connected'):
+                status = 'timed_out'
+            else:
+                status = 'offline'
+            results.append({'id': light['id'], 'label': light.get('label'),
+                            'status': status})
+
+        return results
+
+    def _send(self, messages):
+        """Send (light, message type, payload) messages together, return
+        the ids of the lights which did not acknowledge them."""
+        responses = self._transact([(light['id'], msg_type, payload, None)
+            for light, msg_type, payload in messages])
+        return set(light['id'] for (light, _, _), response
+                   in zip(messages, responses) if response is None)
+
+    def _components(self, light):
+        color = light['color']
+        return {
+            'hue': color['hue'],
+            'saturation': color['saturation'],
+            'brightness': light['brightness'],
+            'kelvin': color['kelvin'],
+        }
+
+    def _color_payload(self, components, duration):
+        return (0,) + components_to_hsbk(components) + (int(duration * 1000),)
+
+    def _power_payload(self, on, duration):
+        return (POWER_ON if on else POWER_OFF, int(duration * 1000))
+
+    def _apply_state(self, lights, data):
+        """Apply a set_state to lights, which must have their state read
+        unless the state sets complete colors or power only."""
+        duration = float(data.get('duration', 0))
+        components = _state_components(data)
+        power = data.get('power')
+
+        reachable = [light for light in lights if light.get('connected') is not False]
+        failed_ids = set()
+
+        if components:
+            messages = []
+            for light in reachable:
+                light_components = dict(components)
+                if not _is_complete(components):
+                    light_components = self._components(light)
+                    light_components.update(components)
+                messages.append((light, MSG_SET_COLOR,
+                    self._color_payload(light_components, duration)))
+            failed_ids |= self._send(messages)
+
+        if power is not None:
+            failed_ids |= self._send([(light, MSG_LIGHT_SET_POWER,
+                self._power_payload(power == 'on', duration))
+                for light in reachable])
+
+        return self._results(lights, failed_ids)
+
+    def _set_state(self, selector, data):
+        components = _state_components(data)
+        lights = self._resolve(selector,
+            state=bool(components) and not _is_complete(components))
+        return self._apply_state(lights, data)
+
+    def _set_states(self, selector, data):
+        defaults = data.get('defaults') or {}
+
+        results = []
+        for state in data.get('states', []):
+            operation = dict(defaults)
+            operation.update(state)
+            results.append({
+                'operation': state,
+                'results': self._set_state(operation['selector'], operation),
+            })
+
+        return results
+
+    def _state_delta(self, selector, data):
+        duration = float(data.get('duration', 0))
+        lights = self._resolve(selector, state=True)
+        reachable = [light for light in lights if light.get('connected')]
+
+        messages = []
+        for light in reachable:
+            components = self._components(light)
+            if 'hue' in data:
+                components['hue'] = (components['hue'] + float(data['hue'])) % 360
+            for name in ('saturation', 'brightness'):
+                if name in data:
+                    components[name] = util.clip(
+                        components[name] + float(data[name]), 0.0, 1.0)
+            if 'kelvin' in data:
+                components['kelvin'] = util.clip(
+                    components['kelvin'] + float(data['kelvin']), 2500, 9000)
+            messages.append((light, MSG_SET_COLOR,
+                self._color_payload(components, duration)))
+
+        failed_ids = self._send(messages)
+        if 'power' in data:
+            failed_ids |= self._send([(light, MSG_LIGHT_SET_POWER,
+                self._power_payload(data['power'] == 'on', duration))
+                for light in reachable])
+
+        return self._results(lights, failed_ids)
+
+    def _toggle_power(self, selector, data):
+        lights = self._resolve(selector, state=True)
+        return self._apply_state(lights, {
+            'power': util.toggled_power(lights),
+            'duration': data.get('duration', 0)})
+
+    def _waveform(self, selector, data, waveform, skew_ratio):
+        color = parse_color(data['color'])
+        from_color = None
+        if data.get('from_color') is not None:
+            from_color = parse_color(data['from_color'])
+
+        lights = self._resolve(selector, state=not _is_complete(color)
+            or (from_color is not None and not _is_complete(from_color)))
+        reachable = [light for light in lights if light.get('connected') is not False]
+
+        failed_ids = set()
+        base = dict()
+        if from_color is not None:
+            messages = []
+            for light in reachable:
+                light_base = dict(from_color)
+                if not _is_complete(from_color):
+                    light_base = self._components(light)
+                    light_base.update(from_color)
+                base[light['id']] = light_base
+                messages.append((light, MSG_SET_COLOR,
+                    self._color_payload(light_base, 0)))
+            failed_ids |= self._send(messages)
+
+        if util.is_true(data.get('power_on', True)):
+            failed_ids |= self._send([(light, MSG_LIGHT_SET_POWER,
+                self._power_payload(True, 0)) for light in reachable
+                if light.get('power') != 'on'])
+
+        messages = []
+        for light in reachable:
+            components = dict(color)
+            if not _is_complete(color):
+                components = base.get(light['id']) or self._components(light)
+                components = dict(components, **color)
+            messages.append((light, MSG_SET_WAVEFORM, (
+                0, 0 if util.is_true(data.get('persist')) else 1,
+            ) + components_to_hsbk(components) + (
+                int(float(data.get('period', 1.0)) * 1000),
+                float(data.get('cycles', 1.0)),
+                skew_ratio,
+                waveform,
+            )))
+        failed_ids |= self._send(messages)
+
+        return self._results(lights, failed_ids)
+
+    def _breathe(self, selector, data):
+        peak = float(data.get('peak', 0.5))
+        skew_ratio = int(util.clip(peak * 65535 - 32768, -32768, 32767))
+        return self._waveform(selector, data, WAVEFORM_SINE, skew_ratio)
+
+    def _pulse(self, selector, data):
+        return self._waveform(selector, data, WAVEFORM_PULSE, 0)
+
+    def _state_matches(self, light, state):
+        if 'power' in state and state['power'] != light.get('power'):
+            return False
+
+        expected = dict()
+        if state.get('color') is not None:
+            expected.update(parse_color(state['color']))
+        if state.get('brightness') is not None:
+            expected['brightness'] = float(state['brightness'])
+
+        current = self._components(light)
+        for name, value in expected.items():
+            tolerance = 1.0 if name in ('hue', 'kelvin') else 0.01
+            if abs(current[name] - value) > tolerance:
+                return False
+
+        return True
+
+    def _cycle(self, selector, data):
+        lights = self._resolve(selector, state=True)
+        states = data['states']
+        defaults = data.get('defaults') or {}
+        step = -1 if data.get('direction') == 'backward' else 1
+
+        # as with the cloud API, move to the state after the one the first
+        # light currently matches, or to the first state if none match
+        index = 0
+        for i, state in enumerate(states):
+            if lights[0].get('connected') and self._state_matches(lights[0], state):
+                index = (i + step) % len(states)
+                break
+
+        operation = dict(defaults)
+        operation.update(states[index])
+        return self._apply_state(lights, operation)
+
+    ROUTES = {
+        ('get', 'lights/{}'): None,
+        ('put', 'lights/{}/state'): _set_state,
+        ('put', 'lights/states'): _set_states,
+        ('post', 'lights/{}/state/delta'): _state_delta,
+        ('post', 'lights/{}/toggle'): _toggle_power,
+        ('post', 'lights/{}/effects/breathe'): _breathe,
+        ('post', 'lights/{}/effects/pulse'): _pulse,
+        ('post', 'lights/{}/cycle'): _cycle,
+    }
+
+    def perform_request(
+        self,
+        method,
+        endpoint,
+        endpoint_args=[],
+        argument_tuples=None,
+        json_body=False,
+        parse_data=True,
+        **kwargs
+    ):
+        route = (method.lower(), endpoint)
+        if route not in self.ROUTES:
+            raise UnsupportedOverLAN(
+                "{} {} is not available over LAN".format(method.upper(), endpoint))
+
+        selector = endpoint_args[0] if endpoint_args else selectors.SELECTOR_ALL
+
+        handler = self.ROUTES[route]
+        if handler is None:
+            return self._resolve(selector, state=True, describe=True)
+
+        data = dict()
+        if argument_tuples is not None:
+            data = util.arg_tup_to_dict(argument_tuples)
+
+        results = handler(self, selector, data)
+
+        if parse_data:
+            return results
+
+        return {'results': results}
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Request metrics collected through client hooks.
+
+.. code-block:: python
+
+    metrics = MetricsCollector().install(p.client)
+    p.list_lights()
+    print(metrics.to_prometheus())
+"""
+
+import bisect
+import threading
+from collections import defaultdict
+
+from pifx.client import (HOOK_AFTER_RESPONSE, HOOK_BEFORE_REQUEST,
+    HOOK_ON_ERROR, HOOK_ON_RETRY)
+from pifx.ratelimit import HEADER_LIMIT, HEADER_REMAINING
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _body_size(body):
+    if body is None:
+        return 0
+    if hasattr(body, 'encode') and not isinstance(body, bytes):
+        body = body.encode('utf-8')
+    try:
+        return len(body)
+    except TypeError:
+        # generators and files have no known size
+        return 0
+
+def _response_size(request, response):
+    length = response.headers.get('Content-Length')
+    if length is not None:
+        try:
+            return int(length)
+        except ValueError:
+            pass
+    # reading the content of a streamed response would consume it
+    if request.get('stream'):
+        return 0
+    return len(response.content or b'')
+
+def _header_int(headers, name):
+    """Return an integer header, or None if missing or malformed"""
+    try:
+        return int(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(
+        '{}="{}"'.format(name, _escape_label(labels[name]))
+        for name in sorted(labels)) + '}'
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Return (upper bound, count of values <= bound) pairs, ending with
+        the '+Inf' bucket."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class MetricsCollector:
+    """Record per-endpoint request counts, latency histograms, bytes sent
+    and received, status codes, retries, errors and rate limit headroom.
+
+    Endpoints are the templates passed to perform_request (e.g
+    'lights/{}/state'), so selectors do not multiply the number of series.
+
+    buckets: Tuple of Doubles
+        Upper bounds in seconds of the latency histogram buckets.
+        default: LATENCY_BUCKETS
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget every recorded value"""
+        with self._lock:
+            self._requests = defaultdict(int)
+            self._statuses = defaultdict(int)
+            self._retries = defaultdict(int)
+            self._errors = defaultdict(int)
+            self._bytes_sent = defaultdict(int)
+            self._bytes_received = defaultdict(int)
+            self._latency = dict()
+            self.rate_limit_remaining = None
+            self.rate_limit_limit = None
+
+    def install(self, client):
+        """Add this collector's hooks to a client, return the collector"""
+        client.add_hook(HOOK_BEFORE_REQUEST, self.before_request)
+        client.add_hook(HOOK_AFTER_RESPONSE, self.after_response)
+        client.add_hook(HOOK_ON_RETRY, self.on_retry)
+        client.add_hook(HOOK_ON_ERROR, self.on_error)
+        return self
+
+    def uninstall(self, client):
+        """Remove this collector's hooks from a client"""
+        client.remove_hook(HOOK_BEFORE_REQUEST, self.before_request)
+        client.remove_hook(HOOK_AFTER_RESPONSE, self.after_response)
+        client.remove_hook(HOOK_ON_RETRY, self.on_retry)
+        client.remove_hook(HOOK_ON_ERROR, self.on_error)
+
+    def _key(self, request):
+        return (request['endpoint'], request['method'].upper())
+
+    def before_request(self, request):
+        with self._lock:
+            self._requests[self._key(request)] += 1
+
+    def after_response(self, request, response, elapsed):
+        key = self._key(request)
+        sent = _body_size(getattr(getattr(response, 'request', None), 'body', None))
+        received = _response_size(request, response)
+
+        with self._lock:
+            self._statuses[key + (response.status_code,)] += 1
+            self._bytes_sent[key] += sent
+            self._bytes_received[key] += received
+
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = _Histogram(self.buckets)
+            histogram.observe(elapsed)
+
+            remaining = _header_int(response.headers, HEADER_REMAINING)
+            if remaining is not None:
+                self.rate_limit_remaining = remaining
+            limit = _header_int(response.headers, HEADER_LIMIT)
+            if limit is not None:
+                self.rate_limit_limit = limit
+
+    def on_retry(self, request, attempt, delay):
+        with self._lock:
+            self._retries[self._key(request)] += 1
+
+    def on_error(self, request, error):
+        with self._lock:
+            self._errors[self._key(request) + (type(error).__name__,)] += 1
+
+    def to_dict(self):
+        """Return the recorded metrics as a dict keyed by endpoint, then by
+        HTTP method."""
+        with self._lock:
+            endpoints = dict()
+
+            def entry(key):
+                endpoint, method = key[:2]
+                methods = endpoints.setdefault(endpoint, dict())
+                if method not in methods:
+                    methods[method] = {
+                        'requests': 0,
+                        'retries': 0,
+                        'statuses': dict(),
+                        'errors': dict(),
+                        'bytes_sent': 0,
+                        'bytes_received': 0,
+                        'latency': None,
+                    }
+                return methods[method]
+
+            for key, count in self._requests.items():
+                entry(key)['requests'] = count
+            for key, count in self._retries.items():
+                entry(key)['retries'] = count
+            for key, count in self._statuses.items():
+                entry(key)['statuses'][key[2]] = count
+            for key, count in self._errors.items():
+                entry(key)['errors'][key[2]] = count
+            for key, count in self._bytes_sent.items():
+                entry(key)['bytes_sent'] = count
+            for key, count in self._bytes_received.items():
+                entry(key)['bytes_received'] = count
+            for key, histogram in self._latency.items():
+                entry(key)['latency'] = {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'buckets': histogram.cumulative(),
+                }
+
+            return {
+                'endpoints': endpoints,
+                'rate_limit': {
+                    'remaining': self.rate_limit_remaining,
+                    'limit': self.rate_limit_limit,
+                },
+            }
+
+    def to_prometheus(self):
+        """Return the recorded metrics in the Prometheus text format"""
+        lines = []
+
+        def counter(name, help_text, values, label_names):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} counter'.format(name))
+            for key in sorted(values, key=str):
+                lines.append('{}{} {}'.format(
+                    name, _labels(**dict(zip(label_names, key))), values[key]))
+
+        with self._lock:
+            counter('pifx_requests_total', 'Requests sent, including retries.',
+                self._requests, ('endpoint', 'method'))
+            counter('pifx_responses_total', 'Responses received by status code.',
+                self._statuses, ('endpoint', 'method', 'status'))
+            counter('pifx_retries_total', 'Attempts retried.',
+                self._retries, ('endpoint', 'method'))
+            counter('pifx_errors_total', 'Requests which failed, by exception.',
+                self._errors, ('endpoint', 'method', 'error'))
+            counter('pifx_request_bytes_total', 'Request body bytes sent.',
+                self._bytes_sent, ('endpoint', 'method'))
+            counter('pifx_response_bytes_total', 'Response body bytes received.',
+                self._bytes_received, ('endpoint', 'method'))
+
+            name = 'pifx_request_duration_seconds'
+            lines.append('# HELP {} Time from sending a request to its response.'.format(name))
+            lines.append('# TYPE {} histogram'.format(name))
+            for (endpoint, method) in sorted(self._latency):
+                histogram = self._latency[(endpoint, method)]
+                for bound, count in histogram.cumulative():
+                    lines.append('{}_bucket{} {}'.format(name, _labels(
+                        endpoint=endpoint, method=method, le=bound), count))
+                labels = _labels(endpoint=endpoint, method=method)
+                lines.append('{}_sum{} {}'.format(name, labels, histogram.sum))
+                lines.append('{}_count{} {}'.format(name, labels, histogram.count))
+
+            for name, help_text, value in (
+                    ('pifx_rate_limit_remaining', 'Requests left in the rate limit window.',
+                     self.rate_limit_remaining),
+                    ('pifx_rate_limit', 'Requests allowed per rate limit window.',
+                     self.rate_limit_limit)):
+                if value is not None:
+                    lines.append('# HELP {} {}'.format(name, help_text))
+                    lines.append('# TYPE {} gauge'.format(name))
+                    lines.append('{} {}'.format(name, value))
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Compact result classes for API responses.
+
+Every class uses __slots__, so large snapshots take less memory and
+attribute access is faster than looking up keys in the raw dicts. Pass
+keep_raw=True to keep the original dict available as the raw attribute.
+"""
+
+from pifx.constants import A_RESULT_OFFLINE, A_RESULT_OK, A_RESULT_TIMED_OUT
+
+
+class Model(object):
+    __slots__ = ()
+
+    # attribute name => response key, for plain values
+    _fields = ()
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.get(name))
+
+    @classmethod
+    def from_dict(cls, data, keep_raw=False):
+        if data is None:
+            return None
+
+        model = cls(**dict((name, data.get(name)) for name in cls._fields))
+        if 'raw' in cls.__slots__ and keep_raw:
+            model.raw = data
+        return model
+
+    def to_dict(self):
+        data = dict()
+        for name in self.__slots__:
+            if name == 'raw':
+                continue
+            value = getattr(self, name)
+            if isinstance(value, Model):
+                value = value.to_dict()
+            data[name] = value
+        return data
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name))
+            for name in self.__slots__ if name != 'raw'))
+
+
+class Color(Model):
+    __slots__ = ('hue', 'saturation', 'kelvin')
+    _fields = __slots__
+
+
+class Group(Model):
+    __slots__ = ('id', 'name')
+    _fields = __slots__
+
+
+class Location(Model):
+    __slots__ = ('id', 'name')
+    _fields = __slots__
+
+
+class Light(Model):
+    __slots__ = ('id', 'uuid', 'label', 'connected', 'power', 'brightness',
+        'color', 'group', 'location', 'last_seen', 'seconds_since_seen', 'raw')
+    _fields = ('id', 'uuid', 'label', 'connected', 'power', 'brightness',
+        'last_seen', 'seconds_since_seen')
+
+    @classmethod
+    def from_dict(cls, data, keep_raw=False):
+        light = super(Light, cls).from_dict(data, keep_raw)
+        light.color = Color.from_dict(data.get('color'))
+        light.group = Group.from_dict(data.get('group'))
+        light.location = Location.from_dict(data.get('location'))
+        return light
+
+
+class Scene(Model):
+    __slots__ = ('uuid', 'name', 'states', 'created_at', 'updated_at', 'raw')
+    _fields = ('uuid', 'name', 'states', 'created_at', 'updated_at')
+
+
+class OperationResult(Model):
+    """Outcome of a write for a single light"""
+    __slots__ = ('id', 'label', 'status', 'raw')
+    _fields = ('id', 'label', 'status')
+
+    @property
+    def ok(self):
+        return self.status == A_RESULT_OK
+
+    @property
+    def timed_out(self):
+        return self.status == A_RESULT_TIMED_OUT
+
+    @property
+    def offline(self):
+        return self.status == A_RESULT_OFFLINE
+
+
+def iter_models(cls, items, keep_raw=False):
+    """Lazily convert response dicts to instances of cls"""
+    for item in items:
+        yield cls.from_dict(item, keep_raw)
+
+def parse_lights(lights, keep_raw=False):
+    return list(iter_models(Light, lights, keep_raw))
+
+def parse_scenes(scenes, keep_raw=False):
+    return list(iter_models(Scene, scenes, keep_raw))
+
+def parse_results(results, keep_raw=False):
+    """Convert write results, including the nested results of set_states"""
+    parsed = []
+    for result in results:
+        if 'operation' in result:
+            parsed.append({
+                'operation': result['operation'],
+                'results': parse_results(result.get('results', []), keep_raw),
+            })
+        else:
+            parsed.append(OperationResult.from_dict(result, keep_raw))
+    return parsed
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Durable queue of writes, sent in the background.
+
+.. code-block:: python
+
+    outbox = Outbox(LIFXWebAPIClient(api_key), 'pifx-outbox.db')
+    p = PIFX(client=outbox)
+    handle = p.set_state('label:Desk', power='on')  # returns immediately
+    handle.wait()
+
+Writes are stored in a SQLite database before being acknowledged, and a
+worker thread sends them by decreasing priority, then in order. Commands left pending when the process
+stopped are sent once an Outbox is opened on the same database again.
+Delivery is at least once: a command interrupted while being sent is sent
+again after a restart.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+from pifx.constants import A_MAX_STATES_PER_REQUEST
+from pifx.exceptions import PIFXError, RateLimited, ServerUnavailable
+from pifx.util import arg_tup_to_dict
+
+STATUS_PENDING = 'pending'
+STATUS_FAILED = 'failed'
+
+# errors after which a command is kept and sent again later
+RETRYABLE_ERRORS = (RateLimited, ServerUnavailable, IOError)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    request TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL
+)
+'''
+
+
+class OutboxHandle:
+    """Result of a write queued in an Outbox"""
+    def __init__(self, command_id):
+        self.id = command_id
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+        self._finished = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        """Return whether the command was sent or failed"""
+        return self._done.is_set()
+
+    def add_done_callback(self, callback):
+        """Call callback(handle) once the command was sent or failed, or
+        now if it already was."""
+        with self._lock:
+            if not self._finished:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        """Wait for the command to be sent, return its results or raise its
+        error. Raise PIFXError if timeout seconds pass first."""
+        if not self._done.wait(timeout):
+            raise PIFXError("Command {} still pending".format(self.id))
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def _finish(self, result=None, error=None):
+        with self._lock:
+            self.result = result
+            self.error = error
+            self._finished = True
+            callbacks, self._callbacks = self._callbacks, []
+        # before waiters wake up, so they see the effects of callbacks
+        for callback in callbacks:
+            callback(self)
+        self._done.set()
+
+    def __repr__(self):
+        return '<OutboxHandle {} {}>'.format(
+            self.id, 'done' if self.done() else STATUS_PENDING)
+
+
+class Outbox:
+    """Queue writes on disk and send them from a background thread.
+
+    Reads are passed straight to the wrapped client. Writes return an
+    OutboxHandle as soon as they are stored, and are sent by decreasing
+    priority, then in order. Consecutive set_state calls of the same
+    priority to distinct selectors are sent together as one set_states
+    request.
+    Failures the API may recover from (rate limiting, server errors,
+    connection errors) keep the command queued and retry it after a
+    delay; other errors fail it.
+
+    client: required Object
+        Client sending the requests, e.g a LIFXWebAPIClient.
+
+    path: String
+        Path of the SQLite database, or ':memory:' for a queue which does
+        not survive restarts.
+        default: ':memory:'
+
+    batch_size: Integer
+        Maximum number of set_state calls sent in one request.
+        default: 50
+
+    retry_delay: Double
+        Seconds to wait before retrying after a failure, doubled after each
+        further failure up to max_retry_delay, unless the API asked for a
+        specific delay.
+        default: 1.0
+
+    max_retry_delay: Double
+        default: 60.0
+
+    autostart: Boolean
+        If false, commands are only sent once start() is called.
+        default: true
+    """
+    def __init__(self, client, path=':memory:', batch_size=A_MAX_STATES_PER_REQUEST,
+        retry_delay=1.0, max_retry_delay=60.0, autostart=True):
+        self.client = client
+        self.path = path
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(_SCHEMA)
+        columns = [row[1] for row in self._db.execute('PRAGMA table_info(commands)')]
+        if 'priority' not in columns:
+            # created by a version without priorities
+            self._db.execute('ALTER TABLE commands '
+                             'ADD COLUMN priority INTEGER NOT NULL DEFAULT 0')
+        self._db.commit()
+        self._lock = threading.Lock()
+
+        # command id => OutboxHandle, for commands not yet finished
+        self._handles = dict()
+        self._wakeup = threading.Condition(self._lock)
+        self._running = False
+        self._stopping = threading.Event()
+        self._thread = None
+
+        if autostart:
+            self.start()
+
+    def __getattr__(self, name):
+        # expose the wrapped client's attributes (budget, queue_depth, ...)
+        if name == 'client':
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._work)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def close(self):
+        """Stop the worker and close the database. Pending commands stay
+        queued for the next Outbox opened on it."""
+        with self._lock:
+            self._running = False
+            self._stopping.set()
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._db.close()
+
+    def pending(self):
+        """Return the number of commands waiting to be sent"""
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM commands WHERE status = ?',
+                (STATUS_PENDING,)).fetchone()[0]
+
+    def failed(self):
+        """Return (id, request kwargs, error message) for failed commands"""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT id, request, error FROM commands WHERE status = ? '
+                'ORDER BY id', (STATUS_FAILED,)).fetchall()
+        return [(command_id, json.loads(request), error)
+                for command_id, request, error in rows]
+
+    def handle(self, command_id):
+        """Return the handle of a pending command, e.g one queued before a
+        restart, or None if it is no longer pending."""
+        with self._lock:
+            handle = self._handles.get(command_id)
+            if handle is None:
+                row = self._db.execute(
+                    'SELECT status FROM commands WHERE id = ?',
+                    (command_id,)).fetchone()
+                if row is None or row[0] != STATUS_PENDING:
+                    return None
+                handle = self._handles[command_id] = OutboxHandle(command_id)
+            return handle
+
+    def flush(self, timeout=None):
+        """Wait until every pending command was sent or failed, return
+        whether the queue is empty."""
+        deadline = None if timeout is None else time.time() + timeout
+        while self.pending():
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def perform_request(self, **request_kwargs):
+        if request_kwargs.get('method', '').lower() == 'get':
+            return self.client.perform_request(**request_kwargs)
+
+        request = json.dumps(request_kwargs)
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT INTO commands (request, status, priority, created) '
+                'VALUES (?, ?, ?, ?)', (request, STATUS_PENDING,
+                request_kwargs.get('priority') or 0, time.time()))
+            self._db.commit()
+            handle = self._handles[cursor.lastrowid] = OutboxHandle(cursor.lastrowid)
+            self._wakeup.notify_all()
+        return handle
+
+    def _next_batch(self):
+        """Return the next pending commands, by decreasing priority then
+        age, which can be sent as one request, as (id, request kwargs,
+        attempts) tuples."""
+        rows = self._db.execute(
+            'SELECT id, request, priority, attempts FROM commands '
+            'WHERE status = ? ORDER BY priority DESC, id LIMIT ?',
+            (STATUS_PENDING, self.batch_size)).fetchall()
+
+        batch = []
+        selectors_seen = set()
+        for command_id, request, priority, attempts in rows:
+            request = json.loads(request)
+            if not _is_batchable(request):
+                return batch or [(command_id, request, attempts)]
+            if priority != rows[0][2]:
+                # the batch is sent with the priority of its commands
+                break
+            selector = request['endpoint_args'][0]
+            if selector in selectors_seen:
+                # later writes to a selector must not overtake earlier ones
+                break
+            selectors_seen.add(selector)
+            batch.append((command_id, request, attempts))
+        return batch
+
+    def _send(self, batch):
+        """Send a batch of commands, return one (result, error) per command"""
+        if len(batch) == 1:
+            return [(self.client.perform_request(**batch[0][1]), None)]
+
+        states = []
+        for command_id, request, attempts in batch:
+            state = arg_tup_to_dict(request.get('argument_tuples') or [])
+            state['selector'] = request['endpoint_args'][0]
+            states.append(state)
+
+        results = self.client.perform_request(method='put',
+            endpoint='lights/states', argument_tuples=[('states', states)],
+            json_body=True, priority=batch[0][1].get('priority'))
+        return [(result.get('results', []), None) for result in results]
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while self._running and not self._db.execute(
+                        'SELECT 1 FROM commands WHERE status = ? LIMIT 1',
+                        (STATUS_PENDING,)).fetchone():
+                    self._wakeup.wait(1.0)
+                if not self._running:
+                    return
+                batch = self._next_batch()
+
+            try:
+                outcomes = self._send(batch)
+            except RETRYABLE_ERRORS as e:
+                self._retry_later(batch, e)
+                continue
+            except Exception as e:
+                outcomes = [(None, e)] * len(batch)
+
+            self._complete(batch, outcomes)
+
+    def _retry_later(self, batch, error):
+        with self._lock:
+            self._db.executemany(
+                'UPDATE commands SET attempts = attempts + 1, error = ? WHERE id = ?',
+                [(str(error), command_id) for command_id, _, _ in batch])
+            self._db.commit()
+
+        attempts = max(attempts for _, _, attempts in batch) + 1
+        delay = getattr(error, 'retry_after', None)
+        if delay is None:
+            delay = min(self.max_retry_delay,
+                self.retry_delay * (2 ** (attempts - 1)))
+        # interrupted by close()
+        self._stopping.wait(delay)
+
+    def _complete(self, batch, outcomes):
+        with self._lock:
+            for (command_id, _, _), (result, error) in zip(batch, outcomes):
+                if error is None:
+                    self._db.execute('DELETE FROM commands WHERE id = ?', (command_id,))
+                else:
+                    self._db.execute(
+                        'UPDATE commands SET status = ?, error = ? WHERE id = ?',
+                        (STATUS_FAILED, str(error), command_id))
+                handle = self._handles.pop(command_id, None)
+                if handle is not None:
+                    handle._finish(result, error)
+            self._db.commit()
+
+
+def _is_batchable(request):
+    # commands with a deadline are sent alone, so they can expire alone
+    return (request.get('endpoint') == 'lights/{}/state'
+            and request.get('method', '').lower() == 'put'
+            and not request.get('json_body')
+            and request.get('deadline') is None
+            and len(request.get('endpoint_args') or []) == 1)
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Spread requests over several LIFX accounts.
+
+.. code-block:: python
+
+    pool = ClientPool.from_keys(['token-1', 'token-2'])
+    p = PIFX(client=pool)
+    p.set_state('group:Kitchen', power='on')
+"""
+
+import itertools
+import threading
+from collections import OrderedDict
+
+from pifx import util
+from pifx import selector as selectors
+from pifx.client import LIFXWebAPIClient
+from pifx.exceptions import InvalidSelector
+
+
+def _headroom(client):
+    """Requests the client can send now, infinite when not yet known"""
+    budget = getattr(client, 'budget', None)
+    return float('inf') if budget is None else budget
+
+
+class ClientPool:
+    """Route requests to the clients of several API keys.
+
+    The pool learns which lights every key can see from list_lights
+    responses. Writes are sent to the key owning the selected lights; when
+    they are spread over several accounts, each key receives an id:
+    selector for its own lights, and a toggle becomes a set_state of the
+    power decided from all of them. Reads go to whichever key able to see the
+    lights has the most rate limit headroom. Selectors the pool cannot
+    evaluate locally are sent to every key, and their results merged.
+
+    The pool can be used anywhere a client is expected, e.g
+    PIFX(client=pool).
+
+    clients: required List
+        Clients to route requests to, usually LIFXWebAPIClients.
+    """
+    def __init__(self, clients):
+        if not clients:
+            raise ValueError("A client pool needs at least one client")
+
+        self.clients = list(clients)
+        self.requests = [0] * len(self.clients)
+
+        # light id => light dict, per client
+        self._lights = [OrderedDict() for client in self.clients]
+        # scene uuid => index of the client owning it
+        self._scene_owners = dict()
+        # rotated so that equally loaded clients share reads
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_keys(cls, api_keys, http_endpoint=None, **client_kwargs):
+        """Create a pool with one LIFXWebAPIClient per API key"""
+        return cls([LIFXWebAPIClient(api_key, http_endpoint, **client_kwargs)
+                    for api_key in api_keys])
+
+    def learn(self, index, lights, selector='all'):
+        """Record the lights a list_lights response of a client contained"""
+        with self._lock:
+            known = self._lights[index]
+            if selector == selectors.SELECTOR_ALL:
+                known.clear()
+            for light in lights:
+                known[light['id']] = light
+
+    def refresh(self):
+        """List the lights of every client, to learn which key owns them"""
+        for index in range(len(self.clients)):
+            try:
+                lights = self._send(index, method='get', endpoint='lights/{}',
+                    endpoint_args=[selectors.SELECTOR_ALL], parse_data=False)
+            except InvalidSelector:
+                lights = []
+            self.learn(index, lights)
+
+    def load(self):
+        """Return the load of every client, in the order of clients"""
+        with self._lock:
+            return [{
+                'requests': self.requests[index],
+                'budget': getattr(client, 'budget', None),
+                'queue_depth': getattr(client, 'queue_depth', 0),
+                'lights': len(self._lights[index]),
+            } for index, client in enumerate(self.clients)]
+
+    def _send(self, index, **request_kwargs):
+        with self._lock:
+            self.requests[index] += 1
+        return self.clients[index].perform_request(**request_kwargs)
+
+    def _by_headroom(self, indexes):
+        """Order client indexes by decreasing headroom, rotating ties"""
+        indexes = list(indexes)
+        turn = next(self._turn)
+        rotation = dict((index, (position - turn) % len(indexes))
+                        for position, index in enumerate(indexes))
+        return sorted(indexes, key=lambda index: (
+            -_headroom(self.clients[index]), rotation[index]))
+
+    def _owned(self, selector):
+        """Return the ids matched by selector that each client owns, as a
+        list of (index, ids) pairs, or None if unknown."""
+        with self._lock:
+            if not any(self._lights):
+                return None
+            owned = []
+            for index, known in enumerate(self._lights):
+                lights = selectors.filter_lights(list(known.values()), selector)
+                if lights is None:
+                    return None
+                if lights:
+                    owned.append((index, [light['id'] for light in lights]))
+        return owned
+
+    def _assign(self, selector):
+        """Given a selector, return (index, selector) pairs covering every
+        light it matches with as few clients as possible, or None if the
+        selector cannot be evaluated locally."""
+        owned = self._owned(selector)
+        if not owned:
+            return None
+        owned = OrderedDict(owned)
+
+        all_ids = set(itertools.chain.from_iterable(owned.values()))
+        candidates = self._by_headroom(owned)
+        for index in candidates:
+            if set(owned[index]) == all_ids:
+                return [(index, selector)]
+
+        # give each light to its owner with the most headroom
+        assignment = OrderedDict()
+        for index in candidates:
+            ids = [light_id for light_id in owned[index] if light_id in all_ids]
+            if ids:
+                assignment[index] = selectors.id_selector(ids)
+                all_ids.difference_update(ids)
+        return list(assignment.items())
+
+    def _fan_out(self, targets, request_kwargs):
+        """Send a request to several clients, each with its own selector.
+        Return (index, response) pairs, skipping clients whose selector
+        matched no lights unless none matched."""
+        responses = []
+        error = None
+        for index, selector in targets:
+            kwargs = dict(request_kwargs)
+            if selector is not None:
+                kwargs['endpoint_args'] = [selector]
+            try:
+                responses.append((index, self._send(index, **kwargs)))
+            except InvalidSelector as e:
+                error = e
+        if not responses and error is not None:
+            raise error
+        return responses
+
+    def _toggle(self, targets, request_kwargs):
+        """Toggle lights spread over several clients. The API turns every
+        light off when any is on, so the power is decided from the lights
+        of all clients, then set on each client's lights, instead of each
+        client toggling its own lights. Return (index, response) pairs."""
+        lights = []
+        for index, client_lights in self._fan_out(targets, dict(request_kwargs,
+                method='get', endpoint='lights/{}', argument_tuples=None,
+                parse_data=False)):
+            lights.extend(client_lights)
+
+        argument_tuples = [('power', util.toggled_power(lights))]
+        argument_tuples.extend(request_kwargs.get('argument_tuples') or [])
+        return self._fan_out(targets, dict(request_kwargs,
+            method='put', endpoint='lights/{}/state',
+            argument_tuples=argument_tuples))
+
+    def _list_lights(self, request_kwargs):
+        selector = request_kwargs.get('endpoint_args', [selectors.SELECTOR_ALL])[0]
+        stream = request_kwargs.get('stream', False)
+
+        targets = self._assign(selector)
+        if targets is not None and len(targets) == 1:
+            index, selector = targets[0]
+            lights = self._send(index, **request_kwargs)
+            if not stream:
+                self.learn(index, lights, selector)
+            return lights
+
+        if targets is None:
+            targets = [(index, selector) for index in range(len(self.clients))]
+
+        request_kwargs = dict(request_kwargs, stream=False)
+        merged = OrderedDict()
+        for index, lights in self._fan_out(targets, request_kwargs):
+            self.learn(index, lights, selector)
+            for light in lights:
+                merged.setdefault(light['id'], light)
+
+        lights = list(merged.values())
+        return iter(lights) if stream else lights
+
+    def _list_scenes(self, request_kwargs):
+        scenes = []
+        for index, client_scenes in self._fan_out(
+                [(index, None) for index in range(len(self.clients))],
+                request_kwargs):
+            for scene in client_scenes:
+                with self._lock:
+                    self._scene_owners[scene['uuid']] = index
+                scenes.append(scene)
+        return scenes
+
+    def _set_states(self, request_kwargs):
+        arguments = dict(request_kwargs['argument_tuples'])
+        defaults = arguments.get('defaults')
+
+        # client index => list of (operation position, state)
+        per_client = OrderedDict()
+        for position, state in enumerate(arguments['states']):
+            targets = self._assign(state['selector'])
+            if targets is None:
+                targets = [(index, state['selector'])
+                           for index in range(len(self.clients))]
+            for index, selector in targets:
+                per_client.setdefault(index, []).append(
+                    (position, dict(state, selector=selector)))
+
+        results = [{'operation': state, 'results': []}
+                   for state in arguments['states']]
+        for index, entries in per_client.items():
+            client_results = self._send(index, **dict(request_kwargs,
+                argument_tuples=[('states', [state for _, state in entries]),
+                                 ('defaults', defaults)]))
+            for (position, _), result in zip(entries, client_results):
+                results[position]['results'].extend(result.get('results') or [])
+
+        return results
+
+    def perform_request(self, **request_kwargs):
+        endpoint = request_kwargs['endpoint']
+        method = request_kwargs['method']
+
+        if method == 'get' and endpoint == 'lights/{}':
+            return self._list_lights(request_kwargs)
+        if method == 'get' and endpoint == 'scenes':
+            return self._list_scenes(request_kwargs)
+        if endpoint == 'lights/states':
+            return self._set_states(request_kwargs)
+
+        if endpoint.startswith('scenes/'):
+            owner = self._scene_owners.get(request_kwargs['endpoint_args'][0])
+            if owner is None:
+                targets = [(index, None) for index in range(len(self.clients))]
+            else:
+                targets = [(owner, None)]
+        else:
+            selector = request_kwargs['endpoint_args'][0]
+            targets = self._assign(selector)
+            if targets is None:
+                targets = [(index, selector) for index in range(len(self.clients))]
+
+        if endpoint == 'lights/{}/toggle' and len(targets) > 1:
+            responses = self._toggle(targets, request_kwargs)
+        else:
+            responses = self._fan_out(targets, request_kwargs)
+        if len(responses) == 1:
+            return responses[0][1]
+
+        results = []
+        for index, response in responses:
+            results.extend(response)
+        return results
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import heapq
+import itertools
+import threading
+import time
+
+from pifx.constants import (
+    A_HEADER_RATE_LIMIT, A_HEADER_RATE_LIMIT_REMAINING,
+    A_HEADER_RATE_LIMIT_RESET, A_RATE_LIMIT_PERIOD
+)
+from pifx.exceptions import DeadlineExceeded
+
+# see http://api.developer.lifx.com/v1/docs/rate-limits
+HEADER_LIMIT = A_HEADER_RATE_LIMIT
+HEADER_REMAINING = A_HEADER_RATE_LIMIT_REMAINING
+HEADER_RESET = A_HEADER_RATE_LIMIT_RESET
+
+
+class RateLimiter:
+    """Token bucket pacing requests made with a single API key.
+
+    The bucket is sized from the X-RateLimit-* headers of API responses and
+    refills at limit / period tokens per second. Until the first response is
+    seen the quota is unknown and requests are not delayed. When the API
+    reports no remaining requests, callers wait for the advertised reset.
+    Waiting callers are served by decreasing priority, then in arrival
+    order, and give up once they cannot be served before their deadline.
+
+    budget: Integer
+        Whole requests that can be sent right now without waiting, or None
+        when the quota is not yet known.
+
+    queue_depth: Integer
+        Number of callers currently waiting for budget.
+    """
+    def __init__(self, period=A_RATE_LIMIT_PERIOD, clock=time.time,
+        sleep=time.sleep):
+        self.period = period
+        self.limit = None
+        self.reset_time = None
+        self.queue_depth = 0
+
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = None
+        self._last_refill = clock()
+        self._blocked_until = None
+        self._lock = threading.Lock()
+
+        # heap of (-priority, arrival) tickets of waiting callers
+        self._waiters = []
+        self._arrivals = itertools.count()
+
+    @property
+    def budget(self):
+        with self._lock:
+            self._refill()
+            if self._tokens is None:
+                return None
+            if self._blocked_until is not None:
+                return 0
+            return int(self._tokens)
+
+    def _refill(self):
+        now = self._clock()
+        if self._blocked_until is not None and now >= self._blocked_until:
+            self._blocked_until = None
+            self._tokens = float(self.limit or 1)
+
+        if self._tokens is not None and self.limit:
+            elapsed = max(0.0, now - self._last_refill)
+            rate = float(self.limit) / self.period
+            self._tokens = min(float(self.limit), self._tokens + elapsed * rate)
+
+        self._last_refill = now
+
+    def _try_acquire(self, ticket=None):
+        """Take a token if one is available and no caller with a better
+        ticket is waiting. Otherwise return the number of seconds to wait
+        before trying again."""
+        with self._lock:
+            self._refill()
+
+            if self._blocked_until is not None:
+                return self._blocked_until - self._clock()
+
+            if self._tokens is None:
+                return 0
+
+            rate = float(self.limit) / self.period
+            if self._waiters and self._waiters[0] != ticket:
+                # a token is needed for each caller ahead of this one
+                ahead = sum(1 for waiter in self._waiters if waiter < ticket) \
+                    if ticket is not None else len(self._waiters)
+                return max(1.0 / rate, (ahead + 1 - self._tokens) / rate)
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+
+            return (1 - self._tokens) / rate
+
+    def acquire(self, priority=0, deadline=None):
+        """Block until a request may be sent, then consume one token.
+
+        priority: Integer
+            Callers with a higher priority are served first.
+            default: 0
+
+        deadline: Double
+            Unix time after which the request is useless. Raise
+            DeadlineExceeded instead of waiting past it.
+        """
+        wait = self._try_acquire()
+        if wait <= 0:
+            return
+
+        ticket = (-priority, next(self._arrivals))
+        with self._lock:
+            heapq.heappush(self._waiters, ticket)
+            self.queue_depth += 1
+        try:
+            while wait > 0:
+                if deadline is not None and self._clock() + wait > deadline:
+                    raise DeadlineExceeded(
+                        "Rate limit budget not available before the deadline")
+                self._sleep(wait)
+                wait = self._try_acquire(ticket)
+        finally:
+            with self._lock:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self.queue_depth -= 1
+
+    def update(self, headers):
+        """Synchronize the bucket with the rate limit headers of a response."""
+        try:
+            limit = int(headers[HEADER_LIMIT])
+            remaining = int(headers[HEADER_REMAINING])
+        except (KeyError, TypeError, ValueError):
+            return
+
+        reset_time = None
+        try:
+            reset_time = float(headers[HEADER_RESET])
+        except (KeyError, TypeError, ValueError):
+            pass
+
+        with self._lock:
+            self._refill()
+            self.limit = limit
+            self.reset_time = reset_time
+
+            if self._tokens is None:
+                self._tokens = float(remaining)
+            else:
+                self._tokens = min(self._tokens, float(remaining))
+
+            if remaining <= 0:
+                if reset_time is None:
+                    reset_time = self._clock() + self.period
+                self._blocked_until = reset_time
+                self._tokens = 0.0
+
+
+_limiters = dict()
+_limiters_lock = threading.Lock()
+
+def limiter_for_key(api_key):
+    """Return the RateLimiter shared by all clients using api_key"""
+    with _limiters_lock:
+        limiter = _limiters.get(api_key)
+        if limiter is None:
+            limiter = _limiters[api_key] = RateLimiter()
+        return limiter
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import random
+import time
+
+from pifx.constants import (
+    A_IDEMPOTENT_HTTP_METHODS, A_RESULT_TIMED_OUT, A_RETRY_HTTP_CODES
+)
+from pifx.exceptions import server_retry_delay
+
+
+class RetryPolicy:
+    """Decide whether and when a failed request is sent again.
+
+    Only idempotent HTTP methods are retried unless a request is explicitly
+    marked as retryable. Delays use exponential backoff with full jitter,
+    but never less than the server asked for via Retry-After or, for rate
+    limited requests, X-RateLimit-Reset.
+
+    max_attempts: Integer
+        Total number of attempts, including the first one.
+        default: 3
+
+    backoff_base: Double
+        Delay cap in seconds after the first failed attempt; doubled after
+        each further failure.
+        default: 0.5
+
+    backoff_cap: Double
+        Maximum delay in seconds between two attempts.
+        default: 30.0
+
+    retry_statuses: List of Integers
+        HTTP status codes considered transient.
+        default: 429, 500, 502, 503, 523
+    """
+    def __init__(self, max_attempts=3, backoff_base=0.5, backoff_cap=30.0,
+        retry_statuses=A_RETRY_HTTP_CODES, retry_methods=A_IDEMPOTENT_HTTP_METHODS,
+        sleep=time.sleep, clock=time.time, random=random.random):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retry_statuses = retry_statuses
+        self.retry_methods = retry_methods
+
+        self.sleep = sleep
+        self._clock = clock
+        self._random = random
+
+    def should_retry(self, method, attempt, status_code=None, retry=None):
+        """Given a request method, the attempt that just failed (starting at 1)
+        and its status code (None for connection errors), return whether the
+        request should be sent again. retry=True/False overrides the
+        idempotency check."""
+        if attempt >= self.max_attempts:
+            return False
+
+        if status_code is not None and status_code not in self.retry_statuses:
+            return False
+
+        if retry is not None:
+            return retry
+
+        return method.lower() in self.retry_methods
+
+    def backoff(self, attempt, headers=None, status_code=None):
+        """Return the number of seconds to wait after the given failed attempt,
+        given the headers and status code of its response, if any"""
+        ceiling = min(self.backoff_cap, self.backoff_base * (2 ** (attempt - 1)))
+        delay = self._random() * ceiling
+
+        server_delay = server_retry_delay(headers or {}, status_code == 429,
+            self._clock)
+        if server_delay is not None:
+            delay = max(delay, min(server_delay, self.backoff_cap))
+
+        return delay
+
+
+# writes which can be sent again to a subset of their lights with the same
+# outcome; a toggle of fewer lights could pick the opposite power state, and
+# a timed out light may have applied a delta already, which would add twice
+REISSUE_ENDPOINTS = (
+    'lights/{}/state',
+    'lights/states',
+    'lights/{}/effects/breathe',
+    'lights/{}/effects/pulse',
+)
+
+
+class ReissuePolicy:
+    """Decide whether a write is sent again to the lights which did not
+    apply it.
+
+    A 207 Multi-Status response reports the status of each light. When
+    some lights timed out, the write is re-issued with an id: selector
+    listing only those lights, rather than to the whole selector.
+
+    max_attempts: Integer
+        Total number of attempts, including the first one.
+        default: 2
+
+    statuses: List of Strings
+        Per-light result statuses worth another attempt. Offline lights
+        are not retried by default, as they rarely come back within seconds.
+        default: timed_out
+
+    delay: Double
+        Seconds to wait before each re-issue.
+        default: 0
+
+    endpoints: List of Strings
+        Endpoint templates of the writes which may be re-issued. Add
+        'lights/{}/state/delta' to re-issue deltas when applying one twice
+        to a light is acceptable.
+        default: REISSUE_ENDPOINTS
+    """
+    def __init__(self, max_attempts=2, statuses=(A_RESULT_TIMED_OUT,),
+        delay=0.0, sleep=time.sleep, endpoints=REISSUE_ENDPOINTS):
+        self.max_attempts = max_attempts
+        self.statuses = statuses
+        self.delay = delay
+        self.sleep = sleep
+        self.endpoints = endpoints
+
+    def should_reissue(self, endpoint, attempt):
+        """Given a write endpoint and the attempt that just completed
+        (starting at 1), return whether failed lights may be re-issued."""
+        return endpoint in self.endpoints and attempt < self.max_attempts
+
+    def failed_ids(self, results):
+        """Given per-light results, return the ids of lights to re-issue to"""
+        return [result['id'] for result in results or []
+                if result.get('status') in self.statuses and result.get('id')]
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Client-side scenes which only send the changes they need.
+
+A scene maps light ids to target states (power, color, brightness, as
+for set_state). Compared with the current state of the lights, it
+compiles to set_states operations covering only what differs, with the
+lights sharing the same changes grouped into one selector.
+
+.. code-block:: python
+
+    targets = dict((light_id, {'power': 'on', 'color': 'kelvin:2700',
+                               'brightness': 0.4}) for light_id in ids)
+    p.apply_scene(targets, duration=2.0)
+"""
+
+from collections import OrderedDict
+
+from pifx import selector as selectors
+from pifx.color import parse_color
+
+# differences smaller than these are not visible, and within the rounding
+# of the values reported by bulbs
+HUE_TOLERANCE = 0.5
+LEVEL_TOLERANCE = 0.005
+KELVIN_TOLERANCE = 10
+
+
+def _target_components(state):
+    """Return the color components and brightness a target state sets"""
+    components = dict()
+    if state.get('color') is not None:
+        components.update(parse_color(state['color']))
+    if state.get('brightness') is not None:
+        components['brightness'] = float(state['brightness'])
+    return components
+
+def _differs(name, current, target):
+    if current is None:
+        return True
+    if name == 'hue':
+        delta = abs(current - target) % 360.0
+        return min(delta, 360.0 - delta) > HUE_TOLERANCE
+    if name == 'kelvin':
+        return abs(current - target) > KELVIN_TOLERANCE
+    return abs(current - target) > LEVEL_TOLERANCE
+
+def light_changes(light, state):
+    """Given a list_lights light dict and a target state, return the
+    set_state arguments needed to reach the target, which is empty if
+    the light already matches it."""
+    changes = dict()
+
+    if state.get('power') is not None and light.get('power') != state['power']:
+        changes['power'] = state['power']
+
+    color = light.get('color') or {}
+    current = {
+        'hue': color.get('hue'),
+        'saturation': color.get('saturation'),
+        'kelvin': color.get('kelvin'),
+        'brightness': light.get('brightness'),
+    }
+
+    color_changes = OrderedDict()
+    for name, value in sorted(_target_components(state).items()):
+        if not _differs(name, current[name], value):
+            continue
+        if name == 'brightness':
+            changes['brightness'] = value
+        else:
+            color_changes[name] = value
+
+    if color_changes:
+        changes['color'] = ' '.join(
+            '{}:{:g}'.format(name, value) for name, value in color_changes.items())
+
+    return changes
+
+def diff_scene(lights, targets):
+    """Compile a scene into set_states operations.
+
+    lights: required List of Dicts
+        Current state of the lights, as returned by list_lights.
+
+    targets: required Dict
+        Light id => target state, with set_state arguments.
+
+    Lights already in their target state are left out, as are lights
+    which are not connected. Lights missing from lights receive their full
+    target state. Lights needing the same changes share one operation.
+    """
+    current = dict((light['id'], light) for light in lights)
+
+    # changes => ids of the lights needing them, in order of first use
+    groups = OrderedDict()
+    for light_id, state in targets.items():
+        light = current.get(light_id)
+        if light is None:
+            changes = dict((name, value) for name, value in state.items()
+                           if value is not None)
+        elif light.get('connected') is False:
+            continue
+        else:
+            changes = light_changes(light, state)
+
+        if changes:
+            groups.setdefault(tuple(sorted(changes.items())), []).append(light_id)
+
+    operations = []
+    for changes, light_ids in groups.items():
+        operation = dict(changes)
+        operation['selector'] = selectors.id_selector(light_ids)
+        operations.append(operation)
+
+    return operations
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Client-side evaluation of LIFX selectors against list_lights results.
+See http://api.developer.lifx.com/v1/docs/selectors
+"""
+
+SELECTOR_ALL = 'all'
+
+# selector type => function returning the matching value(s) of a light
+SELECTOR_FIELDS = {
+    'id': lambda light: light.get('id'),
+    'label': lambda light: light.get('label'),
+    'group_id': lambda light: (light.get('group') or {}).get('id'),
+    'group': lambda light: (light.get('group') or {}).get('name'),
+    'location_id': lambda light: (light.get('location') or {}).get('id'),
+    'location': lambda light: (light.get('location') or {}).get('name'),
+}
+
+
+def parse_selector(selector):
+    """Given a selector string, return a list of (type, value) tuples,
+    one per comma separated part. Zone suffixes (e.g `|0-5`) are dropped.
+    Returns None if any part uses a selector type that cannot be
+    evaluated locally."""
+    parts = []
+    for part in selector.split(','):
+        part = part.strip()
+        if part == SELECTOR_ALL:
+            parts.append((SELECTOR_ALL, None))
+            continue
+
+        if ':' not in part:
+            return None
+
+        selector_type, value = part.split(':', 1)
+        if selector_type not in SELECTOR_FIELDS:
+            return None
+
+        parts.append((selector_type, value.split('|', 1)[0]))
+
+    return parts
+
+def light_matches(light, parsed_selector):
+    """Return whether a light dict matches a parsed selector"""
+    for selector_type, value in parsed_selector:
+        if selector_type == SELECTOR_ALL:
+            return True
+        if SELECTOR_FIELDS[selector_type](light) == value:
+            return True
+
+    return False
+
+def filter_lights(lights, selector):
+    """Given a list of light dicts and a selector, return the matching lights,
+    or None if the selector cannot be evaluated locally."""
+    parsed_selector = parse_selector(selector)
+    if parsed_selector is None:
+        return None
+
+    return [light for light in lights if light_matches(light, parsed_selector)]
+
+def id_selector(light_ids):
+    """Return a selector matching exactly the given light ids"""
+    return ','.join('id:{}'.format(light_id) for light_id in light_ids)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import copy
+import threading
+from collections import OrderedDict
+
+from pifx import util
+from pifx import selector as selectors
+from pifx.color import parse_color
+from pifx.constants import A_RESULT_OK
+
+
+class StateStore:
+    """Local copy of the state of lights, predicted after writes.
+
+    The store is seeded and reconciled with every real list_lights
+    response. Writes update it from their parameters, for the lights their
+    results report as ok, so reads after writes need no request. Lights
+    whose new state cannot be predicted (cycles, scenes, unparseable
+    colors) are marked stale until the next real response.
+
+    Only selectors the store has read are answered locally: every selector
+    once all lights were listed, otherwise only the selectors listed so
+    far, as lights it has not seen may match any other.
+    """
+    def __init__(self):
+        self._lights = OrderedDict()
+        self._stale = set()
+        # whether all lights were listed, and which selectors were listed
+        self._complete = False
+        self._covered = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lights)
+
+    def reconcile(self, lights, selector='all'):
+        """Replace predicted state with a real list_lights response"""
+        with self._lock:
+            if selector == selectors.SELECTOR_ALL:
+                self._lights.clear()
+                self._stale.clear()
+                self._complete = True
+                self._covered.clear()
+            else:
+                self._covered.add(selector)
+
+            for light in lights:
+                self._lights[light['id']] = copy.deepcopy(light)
+                self._stale.discard(light['id'])
+
+    def get(self, selector='all'):
+        """Return copies of the stored lights matching selector, or None if
+        their state is not known locally."""
+        with self._lock:
+            if not self._lights or not self._knows(selector):
+                return None
+
+            lights = selectors.filter_lights(list(self._lights.values()), selector)
+            if not lights:
+                return None
+            if any(light['id'] in self._stale for light in lights):
+                return None
+
+            return copy.deepcopy(lights)
+
+    def _knows(self, selector):
+        """Whether every light matching selector is stored"""
+        return self._complete or selector in self._covered
+
+    def _matched(self, selector, results):
+        lights = selectors.filter_lights(list(self._lights.values()), selector)
+        if lights is None:
+            return None
+
+        if results:
+            ok_ids = set(result.get('id') for result in results
+                         if result.get('status') == A_RESULT_OK)
+            lights = [light for light in lights if light['id'] in ok_ids]
+
+        return lights
+
+    def _mark_stale(self, selector):
+        lights = selectors.filter_lights(list(self._lights.values()), selector)
+        if lights is None:
+            self._stale.update(self._lights)
+        else:
+            self._stale.update(light['id'] for light in lights)
+
+    def _apply_state(self, light, data):
+        if data.get('power') is not None:
+            light['power'] = data['power']
+
+        if data.get('color') is not None:
+            try:
+                components = parse_color(data['color'])
+            except ValueError:
+                self._stale.add(light['id'])
+                return
+
+            color = light.setdefault('color', dict())
+            for name in ('hue', 'saturation', 'kelvin'):
+                if name in components:
+                    color[name] = components[name]
+            if 'brightness' in components:
+                light['brightness'] = components['brightness']
+
+        if data.get('brightness') is not None:
+            light['brightness'] = float(data['brightness'])
+
+    def _apply_delta(self, light, data):
+        if data.get('power') is not None:
+            light['power'] = data['power']
+
+        color = light.setdefault('color', dict())
+        if data.get('hue') is not None:
+            color['hue'] = (color.get('hue', 0) + float(data['hue'])) % 360
+        if data.get('saturation') is not None:
+            color['saturation'] = util.clip(
+                color.get('saturation', 0) + float(data['saturation']), 0.0, 1.0)
+        if data.get('kelvin') is not None:
+            color['kelvin'] = util.clip(
+                color.get('kelvin', 3500) + float(data['kelvin']), 2500, 9000)
+        if data.get('brightness') is not None:
+            light['brightness'] = util.clip(
+                light.get('brightness', 0) + float(data['brightness']), 0.0, 1.0)
+
+    def _apply(self, selector, data, results, apply_light):
+        lights = self._matched(selector, results)
+        if lights is None:
+            self._mark_stale(selector)
+            return
+
+        for light in lights:
+            apply_light(light, data)
+
+    def apply_write(self, endpoint, selector, data, results):
+        """Predict the state of lights after a write.
+
+        endpoint: required String
+            The endpoint template written to, e.g 'lights/{}/state'.
+
+        selector: required String
+            The selector written to.
+
+        data: required Dict
+            The request parameters.
+
+        results: List of Dicts
+            The per-light results returned by the API.
+        """
+        with self._lock:
+            if endpoint == 'lights/{}/state':
+                self._apply(selector, data, results, self._apply_state)
+
+            elif endpoint == 'lights/states':
+                defaults = data.get('defaults') or {}
+                for index, state in enumerate(data.get('states', [])):
+                    operation = dict(defaults)
+                    operation.update(state)
+                    # without results, every matched light is assumed updated
+                    operation_results = None
+                    if results:
+                        if index >= len(results):
+                            break
+                        operation_results = results[index].get('results')
+                    self._apply(operation['selector'], operation,
+                        operation_results, self._apply_state)
+
+            elif endpoint == 'lights/{}/state/delta':
+                self._apply(selector, data, results, self._apply_delta)
+
+            elif endpoint == 'lights/{}/toggle':
+                # the new power depends on every light matched
+                lights = None
+                if self._knows(selector):
+                    lights = selectors.filter_lights(
+                        list(self._lights.values()), selector)
+                if lights is None:
+                    self._mark_stale(selector)
+                    return
+                self._apply(selector, {'power': util.toggled_power(lights)},
+                    results, self._apply_state)
+
+            elif endpoint in ('lights/{}/effects/breathe', 'lights/{}/effects/pulse'):
+                # effects restore the previous color unless persisted
+                if util.is_true(data.get('persist')):
+                    self._apply(selector, {'color': data.get('color')},
+                        results, self._apply_state)
+                if util.is_true(data.get('power_on', True)):
+                    self._apply(selector, {'power': 'on'}, results, self._apply_state)
+
+            else:
+                self._mark_stale(selector)
@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Local stand-ins for LIFX devices and services, for testing code using
+PIFX without real hardware or network access."""
+
+import binascii
+import copy
+import json
+import math
+import socket
+import threading
+import time
+import uuid
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import parse_qsl, unquote
+
+from pifx import lan, util
+from pifx import selector as selectors
+from pifx.color import InvalidColor, parse_color
+
+
+class FakeBulb:
+    """UDP stand-in for a LIFX bulb speaking the LAN protocol.
+
+    The bulb listens on host:port (an ephemeral port by default) and
+    answers discovery, Get, SetColor, SetPower and SetWaveform messages.
+    Its current state is exposed as attributes, and every message type
+    received is appended to received.
+
+    .. code-block:: python
+
+        bulb = FakeBulb(label='Desk').start()
+        client = LIFXLANClient(discovery_addresses=[bulb.address])
+    """
+    def __init__(self, light_id='d073d5000001', label='Bulb',
+        group=('Group', 'a' * 32), location=('Location', 'b' * 32),
+        host='127.0.0.1', port=0, hsbk=(0, 0, 65535, 3500), power=0):
+        self.light_id = light_id
+        self.label = label
+        self.group = group
+        self.location = location
+        self.hsbk = hsbk
+        self.power = power
+        self.waveform = None
+        self.received = []
+        # set to False to simulate a bulb which stopped answering
+        self.responding = True
+
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind((host, port))
+        self._sock.settimeout(0.05)
+        self.address = self._sock.getsockname()
+
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        self._sock.close()
+
+    def _serve(self):
+        while self._running:
+            try:
+                data, address = self._sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+
+            packet = lan.decode_packet(data)
+            if not packet.tagged and lan.target_to_id(packet.target) != self.light_id:
+                continue
+
+            self.received.append(packet.msg_type)
+            if not self.responding:
+                continue
+
+            for msg_type, payload in self._handle(packet):
+                self._sock.sendto(lan.encode_packet(msg_type, payload,
+                    target=lan.id_to_target(self.light_id),
+                    source=packet.source, sequence=packet.sequence), address)
+
+    def _state(self):
+        return (lan.MSG_LIGHT_STATE, self.hsbk + (
+            0, self.power, lan.encode_label(self.label), 0))
+
+    def _handle(self, packet):
+        responses = []
+        msg_type = packet.msg_type
+        payload = packet.payload
+
+        if msg_type == lan.MSG_GET_SERVICE:
+            responses.append((lan.MSG_STATE_SERVICE,
+                (lan.SERVICE_UDP, self.address[1])))
+        elif msg_type == lan.MSG_LIGHT_GET:
+            responses.append(self._state())
+        elif msg_type in (lan.MSG_GET_GROUP, lan.MSG_GET_LOCATION):
+            name, uid = self.group if msg_type == lan.MSG_GET_GROUP else self.location
+            state_type = lan.MSG_STATE_GROUP if msg_type == lan.MSG_GET_GROUP \
+                else lan.MSG_STATE_LOCATION
+            responses.append((state_type,
+                (binascii.unhexlify(uid), lan.encode_label(name), 0)))
+        elif msg_type == lan.MSG_SET_COLOR:
+            self.hsbk = tuple(payload[1:5])
+            if packet.flags & lan.FLAG_RES_REQUIRED:
+                responses.append(self._state())
+        elif msg_type == lan.MSG_LIGHT_SET_POWER:
+            self.power = payload[0]
+            if packet.flags & lan.FLAG_RES_REQUIRED:
+                responses.append((lan.MSG_LIGHT_STATE_POWER, (self.power,)))
+        elif msg_type == lan.MSG_SET_WAVEFORM:
+            self.waveform = payload
+            transient = payload[1]
+            if not transient:
+                self.hsbk = tuple(payload[2:6])
+
+        if packet.flags & lan.FLAG_ACK_REQUIRED:
+            responses.insert(0, (lan.MSG_ACKNOWLEDGEMENT, ()))
+
+        return responses
+
+
+def make_lights(count, groups=4, locations=2):
+    """Return count list_lights style dicts spread over groups and locations"""
+    lights = []
+    for i in range(count):
+        lights.append({
+            'id': 'd073d5{:06x}'.format(i),
+            'uuid': str(uuid.UUID(int=i)),
+            'label': 'Light {}'.format(i),
+            'connected': True,
+            'power': 'off',
+            'color': {'hue': 0.0, 'saturation': 0.0, 'kelvin': 3500},
+            'brightness': 1.0,
+            'group': {'id': '{:032x}'.format(i % groups),
+                      'name': 'Group {}'.format(i % groups)},
+            'location': {'id': '{:032x}'.format(1000 + i % locations),
+                         'name': 'Location {}'.format(i % locations)},
+            'product': {'name': 'LIFX A19', 'capabilities': {'has_color': True}},
+            'seconds_since_seen': 0,
+        })
+    return lights
+
+
+class FakeClock:
+    """Clock which only moves when told to, for the clock and sleep
+    arguments of caches, rate limiters and animators."""
+    def __init__(self, now=0.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class LightsClient:
+    """In-process stand-in for an API client, for PIFX(client=...).
+
+    list_lights requests return copies of lights, whatever the selector,
+    and writes return results (by default ok for every light). Every
+    request's keyword arguments are appended to requests.
+    """
+    def __init__(self, lights, results=None):
+        self.lights = copy.deepcopy(lights)
+        self.results = results
+        self.requests = []
+
+    def perform_request(self, **kwargs):
+        self.requests.append(kwargs)
+        if kwargs['method'] == 'get':
+            return copy.deepcopy(self.lights)
+        if self.results is not None:
+            return self.results
+        return [{'id': light['id'], 'status': 'ok'} for light in self.lights]
+
+
+class _MockAPIHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+        if not body:
+            return dict()
+        if 'json' in (self.headers.get('Content-Type') or ''):
+            return json.loads(body)
+        return dict(parse_qsl(body))
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        api = self.server.api
+        body = self._read_body()
+
+        status, response, headers = api.handle(
+            self.command, self.path, body, self.headers.get('Authorization'))
+        self._send_json(status, response, headers)
+
+    do_GET = do_PUT = do_POST = do_DELETE = _handle
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients closing keep-alive connections are not errors
+        pass
+
+
+class MockLIFXServer:
+    """Local HTTP stand-in for the LIFX v1 API.
+
+    Serves list_lights, list_scenes and every write endpoint for a
+    generated fleet of lights, applying set_state changes so they show up
+    in later reads. Latency, rate limiting and server errors can be
+    configured to measure client behaviour under realistic conditions.
+
+    .. code-block:: python
+
+        with MockLIFXServer(light_count=500, latency=0.02) as server:
+            p = PIFX('token', http_endpoint=server.endpoint)
+
+    light_count: Integer
+        Number of lights generated.
+        default: 10
+
+    latency: Double
+        Seconds added to every response.
+        default: 0
+
+    rate_limit: Integer
+        Requests allowed per rate_limit_period before answering 429, or
+        None for no limit.
+
+    error_rate: Double
+        Fraction of requests answered with a 503 error.
+        default: 0
+
+    lights: List of Dicts
+        Lights to serve instead of generating light_count of them.
+    """
+    def __init__(self, light_count=10, latency=0.0, rate_limit=None,
+        rate_limit_period=60.0, error_rate=0.0, lights=None, host='127.0.0.1', port=0):
+        self.lights = lights if lights is not None else make_lights(light_count)
+        self.scenes = [{
+            'uuid': str(uuid.UUID(int=1)), 'name': 'All on',
+            'states': [{'selector': 'all', 'power': 'on'}],
+        }]
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_period = rate_limit_period
+        self.error_rate = error_rate
+
+        # (method, path) of every request received
+        self.requests = []
+
+        # ids of lights which writes report as timed out or offline
+        self.timed_out_ids = set()
+        self.offline_ids = set()
+
+        self._error_accumulator = 0.0
+        self._window_start = time.time()
+        self._window_count = 0
+        self._lock = threading.Lock()
+
+        self._server = _ThreadingHTTPServer((host, port), _MockAPIHandler)
+        self._server.api = self
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}/v1/'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _rate_limit_headers(self):
+        """Count a request against the rate limit, return its headers and
+        whether it is allowed."""
+        if self.rate_limit is None:
+            return {}, True
+
+        now = time.time()
+        if now - self._window_start >= self.rate_limit_period:
+            self._window_start = now
+            self._window_count = 0
+
+        self._window_count += 1
+        remaining = max(0, self.rate_limit - self._window_count)
+        headers = {
+            'X-RateLimit-Limit': str(self.rate_limit),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': str(int(math.ceil(self._window_start + self.rate_limit_period))),
+        }
+        return headers, self._window_count <= self.rate_limit
+
+    def _should_fail(self):
+        # deterministic: every 1 / error_rate requests fails
+        self._error_accumulator += self.error_rate
+        if self._error_accumulator >= 1.0:
+            self._error_accumulator -= 1.0
+            return True
+        return False
+
+    def handle(self, method, path, body, authorization):
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            self.requests.append((method, path))
+            headers, allowed = self._rate_limit_headers()
+
+            if not authorization or not authorization.startswith('Bearer '):
+                return 401, {'error': 'Invalid API key'}, headers
+            if not allowed:
+                return 429, {'error': 'Rate limit exceeded'}, headers
+            if self._should_fail():
+                return 503, {'error': 'API currently unavailable'}, headers
+
+            try:
+                status, response = self._route(method, path, body)
+            except InvalidColor as e:
+                status, response = 422, {'error': str(e)}
+
+        return status, response, headers
+
+    def _status(self, light):
+        if light['id'] in self.offline_ids:
+            return 'offline'
+        if light['id'] in self.timed_out_ids:
+            return 'timed_out'
+        return 'ok'
+
+    def _results(self, lights):
+        return [{'id': light['id'], 'label': light['label'],
+                 'status': self._status(light)} for light in lights]
+
+    def _match(self, selector):
+        return selectors.filter_lights(self.lights, selector) or []
+
+    def _apply_state(self, lights, state):
+        parsed_color = None
+        if state.get('color') is not None:
+            parsed_color = parse_color(state['color'])
+
+        for light in lights:
+            if self._status(light) != 'ok':
+                continue
+            if state.get('power') is not None:
+                light['power'] = state['power']
+            if parsed_color is not None:
+                for name in ('hue', 'saturation', 'kelvin'):
+                    if name in parsed_color:
+                        light['color'][name] = parsed_color[name]
+                if 'brightness' in parsed_color:
+                    light['brightness'] = parsed_color['brightness']
+            if state.get('brightness') is not None:
+                light['brightness'] = float(state['brightness'])
+
+        return self._results(lights)
+
+    def _route(self, method, path, body):
+        parts = [unquote(part) for part in path.split('?', 1)[0].split('/') if part]
+        if not parts or parts[0] != 'v1':
+            return 404, {'error': 'Not found'}
+        parts = parts[1:]
+
+        if parts == ['scenes'] and method == 'GET':
+            return 200, self.scenes
+
+        if len(parts) == 3 and parts[0] == 'scenes' and parts[2] == 'activate':
+            scene_uuid = parts[1].split(':', 1)[-1]
+            for scene in self.scenes:
+                if scene['uuid'] == scene_uuid:
+                    results = []
+                    for state in scene['states']:
+                        results.extend(self._apply_state(
+                            self._match(state['selector']), state))
+                    return 207, {'results': results}
+            return 404, {'error': 'Scene not found'}
+
+        if not parts or parts[0] != 'lights':
+            return 404, {'error': 'Not found'}
+
+        if parts == ['lights', 'states'] and method == 'PUT':
+            defaults = body.get('defaults') or {}
+            results = []
+            for state in body.get('states', []):
+                operation = dict(defaults)
+                operation.update(state)
+                results.append({
+                    'operation': state,
+                    'results': self._apply_state(
+                        self._match(operation['selector']), operation),
+                })
+            return 207, {'results': results}
+
+        if len(parts) < 2:
+            return 404, {'error': 'Not found'}
+
+        lights = self._match(parts[1])
+        if not lights:
+            return 404, {'error': 'Selector did not match any lights'}
+
+        action = '/'.join(parts[2:])
+        if method == 'GET' and action == '':
+            return 200, lights
+        if method == 'PUT' and action == 'state':
+            return 207, {'results': self._apply_state(lights, body)}
+        if method == 'POST' and action == 'toggle':
+            return 207, {'results': self._apply_state(
+                lights, {'power': util.toggled_power(lights)})}
+        if method == 'POST' and action in (
+                'state/delta', 'effects/breathe', 'effects/pulse', 'cycle'):
+            return 207, {'results': self._results(lights)}
+
+        return 404, {'error': 'Not found'}
@@ -15,12 +15,25 @@
 # limitations under the License.
 #
 
+import codecs
 import json
 import re
 
 import six
 
-from pifx.constants import A_ERROR_HTTP_CODES, A_OK_HTTP_CODES
+# use a faster JSON parser when one is installed
+try:
+    import orjson as _json_backend
+except ImportError:
+    try:
+        import ujson as _json_backend
+    except ImportError:
+        _json_backend = json
+
+from pifx.constants import (
+    A_OK_HTTP_CODES, A_MAX_STATES_PER_REQUEST, A_RESULT_OK
+)
+from pifx.exceptions import exception_for_status
 
 
 def generate_auth_header(api_key):
@@ -42,23 +55,132 @@ def arg_tup_to_dict(argument_tuples):
 
     return data
 
+def chunk_list(items, chunk_size):
+    """Split a list into consecutive lists of at most chunk_size items"""
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+def states_argument_tuples(operations, defaults=None,
+    chunk_size=A_MAX_STATES_PER_REQUEST):
+    """Given a list of set_state operation dicts, return one list of argument
+    tuples per bulk `lights/states` request needed to apply them all."""
+    states = [arg_tup_to_dict(operation.items()) for operation in operations]
+
+    requests = []
+    for chunk in chunk_list(states, chunk_size):
+        requests.append([
+            ("states", chunk),
+            ("defaults", arg_tup_to_dict(defaults.items()) if defaults else None)
+        ])
+
+    return requests
+
+def iter_results(results):
+    """Given the results of a write, yield each per-light result, including
+    those nested in the operations of a set_states response."""
+    for result in results or []:
+        if isinstance(result, dict) and 'operation' in result:
+            for light_result in result.get('results') or []:
+                yield light_result
+        else:
+            yield result
+
+def failed_results(results):
+    """Given the results of a write, return the per-light results whose
+    status is not ok."""
+    return [result for result in iter_results(results)
+            if isinstance(result, dict)
+            and result.get('status', A_RESULT_OK) != A_RESULT_OK]
+
+def clip(value, minimum, maximum):
+    return max(minimum, min(maximum, value))
+
+def is_true(value):
+    """Return whether a boolean argument, possibly encoded as 'true', is set"""
+    return value is True or value == 'true'
+
+def toggled_power(lights):
+    """Return the power toggle_power sets on lights: as with the API, if any
+    light is on they are all turned off."""
+    return 'off' if any(light.get('power') == 'on' for light in lights) else 'on'
+
 def parse_data(parsed_data):
     """Given parsed response, return correct return values"""
     return parsed_data['results']
 
 def parse_response(response):
     """Parse JSON API response, return object."""
-    parsed_response = json.loads(response.text)
+    return parse_text(response.content)
+
+def parse_text(text):
+    """Parse JSON API response body (bytes or text), return object."""
+    parsed_response = _json_backend.loads(text)
     return parsed_response
 
+def iter_json_array(chunks):
+    """Given an iterable of byte chunks making up a JSON array, lazily
+    yield each item of the array as soon as it has been received."""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    started = False
+    finished = False
+
+    chunks = iter(chunks)
+    while True:
+        chunk = next(chunks, None)
+        final = chunk is None
+        buffer = buffer[position:] + text_decoder.decode(chunk or b'', final)
+        position = 0
+
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError("Response is not a JSON array")
+                started = True
+                position += 1
+                continue
+
+            if buffer[position] == ']':
+                finished = True
+                break
+
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if final:
+                    raise
+                break
+
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(buffer) and not final:
+                break
+
+            position = end
+            yield item
+
+        if finished:
+            return
+        if final:
+            raise ValueError("Truncated JSON array")
+
 def handle_error(response):
     """Raise appropriate exceptions if necessary."""
-    status_code = response.status_code
+    if response.status_code in A_OK_HTTP_CODES:
+        return True
+    return handle_status(
+        response.status_code, response.headers, getattr(response, 'content', None))
 
+def handle_status(status_code, headers=None, body=None):
+    """Raise the pifx.exceptions.PIFXError subclass matching a response
+    status code if necessary."""
     if status_code not in A_OK_HTTP_CODES:
-        error_explanation = A_ERROR_HTTP_CODES.get(status_code)
-        raise_error = "{}: {}".format(status_code, error_explanation)
-        raise Exception(raise_error)
+        raise exception_for_status(status_code, headers, body)
     else:
         return True
 
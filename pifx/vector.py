@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Vectorized color computation for many lights at once.
+
+Colors are NumPy arrays with one row per light: HSBK arrays have columns
+hue (degrees), saturation (0-1), brightness (0-1) and kelvin, RGB arrays
+have 0-255 red, green and blue columns. Requires numpy
+(``pip install pifx[vector]``).
+
+.. code-block:: python
+
+    colors = vector.gradient([[0, 1, 1, 3500], [240, 1, 1, 3500]], len(ids))
+    p.set_states(vector.to_operations(ids, colors, duration=1.0))
+"""
+
+import numpy as np
+
+from pifx import selector as selectors
+from pifx.color import KELVIN_DEFAULT, KELVIN_MAX, KELVIN_MIN
+
+HUE, SATURATION, BRIGHTNESS, KELVIN = range(4)
+
+
+def as_hsbk(hsbk):
+    """Return hsbk as a float array of shape (n, 4)"""
+    return np.atleast_2d(np.asarray(hsbk, dtype=float))
+
+def interpolate(start, end, steps):
+    """Return an array of shape (steps, n, 4) moving from the start to the
+    end HSBK colors, with hues taking the shortest way around the wheel."""
+    start = as_hsbk(start)
+    end = as_hsbk(end)
+
+    fractions = np.linspace(0.0, 1.0, steps).reshape(-1, 1, 1)
+    frames = start + (end - start) * fractions
+
+    hue_delta = (end[:, HUE] - start[:, HUE] + 180.0) % 360.0 - 180.0
+    frames[:, :, HUE] = (start[:, HUE] + hue_delta * fractions[:, :, 0]) % 360.0
+
+    return frames
+
+def gradient(stops, count):
+    """Return count HSBK colors spread evenly along a list of color stops"""
+    stops = as_hsbk(stops)
+    if len(stops) == 1:
+        return np.repeat(stops, count, axis=0)
+
+    positions = np.linspace(0.0, len(stops) - 1, count)
+    index = np.minimum(positions.astype(int), len(stops) - 2)
+    fraction = (positions - index).reshape(-1, 1)
+
+    start = stops[index]
+    end = stops[index + 1]
+    colors = start + (end - start) * fraction
+
+    hue_delta = (end[:, HUE] - start[:, HUE] + 180.0) % 360.0 - 180.0
+    colors[:, HUE] = (start[:, HUE] + hue_delta * fraction[:, 0]) % 360.0
+
+    return colors
+
+def apply_gamma(hsbk, gamma=2.2):
+    """Return a copy of hsbk with perceptual gamma applied to brightness"""
+    hsbk = as_hsbk(hsbk).copy()
+    hsbk[:, BRIGHTNESS] = np.clip(hsbk[:, BRIGHTNESS], 0.0, 1.0) ** gamma
+    return hsbk
+
+def blend_kelvin(hsbk, kelvin, amount):
+    """Return a copy of hsbk with kelvin moved towards a target temperature
+    by amount (0-1, either a scalar or one value per light)."""
+    hsbk = as_hsbk(hsbk).copy()
+    amount = np.clip(np.asarray(amount, dtype=float), 0.0, 1.0)
+    hsbk[:, KELVIN] = np.clip(
+        hsbk[:, KELVIN] * (1.0 - amount) + kelvin * amount,
+        KELVIN_MIN, KELVIN_MAX)
+    return hsbk
+
+def rgb_to_hsbk(rgb, kelvin=KELVIN_DEFAULT):
+    """Convert an (n, 3) array of 0-255 RGB values to HSBK"""
+    rgb = np.atleast_2d(np.asarray(rgb, dtype=float)) / 255.0
+    maximum = rgb.max(axis=1)
+    minimum = rgb.min(axis=1)
+    chroma = maximum - minimum
+    safe_chroma = np.where(chroma == 0, 1.0, chroma)
+
+    red, green, blue = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    hue = np.where(maximum == red, ((green - blue) / safe_chroma) % 6.0,
+          np.where(maximum == green, (blue - red) / safe_chroma + 2.0,
+                   (red - green) / safe_chroma + 4.0))
+    hue = np.where(chroma == 0, 0.0, hue * 60.0)
+
+    saturation = np.where(maximum == 0, 0.0, chroma / np.where(maximum == 0, 1.0, maximum))
+
+    return np.column_stack([
+        hue, saturation, maximum, np.full(len(rgb), float(kelvin))])
+
+def hsbk_to_rgb(hsbk):
+    """Convert HSBK colors to an (n, 3) array of 0-255 RGB values,
+    ignoring kelvin."""
+    hsbk = as_hsbk(hsbk)
+    hue = (hsbk[:, HUE] % 360.0) / 60.0
+    saturation = hsbk[:, SATURATION]
+    brightness = hsbk[:, BRIGHTNESS]
+
+    chroma = brightness * saturation
+    x = chroma * (1 - np.abs(hue % 2 - 1))
+    zeros = np.zeros_like(hue)
+    sector = hue.astype(int) % 6
+
+    red = np.choose(sector, [chroma, x, zeros, zeros, x, chroma])
+    green = np.choose(sector, [x, chroma, chroma, x, zeros, zeros])
+    blue = np.choose(sector, [zeros, zeros, x, chroma, chroma, x])
+
+    offset = (brightness - chroma).reshape(-1, 1)
+    return np.round((np.column_stack([red, green, blue]) + offset) * 255.0)
+
+def quantize(hsbk, hue_step=1.0, level_step=0.01, kelvin_step=50.0):
+    """Round colors to steps too small to see, so that nearly identical
+    colors can share one request."""
+    hsbk = as_hsbk(hsbk)
+    steps = np.array([hue_step, level_step, level_step, kelvin_step])
+    quantized = np.round(hsbk / steps) * steps
+    quantized[:, HUE] %= 360.0
+    return quantized
+
+def to_operations(light_ids, hsbk, power=None, duration=None, **quantize_kwargs):
+    """Given light ids and one HSBK color per light, return the set_states
+    operations applying them, with one operation per distinct color whose
+    selector lists every light of that color."""
+    colors = quantize(hsbk, **quantize_kwargs)
+    if len(colors) != len(light_ids):
+        raise ValueError("Expected one color per light id")
+
+    unique_colors, inverse = np.unique(colors, axis=0, return_inverse=True)
+    inverse = np.asarray(inverse).reshape(-1)
+
+    operations = []
+    for index, (hue, saturation, brightness, kelvin) in enumerate(unique_colors):
+        ids = [light_ids[i] for i in np.flatnonzero(inverse == index)]
+        operation = {
+            'selector': selectors.id_selector(ids),
+            'color': 'hue:{:g} saturation:{:g} kelvin:{:d}'.format(
+                hue, saturation, int(kelvin)),
+            'brightness': float(brightness),
+        }
+        if power is not None:
+            operation['power'] = power
+        if duration is not None:
+            operation['duration'] = duration
+        operations.append(operation)
+
+    return operations
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2015-2018 Chaoyi Zha <me@cydrobolt.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import time
+from collections import namedtuple
+
+# light fields compared between polls
+WATCHED_FIELDS = ('power', 'color', 'brightness', 'connected')
+
+# field of the events emitted when a light appears or disappears
+FIELD_ADDED = 'added'
+FIELD_REMOVED = 'removed'
+
+ChangeEvent = namedtuple('ChangeEvent', 'light_id field old new light')
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(val)) for key, val in value.items()))
+    return value
+
+def light_fingerprint(light):
+    """Return a hash of the watched fields of a light dict"""
+    return hash(tuple(_freeze(light.get(field)) for field in WATCHED_FIELDS))
+
+
+class Watcher:
+    """Poll lights and emit an event for every watched field that changed.
+
+    Successive snapshots are compared per light id using a hash of the
+    watched fields, so unchanged lights cost a single comparison. The poll
+    interval doubles (up to max_interval) while nothing changes, and drops
+    back to interval as soon as a change is seen or the PIFX instance
+    performs a write.
+
+    Iterate over the watcher to poll forever, yielding ChangeEvents, or use
+    subscribe() and start() to share one background poller between many
+    callbacks. Errors of the background poller, e.g a ServerUnavailable,
+    are passed to the callbacks given to subscribe_errors() and stored in
+    last_error, and polling continues at a backed off interval.
+    """
+    def __init__(self, pifx, selector='all', interval=5.0, max_interval=None,
+        backoff=2.0, sleep=time.sleep):
+        self.pifx = pifx
+        self.selector = selector
+        self.min_interval = interval
+        self.max_interval = max_interval if max_interval is not None else interval * 8
+        self.backoff = backoff
+        self.interval = interval
+
+        self._sleep = sleep
+        self._snapshot = None
+        self._subscribers = []
+        self._error_subscribers = []
+        self.last_error = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def subscribe(self, callback):
+        """Call callback(event) for every change found by the poller"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def subscribe_errors(self, callback):
+        """Call callback(exception) for every failed background poll"""
+        self._error_subscribers.append(callback)
+
+    def unsubscribe_errors(self, callback):
+        self._error_subscribers.remove(callback)
+
+    def notify_write(self):
+        """Poll at the fastest rate again, as lights are likely to change"""
+        self.interval = self.min_interval
+
+    def _diff(self, lights):
+        snapshot = dict()
+        for light in lights:
+            snapshot[light['id']] = (light_fingerprint(light), light)
+
+        events = []
+        previous = self._snapshot
+        self._snapshot = snapshot
+
+        if previous is None:
+            return events
+
+        for light_id, (fingerprint, light) in snapshot.items():
+            old = previous.get(light_id)
+            if old is None:
+                events.append(ChangeEvent(light_id, FIELD_ADDED, None, light, light))
+                continue
+
+            old_fingerprint, old_light = old
+            if old_fingerprint == fingerprint:
+                continue
+
+            for field in WATCHED_FIELDS:
+                if old_light.get(field) != light.get(field):
+                    events.append(ChangeEvent(light_id, field,
+                        old_light.get(field), light.get(field), light))
+
+        for light_id, (fingerprint, old_light) in previous.items():
+            if light_id not in snapshot:
+                events.append(ChangeEvent(
+                    light_id, FIELD_REMOVED, old_light, None, old_light))
+
+        return events
+
+    def poll(self):
+        """Fetch the lights once, return the list of changes since the
+        previous poll and send them to subscribers. The first poll only
+        records a baseline."""
+        events = self._diff(self.pifx._fetch_lights(self.selector, refresh=True))
+
+        if events:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+        for event in events:
+            for callback in list(self._subscribers):
+                callback(event)
+
+        return events
+
+    def __iter__(self):
+        while True:
+            for event in self.poll():
+                yield event
+            self._sleep(self.interval)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            delay = None
+            try:
+                self.poll()
+            except Exception as e:
+                self.last_error = e
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+                # wait at least as long as the API asked, if it did
+                delay = getattr(e, 'retry_after', None)
+                for callback in list(self._error_subscribers):
+                    callback(e)
+            self._stopped.wait(max(self.interval, delay or 0))
+
+    def start(self):
+        """Poll in a background thread until stop() is called"""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -64,17 +64,24 @@ setup(
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=[
         'requests',
-        'six'
+        'six',
+        'futures; python_version < "3"'
     ],
 
+    # Optional features, installable with e.g. `pip install pifx[async]`.
+    extras_require={
+        'async': ['aiohttp'],
+        'vector': ['numpy'],
+    },
+
     include_package_data=True,
 
     # To provide executable scripts, use entry points in preference to the
     # "scripts" keyword. Entry points provide cross-platform support and allow
     # pip to create the appropriate form of executable for the target platform.
     entry_points={
-        # 'console_scripts': [
-        #
-        # ],
+        'console_scripts': [
+            'pifx = pifx.cli:main',
+        ],
     },
 )
@@ -0,0 +1,138 @@
+import sys
+sys.path.insert(1, '..')
+
+import asyncio
+import unittest
+
+try:
+    from aiohttp import web
+    from pifx.aio import AsyncPIFX
+    from pifx.testing import make_lights
+except (ImportError, SyntaxError):
+    raise unittest.SkipTest("aiohttp is not installed")
+
+
+def run_with_server(handler, coroutine_factory):
+    async def runner():
+        app = web.Application()
+        app.router.add_route('*', '/v1/{tail:.*}', handler)
+        server = web.AppRunner(app)
+        await server.setup()
+        site = web.TCPSite(server, '127.0.0.1', 0)
+        await site.start()
+        port = server.addresses[0][1]
+        endpoint = "http://127.0.0.1:{}/v1/".format(port)
+        try:
+            async with AsyncPIFX("abc123", http_endpoint=endpoint) as p:
+                return await coroutine_factory(p)
+        finally:
+            await server.cleanup()
+
+    return asyncio.run(runner())
+
+def test_async_set_state_fan_out():
+    seen = []
+
+    async def handler(request):
+        form = await request.post()
+        seen.append((request.method, request.path, dict(form),
+                     request.headers['Authorization']))
+        return web.json_response({"results": [{"id": "d073d5", "status": "ok"}]})
+
+    async def fan_out(p):
+        return await asyncio.gather(*[
+            p.set_state('label:{}'.format(i), color='red', duration=1.0)
+            for i in range(5)
+        ])
+
+    results = run_with_server(handler, fan_out)
+
+    assert len(results) == 5
+    assert results[0] == [{"id": "d073d5", "status": "ok"}]
+    assert len(seen) == 5
+    method, path, form, auth = seen[0]
+    assert method == 'PUT'
+    assert path.startswith('/v1/lights/label:')
+    assert form == {'color': 'red', 'duration': '1.0'}
+    assert auth == "Bearer abc123"
+
+def test_async_error_status():
+    async def handler(request):
+        return web.json_response({"error": "not found"}, status=404)
+
+    async def toggle(p):
+        try:
+            await p.toggle_power('label:missing')
+        except Exception as e:
+            return str(e)
+
+    assert run_with_server(handler, toggle).startswith("404")
+
+def test_async_set_states_priority_and_deadline():
+    async def handler(request):
+        body = await request.json()
+        return web.json_response({"results": [
+            {"operation": state, "results": []} for state in body['states']]})
+
+    async def set_states(p):
+        return await p.set_states([{'selector': 'all', 'power': 'on'}],
+            priority=5, deadline=10.0)
+
+    assert len(run_with_server(handler, set_states)) == 1
+
+def test_async_apply_scene_and_build_index():
+    lights = make_lights(4)
+    sent = []
+
+    async def handler(request):
+        if request.method == 'GET':
+            return web.json_response(lights)
+        body = await request.json()
+        sent.append(body['states'])
+        return web.json_response({"results": [
+            {"operation": state, "results": []} for state in body['states']]})
+
+    async def apply_scene(p):
+        index = await p.build_index()
+        results = await p.apply_scene(dict(
+            (light['id'], {'power': 'on' if i == 2 else 'off'})
+            for i, light in enumerate(lights)))
+        return index, results
+
+    index, results = run_with_server(handler, apply_scene)
+    assert len(index.resolve('all')) == 4
+    assert sent == [[{'selector': 'id:d073d5000002', 'power': 'on'}]]
+    assert len(results) == 1
+
+    assert not hasattr(AsyncPIFX('abc123'), 'iter_lights')
+
+def test_async_reads_and_writes_are_awaited():
+    from pifx.cache import ResponseCache
+    lights = make_lights(2)
+    requests = []
+
+    async def handler(request):
+        requests.append(request.method)
+        if request.method == 'GET':
+            return web.json_response(lights)
+        return web.json_response({"results": [
+            {"id": light['id'], "status": "ok"} for light in lights]})
+
+    async def read_write_read(p):
+        p.cache = ResponseCache()
+        first = await p.list_lights()
+        cached = await p.list_lights()
+        results = await p.set_state('all', power='on')
+        state = await p.get_state()
+        return first, cached, results, state
+
+    first, cached, results, state = run_with_server(handler, read_write_read)
+    assert first == cached == state == lights
+    assert [result['status'] for result in results] == ['ok', 'ok']
+    # the write invalidated the cached lights
+    assert requests == ['GET', 'PUT', 'GET']
+
+def test_async_has_no_thread_helpers():
+    p = AsyncPIFX('abc123')
+    for name in ('iter_lights', 'watch', 'submit', 'map'):
+        assert not hasattr(p, name)
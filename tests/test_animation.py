@@ -0,0 +1,84 @@
+import sys
+sys.path.insert(1, '..')
+
+from pifx.animation import Animator, Timeline
+from pifx.ratelimit import RateLimiter
+from pifx.testing import FakeClock
+
+
+class LaggingClock(FakeClock):
+    def __init__(self):
+        FakeClock.__init__(self, 100.0)
+        # extra seconds lost during the next sleep, to simulate lag
+        self.lag = 0.0
+
+    def sleep(self, seconds):
+        FakeClock.sleep(self, seconds + self.lag)
+        self.lag = 0.0
+
+class FakeClient:
+    def __init__(self, rate_limiter=None):
+        self.rate_limiter = rate_limiter
+
+class FakePIFX:
+    def __init__(self, clock, rate_limiter=None):
+        self.clock = clock
+        self.client = FakeClient(rate_limiter)
+        self.calls = []
+
+    def set_state(self, selector, **kwargs):
+        self.calls.append((self.clock.now - 100.0, kwargs))
+
+def test_state_at_interpolates():
+    timeline = Timeline([
+        (0, {'color': 'hue:350 saturation:1', 'brightness': 0.0}),
+        (10, {'color': 'hue:10 saturation:1', 'brightness': 1.0}),
+    ])
+    state = timeline.state_at(5)
+    assert state['color'] == 'hue:0 saturation:1'
+    assert state['brightness'] == 0.5
+    assert timeline.state_at(20)['brightness'] == 1.0
+
+def test_frames_only_at_keyframes():
+    clock = LaggingClock()
+    p = FakePIFX(clock)
+    timeline = Timeline([(0, {'power': 'on'}), (2, {'power': 'off'}), (5, {'power': 'on'})])
+    Animator(p, timeline, clock=clock.time, sleep=clock.sleep).run()
+
+    assert [(t, kwargs['duration']) for t, kwargs in p.calls] == [
+        (0.0, 0.0), (0.0, 2.0), (2.0, 3.0)]
+    assert p.calls[-1][1]['power'] == 'on'
+
+def test_rate_limit_caps_frame_rate_and_merges_keyframes():
+    clock = LaggingClock()
+    limiter = RateLimiter()
+    limiter.update({'X-RateLimit-Limit': '60', 'X-RateLimit-Remaining': '60'})
+    p = FakePIFX(clock, limiter)
+    keyframes = [(t / 10.0, {'brightness': t / 40.0}) for t in range(41)]
+    animator = Animator(p, Timeline(keyframes), clock=clock.time, sleep=clock.sleep)
+    animator.run()
+
+    # 60 requests per minute allows one frame per second
+    times = [t for t, kwargs in p.calls]
+    assert times == [0.0, 0.0, 1.0, 2.0, 3.0]
+    assert p.calls[-1][1]['brightness'] == 1.0
+    assert animator.frames_dropped > 0
+
+def test_late_frames_skip_ahead():
+    clock = LaggingClock()
+    p = FakePIFX(clock)
+    timeline = Timeline([(t, {'brightness': t / 10.0}) for t in range(11)])
+    animator = Animator(p, timeline, max_fps=1.0, clock=clock.time, sleep=clock.sleep)
+
+    original_send = animator._send
+    def lagging_send(state, duration):
+        original_send(state, duration)
+        if len(p.calls) == 3:
+            clock.lag = 4.5
+    animator._send = lagging_send
+    animator.run()
+
+    times = [t for t, kwargs in p.calls]
+    # the frame due at 2.0 was late, so the next one is sent from 6.5
+    assert 2.0 not in times and 6.5 in times
+    assert len(p.calls) < 12
@@ -0,0 +1,76 @@
+import sys
+sys.path.insert(1, '..')
+
+from pifx import PIFX
+from pifx.cache import ResponseCache
+from pifx.testing import FakeClock, LightsClient
+
+LIGHTS = [
+    {"id": "d1", "label": "Desk", "group": {"id": "g1", "name": "Office"},
+     "location": {"id": "l1", "name": "Home"}},
+    {"id": "d2", "label": "Lamp", "group": {"id": "g1", "name": "Office"},
+     "location": {"id": "l1", "name": "Home"}},
+    {"id": "d3", "label": "Porch", "group": {"id": "g2", "name": "Outside"},
+     "location": {"id": "l1", "name": "Home"}},
+]
+
+def make_pifx(**cache_kwargs):
+    clock = FakeClock()
+    cache = ResponseCache(clock=clock.time, **cache_kwargs)
+    client = LightsClient(LIGHTS)
+    return PIFX("abc123", cache=cache, client=client), clock
+
+def test_repeated_list_lights_hits_cache():
+    p, clock = make_pifx(ttl=5.0)
+    p.list_lights()
+    p.list_lights()
+    assert len(p.client.requests) == 1
+    assert (p.cache.hits, p.cache.misses) == (1, 1)
+
+    clock.now = 6.0
+    p.list_lights()
+    assert len(p.client.requests) == 2
+
+def test_narrow_selectors_answered_from_all():
+    p, clock = make_pifx()
+    p.list_lights()
+    assert [l['id'] for l in p.list_lights('group_id:g1')] == ['d1', 'd2']
+    assert [l['id'] for l in p.list_lights('label:Porch,id:d1')] == ['d1', 'd3']
+    assert len(p.client.requests) == 1
+
+    # scene selectors cannot be evaluated locally
+    p.list_lights('scene_id:abc')
+    assert len(p.client.requests) == 2
+
+    # matching nothing is left to the API, which answers 404
+    assert p.cache.get_lights('label:Missing') is None
+
+def test_writes_invalidate_affected_entries():
+    p, clock = make_pifx()
+    p.list_lights()
+    p.cache.set_lights('label:Porch', [LIGHTS[2]])
+    p.cache.set_lights('label:Desk', [LIGHTS[0]])
+
+    p.set_state('label:Desk', power='on')
+
+    assert p.cache.get_lights('label:Porch') == [LIGHTS[2]]
+    assert len(p.cache) == 1
+
+    p.activate_scene('abc')
+    assert len(p.cache) == 0
+
+def test_lru_eviction():
+    p, clock = make_pifx(max_entries=2)
+    p.cache.set_lights('id:d1', [LIGHTS[0]])
+    p.cache.set_lights('id:d2', [LIGHTS[1]])
+    p.cache.get_lights('id:d1')
+    p.cache.set_lights('id:d3', [LIGHTS[2]])
+
+    assert p.cache.get_lights('id:d1') is not None
+    assert p.cache.get_lights('id:d2') is None
+
+def test_list_scenes_cached():
+    p, clock = make_pifx()
+    p.list_scenes()
+    p.list_scenes()
+    assert len(p.client.requests) == 1
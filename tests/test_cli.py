@@ -0,0 +1,121 @@
+import sys
+sys.path.insert(1, '..')
+
+import os
+import subprocess
+import tempfile
+
+from pifx import PIFX, cli
+from pifx import daemon as pifx_daemon
+from pifx.daemon import DaemonClient, DaemonUnavailable, PIFXDaemon
+from pifx.exceptions import InvalidSelector, PIFXError
+from pifx.testing import MockLIFXServer
+
+
+def test_daemon_round_trip():
+    path = os.path.join(tempfile.mkdtemp(), 'pifx.sock')
+    with MockLIFXServer(light_count=3) as server:
+        daemon = PIFXDaemon(PIFX('abc123', http_endpoint=server.endpoint), path).start()
+        try:
+            client = DaemonClient(path)
+            assert len(client.list_lights()) == 3
+            client.set_state('id:d073d5000001', power='on')
+            assert server.lights[1]['power'] == 'on'
+
+            try:
+                client.list_lights('label:Missing')
+                assert False, "expected InvalidSelector"
+            except InvalidSelector as e:
+                assert e.status == 404
+
+            # results which cannot be encoded are answered with an error
+            daemon.pifx.models = True
+            try:
+                client.list_lights()
+                assert False, "expected PIFXError"
+            except PIFXError as e:
+                assert 'JSON serializable' in str(e)
+            daemon.pifx.models = False
+            assert len(client.list_lights()) == 3
+        finally:
+            daemon.stop()
+
+    assert not os.path.exists(path)
+    try:
+        DaemonClient(path).list_lights()
+        assert False, "expected DaemonUnavailable"
+    except DaemonUnavailable:
+        pass
+
+def test_default_socket_path_is_private():
+    environ = dict(os.environ)
+    tempdir = tempfile.tempdir
+    getuid = os.getuid
+    try:
+        os.environ.pop('PIFX_SOCKET', None)
+        os.environ['XDG_RUNTIME_DIR'] = '/run/user/1000'
+        assert pifx_daemon.default_socket_path() == '/run/user/1000/pifx.sock'
+
+        del os.environ['XDG_RUNTIME_DIR']
+        tempfile.tempdir = tempfile.mkdtemp()
+        path = pifx_daemon.default_socket_path()
+        directory = os.path.dirname(path)
+        assert os.stat(directory).st_mode & 0o777 == 0o700
+
+        # a directory others can write to is refused
+        os.chmod(directory, 0o777)
+        try:
+            pifx_daemon.default_socket_path()
+            assert False, "expected InsecureSocket"
+        except pifx_daemon.InsecureSocket:
+            pass
+        os.chmod(directory, 0o700)
+
+        # as is a socket bound by another user
+        with MockLIFXServer(light_count=1) as server:
+            daemon = PIFXDaemon(PIFX('abc123', http_endpoint=server.endpoint)).start()
+            try:
+                os.getuid = lambda: getuid() + 1
+                try:
+                    DaemonClient(path).list_lights()
+                    assert False, "expected InsecureSocket"
+                except pifx_daemon.InsecureSocket:
+                    pass
+            finally:
+                os.getuid = getuid
+                daemon.stop()
+    finally:
+        os.getuid = getuid
+        tempfile.tempdir = tempdir
+        os.environ.clear()
+        os.environ.update(environ)
+
+def run(*argv):
+    return cli.run(cli.build_parser().parse_args(argv))
+
+def test_cli_with_and_without_daemon():
+    path = os.path.join(tempfile.mkdtemp(), 'pifx.sock')
+    with MockLIFXServer(light_count=2) as server:
+        # no daemon running: the command is sent directly
+        run('--api-key', 'abc123', '--http-endpoint', server.endpoint,
+            '--socket', path, 'state', 'all', '--power', 'on')
+        assert [light['power'] for light in server.lights] == ['on', 'on']
+
+        daemon = PIFXDaemon(PIFX('abc123', http_endpoint=server.endpoint), path).start()
+        try:
+            # no API key needed, the daemon has one
+            lights = run('--socket', path, 'list', 'id:d073d5000000')
+            assert lights[0]['id'] == 'd073d5000000'
+
+            assert cli.main(['--socket', path, 'list', 'label:Missing']) == 1
+        finally:
+            daemon.stop()
+
+def test_daemon_client_does_not_import_requests():
+    if sys.version_info < (3, 7):
+        # PIFX is only imported lazily on Python 3.7+
+        return
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, '-c',
+        'import sys, pifx.cli; print("requests" in sys.modules)'], cwd=root)
+    assert output.strip() == b'False'
@@ -0,0 +1,97 @@
+import sys
+sys.path.insert(1, '..')
+
+import threading
+import time
+
+from pifx import PIFX
+
+
+class RecordingClient:
+    def __init__(self):
+        self.requests = []
+
+    def perform_request(self, **kwargs):
+        self.requests.append(kwargs)
+        return [{"id": "d1", "status": "ok"}]
+
+def run_concurrently(*calls):
+    results = [None] * len(calls)
+
+    def run(i, call):
+        results[i] = call()
+
+    threads = [threading.Thread(target=run, args=(i, call))
+               for i, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def make_pifx():
+    return PIFX("abc123", client=RecordingClient(), coalesce_window=0.2)
+
+def test_set_state_last_writer_wins():
+    p = make_pifx()
+    results = run_concurrently(
+        lambda: p.set_state('label:Desk', color='red', brightness=0.5),
+        lambda: p.set_state('label:Desk', color='blue'),
+    )
+
+    requests = p.client.client.requests
+    assert len(requests) == 1
+    assert requests[0]['endpoint_args'] == ['label:Desk']
+    arguments = dict(requests[0]['argument_tuples'])
+    assert arguments['brightness'] == 0.5
+    assert arguments['color'] in ('red', 'blue')
+    assert results[0] == results[1] == [{"id": "d1", "status": "ok"}]
+    assert p.client.coalesced == 1
+
+def test_state_delta_sums_deltas():
+    p = make_pifx()
+    run_concurrently(
+        lambda: p.state_delta('label:Desk', brightness=0.1, hue=10),
+        lambda: p.state_delta('label:Desk', brightness=0.2),
+        lambda: p.state_delta('label:Desk', brightness=-0.05, kelvin=100),
+    )
+
+    requests = p.client.client.requests
+    assert len(requests) == 1
+    arguments = dict(requests[0]['argument_tuples'])
+    assert abs(arguments['brightness'] - 0.25) < 1e-9
+    assert arguments['hue'] == 10
+    assert arguments['kelvin'] == 100
+
+def test_different_selectors_and_other_calls_not_merged():
+    p = make_pifx()
+    run_concurrently(
+        lambda: p.set_state('label:Desk', power='on'),
+        lambda: p.set_state('label:Porch', power='on'),
+        lambda: p.toggle_power('label:Desk'),
+    )
+    assert len(p.client.client.requests) == 3
+
+def test_other_writes_sent_after_held_writes():
+    p = make_pifx()
+    held = threading.Thread(target=p.set_state, args=('id:d1',), kwargs={'power': 'on'})
+    held.start()
+    while not p.client._pending:
+        time.sleep(0.001)
+
+    p.toggle_power('id:d1')
+    held.join()
+
+    endpoints = [request['endpoint'] for request in p.client.client.requests]
+    assert endpoints == ['lights/{}/state', 'lights/{}/toggle']
+
+def test_writes_with_other_priority_not_merged():
+    p = make_pifx()
+    run_concurrently(
+        lambda: p.set_state('label:Desk', power='on'),
+        lambda: p.set_state('label:Desk', color='red', priority=5),
+    )
+
+    requests = p.client.client.requests
+    assert len(requests) == 2
+    assert sorted(request.get('priority', 0) for request in requests) == [0, 5]
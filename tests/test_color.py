@@ -0,0 +1,72 @@
+import sys
+sys.path.insert(1, '..')
+
+from pifx import PIFX
+from pifx import color
+from pifx.color import HSBK, InvalidColor
+
+
+def assert_close(actual, expected):
+    for a, e in zip(actual, expected):
+        if e is None:
+            assert a is None
+        else:
+            assert abs(a - e) < 1e-3, (actual, expected)
+
+def test_parse_every_syntax():
+    assert color.parse_hsbk('red') == HSBK(0.0, 1.0, None, None)
+    assert_close(color.parse_hsbk('#00ff00'), (120.0, 1.0, 1.0, None))
+    assert_close(color.parse_hsbk('00FF00'), (120.0, 1.0, 1.0, None))
+    assert_close(color.parse_hsbk('rgb:0,0,255'), (240.0, 1.0, 1.0, None))
+    assert color.parse_hsbk('kelvin:2700') == HSBK(None, 0.0, None, 2700.0)
+    assert color.parse_hsbk('blue saturation:0.5 brightness:0.2') == \
+        HSBK(250.0, 0.5, 0.2, None)
+
+def test_invalid_colors():
+    for invalid in ('', 'reddish', 'hue:400', 'rgb:1,2', 'kelvin:100',
+                    'brightness:x', 'flavor:1'):
+        try:
+            color.parse_hsbk(invalid)
+        except InvalidColor:
+            pass
+        else:
+            assert False, invalid
+
+def test_normalize_color():
+    assert color.normalize_color('red') == 'hue:0 saturation:1'
+    assert color.normalize_color('saturation:1.0 hue:0') == 'hue:0 saturation:1'
+    assert color.normalize_color('#ff0000') == 'hue:0 saturation:1 brightness:1'
+
+def test_rgb_hsbk_round_trip():
+    hsbk = color.rgb_to_hsbk(255, 128, 0)
+    assert color.hsbk_to_rgb(*hsbk) == (255, 128, 0)
+    # unsaturated colors follow the white point of the kelvin temperature
+    warm = color.hsbk_to_rgb(0, 0, 1.0, 2700)
+    assert warm[0] == 255 and warm[2] < warm[1] < 255
+
+class RecordingClient:
+    def __init__(self):
+        self.requests = []
+
+    def perform_request(self, **kwargs):
+        self.requests.append(kwargs)
+        return []
+
+def test_pifx_validates_colors_before_request():
+    p = PIFX(client=RecordingClient(), validate_colors=True)
+    for call in (
+        lambda: p.set_state(color='bleu'),
+        lambda: p.pulse_lights('red', from_color='hue:999'),
+        lambda: p.cycle_lights([{"color": "red"}, {"color": "nope"}], {}),
+        lambda: p.set_states([{"selector": "all", "color": "#12"}]),
+    ):
+        try:
+            call()
+        except InvalidColor:
+            pass
+        else:
+            assert False, "expected InvalidColor"
+    assert p.client.requests == []
+
+    p.set_state(color='blue')
+    assert len(p.client.requests) == 1
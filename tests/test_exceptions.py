@@ -0,0 +1,97 @@
+import sys
+import time
+sys.path.insert(1, '..')
+
+from pifx import PIFX, util
+from pifx.color import InvalidColor
+from pifx.exceptions import (AuthError, InvalidParameters, InvalidSelector,
+    PartialFailure, PIFXError, RateLimited, ServerUnavailable)
+from pifx.testing import MockLIFXServer
+
+
+def raised(status_code, headers=None):
+    try:
+        util.handle_status(status_code, headers)
+    except PIFXError as e:
+        return e
+    assert False, "expected PIFXError"
+
+def test_status_exceptions():
+    assert util.handle_status(207)
+
+    assert isinstance(raised(401), AuthError)
+    assert isinstance(raised(404), InvalidSelector)
+    assert isinstance(raised(422), InvalidParameters)
+    assert isinstance(raised(503), ServerUnavailable)
+    assert isinstance(raised(599), ServerUnavailable)
+    assert type(raised(418)) is PIFXError
+
+    error = raised(404)
+    assert str(error) == "404: Selector did not match any lights"
+    assert error.status == 404
+
+    # client-side validation errors share the hierarchy
+    assert issubclass(InvalidColor, InvalidParameters)
+    assert issubclass(InvalidColor, ValueError)
+
+def test_rate_limited_metadata():
+    reset = int(time.time()) + 30
+    error = raised(429, {'X-RateLimit-Reset': str(reset)})
+    assert isinstance(error, RateLimited)
+    assert error.reset_time == reset
+    assert 25 < error.retry_after <= 30
+
+    error = raised(429, {'Retry-After': '2'})
+    assert error.retry_after == 2.0
+    assert error.reset_time is None
+
+    # sent with every response, only a wait time when rate limited
+    error = raised(503, {'X-RateLimit-Reset': str(reset)})
+    assert error.reset_time == reset
+    assert error.retry_after is None
+
+def test_response_body_and_partial_failure():
+    with MockLIFXServer(light_count=2) as server:
+        p = PIFX('abc123', http_endpoint=server.endpoint, raise_partial_failures=True)
+        try:
+            p.list_lights('label:Missing')
+            assert False, "expected InvalidSelector"
+        except InvalidSelector as e:
+            assert b'Selector did not match' in e.body
+
+    p = PIFX('abc123', raise_partial_failures=True)
+    results = [
+        {'id': 'a', 'status': 'ok'},
+        {'id': 'b', 'status': 'offline'},
+    ]
+
+    class Client:
+        def perform_request(self, **kwargs):
+            return results
+
+    p.client = Client()
+    try:
+        p.set_state('all', power='on')
+        assert False, "expected PartialFailure"
+    except PartialFailure as e:
+        assert str(e) == "1 of 2 lights failed"
+        assert e.results == results
+
+    results[1]['status'] = 'ok'
+    assert p.set_state('all', power='on') == results
+
+def test_set_states_sends_every_request_before_raising():
+    with MockLIFXServer(light_count=120) as server:
+        server.timed_out_ids.add(server.lights[0]['id'])
+        p = PIFX('abc123', http_endpoint=server.endpoint, raise_partial_failures=True)
+        operations = [{'selector': 'id:' + light['id'], 'power': 'on'}
+                      for light in server.lights]
+        try:
+            p.set_states(operations)
+            assert False, "expected PartialFailure"
+        except PartialFailure as e:
+            assert str(e) == "1 of 120 lights failed"
+            assert len(e.results) == 120
+
+        assert server.requests.count(('PUT', '/v1/lights/states')) == 3
+        assert all(light['power'] == 'on' for light in server.lights[1:])
@@ -0,0 +1,59 @@
+import sys
+sys.path.insert(1, '..')
+
+from pifx import PIFX
+from pifx.inventory import LightIndex
+from pifx.testing import LightsClient
+
+LIGHTS = [
+    {"id": "d1", "uuid": "u1", "label": "Desk", "power": "on",
+     "group": {"id": "g1", "name": "Office"},
+     "location": {"id": "l1", "name": "Home"}},
+    {"id": "d2", "uuid": "u2", "label": "Strip", "power": "off",
+     "group": {"id": "g1", "name": "Office"},
+     "location": {"id": "l2", "name": "Work"},
+     "product": {"capabilities": {"has_multizone": True}}},
+    {"id": "d3", "uuid": "u3", "label": "Porch", "power": "on",
+     "group": {"id": "g2", "name": "Outside"},
+     "location": {"id": "l1", "name": "Home"}},
+]
+
+def ids(lights):
+    return [light['id'] for light in lights]
+
+def test_index_lookups():
+    index = LightIndex(LIGHTS)
+    assert index.by_uuid['u2']['id'] == 'd2'
+    assert ids(index.by_power['on']) == ['d1', 'd3']
+    assert ids(index.by_multizone[True]) == ['d2']
+    assert ids(index.lookup('location', 'Home')) == ['d1', 'd3']
+    assert 'd3' in index
+
+def test_resolve_and_expand():
+    index = LightIndex(LIGHTS)
+    assert ids(index.resolve('group_id:g1,label:Porch')) == ['d1', 'd2', 'd3']
+    assert ids(index.resolve('label:Desk,id:d1')) == ['d1']
+    assert index.resolve('label:Nope') == []
+    assert index.resolve('scene_id:s1') is None
+    assert index.expand('group:Office') == 'id:d1,id:d2'
+    assert index.expand('scene_id:s1') == 'scene_id:s1'
+
+def test_group_by_location():
+    locations = LightIndex(LIGHTS).group_by_location()
+    assert list(locations.keys()) == ['l1', 'l2']
+    assert ids(locations['l1']) == ['d1', 'd3']
+
+def test_pifx_rejects_unknown_selectors_before_request():
+    p = PIFX("abc123", client=LightsClient(LIGHTS))
+    p.build_index()
+
+    try:
+        p.set_state('label:Missing', power='on')
+    except ValueError:
+        pass
+    else:
+        assert False, "expected ValueError"
+    assert len(p.client.requests) == 1
+
+    p.set_state('label:Desk', power='on')
+    assert len(p.client.requests) == 2
@@ -0,0 +1,122 @@
+import sys
+sys.path.insert(1, '..')
+
+import time
+
+from pifx import PIFX
+from pifx import lan
+from pifx.testing import FakeBulb
+
+
+def make_pifx(*bulbs):
+    client = lan.LIFXLANClient(
+        discovery_addresses=[bulb.address for bulb in bulbs],
+        timeout=0.2, attempts=2, discovery_timeout=0.2)
+    return PIFX(client=client)
+
+def test_packet_round_trip():
+    data = lan.encode_packet(lan.MSG_SET_COLOR, (0, 1, 2, 3, 3500, 1000),
+        target=lan.id_to_target('d073d5000001'), source=1234, sequence=7,
+        ack_required=True)
+    assert len(data) == lan.HEADER_SIZE + 13
+
+    packet = lan.decode_packet(data)
+    assert packet.msg_type == lan.MSG_SET_COLOR
+    assert lan.target_to_id(packet.target) == 'd073d5000001'
+    assert (packet.source, packet.sequence) == (1234, 7)
+    assert packet.flags == lan.FLAG_ACK_REQUIRED
+    assert packet.payload == (0, 1, 2, 3, 3500, 1000)
+
+def test_discovery_and_list_lights():
+    desk = FakeBulb('d073d5000001', label='Desk', power=65535).start()
+    porch = FakeBulb('d073d5000002', label='Porch',
+        group=('Outside', 'c' * 32)).start()
+    try:
+        p = make_pifx(desk, porch)
+        lights = p.list_lights()
+        assert sorted(l['label'] for l in lights) == ['Desk', 'Porch']
+
+        desk_light = p.list_lights('label:Desk')[0]
+        assert desk_light['power'] == 'on'
+        assert desk_light['group'] == {'id': 'a' * 32, 'name': 'Group'}
+        assert desk_light['color']['kelvin'] == 3500
+
+        assert [l['id'] for l in p.list_lights('group:Outside')] == ['d073d5000002']
+    finally:
+        desk.stop()
+        porch.stop()
+
+def test_set_state_and_toggle():
+    bulb = FakeBulb(label='Desk').start()
+    try:
+        p = make_pifx(bulb)
+        results = p.set_state('label:Desk', power='on', color='red', brightness=0.5)
+        assert results == [{'id': bulb.light_id, 'label': 'Desk', 'status': 'ok'}]
+        assert bulb.power == lan.POWER_ON
+        assert bulb.hsbk == (0, 65535, 32768, 3500)
+
+        p.toggle_power('label:Desk')
+        assert bulb.power == lan.POWER_OFF
+    finally:
+        bulb.stop()
+
+def test_state_delta_and_effects():
+    bulb = FakeBulb(label='Desk', hsbk=(0, 65535, 32768, 3500)).start()
+    try:
+        p = make_pifx(bulb)
+        p.state_delta('label:Desk', hue=180, brightness=0.25, duration=0)
+        assert abs(bulb.hsbk[0] - 32768) <= 1
+        assert abs(bulb.hsbk[2] - 49151) <= 2
+
+        p.pulse_lights('blue', selector='label:Desk', period=2.0, cycles=3)
+        assert bulb.waveform[-1] == lan.WAVEFORM_PULSE
+        assert bulb.waveform[6] == 2000
+        assert bulb.waveform[7] == 3.0
+    finally:
+        bulb.stop()
+
+def test_unresponsive_bulb_times_out():
+    bulb = FakeBulb(label='Desk').start()
+    try:
+        p = make_pifx(bulb)
+        p.list_lights()
+        bulb.responding = False
+        results = p.set_state('id:{}'.format(bulb.light_id), power='on')
+        assert results[0]['status'] == 'offline'
+    finally:
+        bulb.stop()
+
+def test_writes_only_send_what_they_need():
+    desk = FakeBulb('d073d5000001', label='Desk').start()
+    dead = FakeBulb('d073d5000002', label='Porch').start()
+    try:
+        p = make_pifx(desk, dead)
+        p.client.discover()
+        dead.responding = False
+
+        start = time.time()
+        results = p.set_state('id:d073d5000001', power='on')
+        assert time.time() - start < 0.1
+        assert results[0]['status'] == 'ok'
+        # no state, group or location asked for a power change
+        assert desk.received == [lan.MSG_GET_SERVICE, lan.MSG_LIGHT_SET_POWER]
+        assert dead.received == [lan.MSG_GET_SERVICE]
+
+        # the unresponsive light does not delay the others
+        start = time.time()
+        results = p.set_state('all', color='hue:0 saturation:1 brightness:1 kelvin:3500')
+        assert time.time() - start < 2 * 0.2 + 0.1
+        assert dict((result['id'], result['status']) for result in results) == {
+            'd073d5000001': 'ok', 'd073d5000002': 'offline'}
+    finally:
+        desk.stop()
+        dead.stop()
+
+def test_scenes_not_available():
+    p = PIFX(client=lan.LIFXLANClient(discovery_addresses=[]))
+    try:
+        p.list_scenes()
+    except lan.UnsupportedOverLAN:
+        pass
+    else:
+        assert False, "expected UnsupportedOverLAN"
@@ -3,4 +3,102 @@ sys.path.insert(1, '..')
 
 from pifx import PIFX
 
-# TODO
+
+class RecordingClient:
+    """Stand-in for LIFXWebAPIClient that records requests"""
+    def __init__(self, responses=None):
+        self.requests = []
+        self.responses = responses or []
+
+    def perform_request(self, **kwargs):
+        self.requests.append(kwargs)
+        if self.responses:
+            return self.responses.pop(0)
+        return []
+
+def make_pifx(responses=None):
+    p = PIFX("abc123")
+    p.client = RecordingClient(responses)
+    return p
+
+def test_set_states_chunks_and_merges_results():
+    operations = [
+        {"selector": "id:{}".format(i), "power": "on", "color": None}
+        for i in range(120)
+    ]
+    p = make_pifx(responses=[["a"] * 50, ["b"] * 50, ["c"] * 20])
+
+    results = p.set_states(operations, defaults={"duration": 2.0})
+
+    assert len(p.client.requests) == 3
+    assert results == ["a"] * 50 + ["b"] * 50 + ["c"] * 20
+
+    first = p.client.requests[0]
+    assert first["method"] == 'put'
+    assert first["endpoint"] == 'lights/states'
+    assert first["json_body"] is True
+    states = dict(first["argument_tuples"])["states"]
+    assert len(states) == 50
+    assert states[0] == {"selector": "id:0", "power": "on"}
+    assert dict(first["argument_tuples"])["defaults"] == {"duration": 2.0}
+    assert len(dict(p.client.requests[2]["argument_tuples"])["states"]) == 20
+
+class FlakyClient(RecordingClient):
+    def perform_request(self, **kwargs):
+        if kwargs['endpoint_args'] == ['label:broken']:
+            raise Exception("404: Selector did not match any lights")
+        return kwargs['endpoint_args']
+
+def test_map_keeps_order_and_captures_errors():
+    p = PIFX("abc123", client=FlakyClient(), max_workers=4)
+    calls = [
+        ("set_state", {"selector": "label:{}".format(i), "power": "on"})
+        for i in range(20)
+    ]
+    calls[5] = ("toggle_power", {"selector": "label:broken"})
+
+    results = p.map(calls)
+    p.shutdown()
+
+    assert len(results) == 20
+    assert results[0] == ['label:0']
+    assert results[19] == ['label:19']
+    assert isinstance(results[5], Exception)
+
+def test_submit_returns_future():
+    p = PIFX("abc123", client=FlakyClient())
+    future = p.submit("toggle_power", "label:Desk")
+    assert future.result() == ['label:Desk']
+    p.shutdown()
+
+def test_client_connection_pool_sized_for_workers():
+    p = PIFX("abc123", max_workers=32)
+    adapter = p.client._s.get_adapter("https://api.lifx.com/v1/")
+    assert adapter._pool_maxsize == 32
+
+def test_priority_and_deadline_passed_to_client():
+    import time
+
+    p = make_pifx()
+    p.set_state('all', power='on', priority=5, deadline=2.0)
+    p.list_lights()
+
+    request = p.client.requests[0]
+    assert request['priority'] == 5
+    assert 1.0 < request['deadline'] - time.time() <= 2.0
+    # omitted unless given, so any client keeps working
+    assert 'priority' not in p.client.requests[1]
+    assert 'deadline' not in p.client.requests[1]
+
+def test_expired_deadline_not_sent():
+    from pifx.exceptions import DeadlineExceeded
+    from pifx.testing import MockLIFXServer
+
+    with MockLIFXServer(light_count=1) as server:
+        p = PIFX("abc123", http_endpoint=server.endpoint)
+        try:
+            p.set_state('all', power='on', deadline=-1)
+            assert False, "expected DeadlineExceeded"
+        except DeadlineExceeded:
+            pass
+        assert server.requests == []
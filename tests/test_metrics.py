@@ -0,0 +1,105 @@
+import sys
+sys.path.insert(1, '..')
+
+import time
+
+from pifx import PIFX
+from pifx.metrics import MetricsCollector
+from pifx.retry import RetryPolicy
+from pifx.testing import MockLIFXServer
+
+
+def test_hooks_and_metrics():
+    with MockLIFXServer(light_count=3, rate_limit=100) as server:
+        p = PIFX('abc123', http_endpoint=server.endpoint, rate_limit=False)
+        events = []
+        p.client.add_hook('before_request', lambda request: events.append(
+            (request['method'], request['endpoint'])))
+        metrics = MetricsCollector().install(p.client)
+
+        p.list_lights()
+        p.set_state('all', power='on')
+        try:
+            p.list_lights('id:missing')
+        except Exception:
+            pass
+
+        assert events == [
+            ('get', 'lights/{}'), ('put', 'lights/{}/state'), ('get', 'lights/{}')]
+
+        data = metrics.to_dict()
+        lights = data['endpoints']['lights/{}']['GET']
+        assert lights['requests'] == 2
+        assert lights['statuses'] == {200: 1, 404: 1}
+        assert lights['errors'] == {'InvalidSelector': 1}
+        assert lights['latency']['count'] == 2
+        assert lights['bytes_received'] > 0
+        assert data['endpoints']['lights/{}/state']['PUT']['bytes_sent'] > 0
+        assert data['rate_limit'] == {'remaining': 97, 'limit': 100}
+
+        text = metrics.to_prometheus()
+        assert 'pifx_requests_total{endpoint="lights/{}",method="GET"} 2' in text
+        assert 'pifx_responses_total{endpoint="lights/{}",method="GET",status="404"} 1' in text
+        assert 'pifx_request_duration_seconds_bucket{endpoint="lights/{}",le="+Inf",method="GET"} 2' in text
+        assert 'pifx_rate_limit_remaining 97' in text
+
+def test_retry_hook():
+    with MockLIFXServer(light_count=1, error_rate=0.5) as server:
+        p = PIFX('abc123', http_endpoint=server.endpoint, rate_limit=False,
+            retry_policy=RetryPolicy(backoff_base=0.001))
+        metrics = MetricsCollector().install(p.client)
+        retries = []
+        p.client.add_hook('on_retry',
+            lambda request, attempt, delay: retries.append(attempt))
+
+        p.list_lights()
+        p.list_lights()
+
+        assert retries == [1]
+        assert metrics.to_dict()['endpoints']['lights/{}']['GET']['retries'] == 1
+
+        metrics.uninstall(p.client)
+        p.list_lights()
+        assert metrics.to_dict()['endpoints']['lights/{}']['GET']['requests'] == 3
+
+def test_latency_excludes_rate_limit_wait():
+    class SlowLimiter:
+        def acquire(self, priority=0, deadline=None):
+            time.sleep(0.2)
+
+        def update(self, headers):
+            pass
+
+    with MockLIFXServer(light_count=1) as server:
+        p = PIFX('abc123', http_endpoint=server.endpoint, rate_limit=False)
+        p.client.rate_limiter = SlowLimiter()
+        metrics = MetricsCollector().install(p.client)
+
+        p.list_lights()
+        latency = metrics.to_dict()['endpoints']['lights/{}']['GET']['latency']
+        assert latency['sum'] < 0.2
+
+def test_malformed_headers_and_failing_hooks_do_not_fail_requests():
+    class Response:
+        status_code = 200
+        headers = {'X-RateLimit-Remaining': '', 'X-RateLimit-Limit': '120'}
+        content = b'[]'
+
+    metrics = MetricsCollector()
+    request = {'method': 'put', 'endpoint': 'lights/{}/state', 'stream': False}
+    metrics.after_response(request, Response(), 0.1)
+    assert metrics.to_dict()['rate_limit'] == {'remaining': None, 'limit': 120}
+
+    def broken_hook(*args):
+        raise ValueError("broken")
+
+    with MockLIFXServer(light_count=2) as server:
+        p = PIFX('abc123', http_endpoint=server.endpoint, rate_limit=False)
+        errors = []
+        for event in ('before_request', 'after_response'):
+            p.client.add_hook(event, broken_hook)
+        p.client.add_hook('on_error', lambda request, error: errors.append(error))
+
+        results = p.set_state('all', power='on')
+        assert [result['status'] for result in results] == ['ok', 'ok']
+        assert errors == []
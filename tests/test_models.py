@@ -0,0 +1,66 @@
+import sys
+sys.path.insert(1, '..')
+
+from pifx import PIFX
+from pifx import models
+
+LIGHT = {
+    "id": "d073d5000001", "uuid": "u1", "label": "Desk", "connected": True,
+    "power": "on", "brightness": 0.5,
+    "color": {"hue": 120.0, "saturation": 1.0, "kelvin": 3500},
+    "group": {"id": "g1", "name": "Office"},
+    "location": {"id": "l1", "name": "Home"},
+    "product": {"name": "LIFX A19"},
+    "seconds_since_seen": 0,
+}
+
+
+class StaticClient:
+    def perform_request(self, **kwargs):
+        if kwargs['endpoint'] == 'lights/{}':
+            return [LIGHT]
+        if kwargs['endpoint'] == 'scenes':
+            return [{"uuid": "s1", "name": "Evening", "states": []}]
+        return [{"id": "d073d5000001", "label": "Desk", "status": "ok"}]
+
+def test_light_from_dict():
+    light = models.Light.from_dict(LIGHT)
+    assert light.label == "Desk"
+    assert light.color.hue == 120.0
+    assert light.group.name == "Office"
+    assert light.location.id == "l1"
+    assert light.raw is None
+    assert not hasattr(light, '__dict__')
+
+    assert models.Light.from_dict(LIGHT, keep_raw=True).raw is LIGHT
+
+def test_model_equality_and_dict():
+    light = models.Light.from_dict(LIGHT)
+    assert light == models.Light.from_dict(dict(LIGHT))
+    assert light.to_dict()['color'] == {"hue": 120.0, "saturation": 1.0, "kelvin": 3500}
+
+def test_pifx_returns_models():
+    p = PIFX(client=StaticClient(), models=True)
+    lights = p.list_lights()
+    assert isinstance(lights[0], models.Light)
+    assert isinstance(p.list_scenes()[0], models.Scene)
+
+    results = p.set_state('label:Desk', power='on')
+    assert results[0].status == 'ok'
+
+def test_parse_nested_states_results():
+    parsed = models.parse_results([{
+        "operation": {"selector": "label:Desk"},
+        "results": [{"id": "d1", "label": "Desk", "status": "ok"}],
+    }])
+    assert parsed[0]['results'][0].id == 'd1'
+
+def test_result_status_classification():
+    ok, timed_out, offline = models.parse_results([
+        {"id": "d1", "status": "ok"},
+        {"id": "d2", "status": "timed_out"},
+        {"id": "d3", "status": "offline"},
+    ])
+    assert ok.ok and not ok.timed_out
+    assert timed_out.timed_out and not timed_out.ok
+    assert offline.offline and not offline.ok
@@ -0,0 +1,103 @@
+import sys
+sys.path.insert(1, '..')
+
+import os
+import sqlite3
+import tempfile
+
+from pifx import PIFX
+from pifx.cache import ResponseCache
+from pifx.client import LIFXWebAPIClient
+from pifx.exceptions import InvalidSelector
+from pifx.outbox import Outbox, OutboxHandle
+from pifx.testing import MockLIFXServer
+
+
+def make_outbox(server, path=':memory:', **kwargs):
+    return Outbox(LIFXWebAPIClient('abc123', server.endpoint, rate_limit=False),
+        path, retry_delay=0.01, **kwargs)
+
+def test_outbox_batches_set_state_calls():
+    with MockLIFXServer(light_count=3) as server:
+        outbox = make_outbox(server, autostart=False)
+        p = PIFX(client=outbox)
+
+        handles = [p.set_state('id:d073d500000{}'.format(i), power='on')
+                   for i in range(3)]
+        assert all(isinstance(handle, OutboxHandle) for handle in handles)
+        # reads are not queued
+        assert len(p.list_lights()) == 3
+        assert outbox.pending() == 3
+
+        outbox.start()
+        assert outbox.flush(timeout=5)
+        assert server.requests[-1] == ('PUT', '/v1/lights/states')
+        assert len(server.requests) == 2
+        assert handles[1].wait(1) == [
+            {'id': 'd073d5000001', 'label': 'Light 1', 'status': 'ok'}]
+        assert [light['power'] for light in server.lights] == ['on'] * 3
+        outbox.close()
+
+def test_outbox_replays_after_restart():
+    path = os.path.join(tempfile.mkdtemp(), 'outbox.db')
+    with MockLIFXServer(light_count=2, error_rate=0.5) as server:
+        outbox = make_outbox(server, path, autostart=False)
+        handle = PIFX(client=outbox).toggle_power('id:d073d5000000')
+        outbox.close()
+        assert server.requests == []
+
+        outbox = make_outbox(server, path)
+        assert outbox.flush(timeout=5)
+        assert outbox.handle(handle.id) is None
+        assert server.lights[0]['power'] == 'on'
+
+        # answered with a 503, retried, then failed with a 404
+        handle = PIFX(client=outbox).set_state('label:Missing', power='on')
+        try:
+            handle.wait(5)
+            assert False, "expected InvalidSelector"
+        except InvalidSelector:
+            pass
+        assert [command_id for command_id, _, _ in outbox.failed()] == [handle.id]
+        outbox.close()
+
+def test_cache_invalidated_when_queued_write_is_sent():
+    with MockLIFXServer(light_count=2) as server:
+        outbox = make_outbox(server, autostart=False)
+        p = PIFX(client=outbox, cache=ResponseCache(ttl=60))
+
+        handle = p.set_state('id:d073d5000000', power='on')
+        # cached before the write is sent
+        assert p.list_lights()[0]['power'] == 'off'
+
+        outbox.start()
+        handle.wait(5)
+        assert p.list_lights()[0]['power'] == 'on'
+        outbox.close()
+
+def test_outbox_sends_by_priority():
+    path = os.path.join(tempfile.mkdtemp(), 'outbox.db')
+    # a queue created before commands had a priority
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE commands (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+               'request TEXT NOT NULL, status TEXT NOT NULL, '
+               'attempts INTEGER NOT NULL DEFAULT 0, error TEXT, '
+               'created REAL NOT NULL)')
+    db.commit()
+    db.close()
+
+    with MockLIFXServer(light_count=3) as server:
+        outbox = make_outbox(server, path, autostart=False)
+        p = PIFX(client=outbox)
+        p.set_state('id:d073d5000000', power='on')
+        p.set_state('id:d073d5000001', power='on')
+        urgent = p.set_state('id:d073d5000002', power='on', priority=5)
+
+        outbox.start()
+        assert outbox.flush(timeout=5)
+        # the urgent command is not batched with the others
+        assert server.requests == [
+            ('PUT', '/v1/lights/id:d073d5000002/state'),
+            ('PUT', '/v1/lights/states')]
+        assert urgent.wait(1)[0]['status'] == 'ok'
+        outbox.close()
@@ -0,0 +1,93 @@
+import sys
+sys.path.insert(1, '..')
+
+import copy
+
+from pifx import PIFX
+from pifx.pool import ClientPool
+from pifx.testing import MockLIFXServer, make_lights
+
+
+def make_servers():
+    lights = make_lights(6)
+    # the first account sees lights 0-3, the second lights 2-5
+    return (MockLIFXServer(lights=copy.deepcopy(lights[:4])).start(),
+            MockLIFXServer(lights=copy.deepcopy(lights[2:])).start())
+
+def test_pool_routes_by_ownership():
+    first, second = make_servers()
+    try:
+        pool = ClientPool.from_keys(['key1', 'key2'], first.endpoint)
+        pool.clients[1].http_base = second.endpoint
+        p = PIFX(client=pool)
+
+        # unknown ownership: every key is asked, results merged
+        assert len(p.list_lights()) == 6
+        assert [load['lights'] for load in pool.load()] == [4, 4]
+
+        # owned by the first account only
+        p.set_state('id:d073d5000000', power='on')
+        assert first.requests[-1] == ('PUT', '/v1/lights/id:d073d5000000/state')
+        assert len(second.requests) == 1
+
+        # spread over both accounts, each gets its own lights
+        results = p.set_state('all', brightness=0.5)
+        assert sorted(result['id'] for result in results) == [
+            light['id'] for light in make_lights(6)]
+        assert len(first.requests) + len(second.requests) == 5
+
+        results = p.set_states([
+            {'selector': 'id:d073d5000005', 'power': 'on'},
+            {'selector': 'id:d073d5000000', 'power': 'on'},
+        ])
+        assert [r['results'][0]['id'] for r in results] == [
+            'd073d5000005', 'd073d5000000']
+        assert second.lights[-1]['power'] == 'on'
+    finally:
+        first.stop()
+        second.stop()
+
+def test_pool_spreads_reads():
+    first, second = make_servers()
+    try:
+        pool = ClientPool.from_keys(['key1', 'key2'], first.endpoint)
+        pool.clients[1].http_base = second.endpoint
+        pool.refresh()
+
+        for _ in range(4):
+            pool.perform_request(method='get', endpoint='lights/{}',
+                endpoint_args=['id:d073d5000002'], parse_data=False)
+
+        # both accounts see light 2, so reads alternate between them
+        assert [load['requests'] for load in pool.load()] == [3, 3]
+    finally:
+        first.stop()
+        second.stop()
+
+def test_pool_toggles_across_accounts_as_one_selector():
+    lights = make_lights(4)
+    lights[0]['power'] = 'on'
+    first = MockLIFXServer(lights=copy.deepcopy(lights[:2])).start()
+    second = MockLIFXServer(lights=copy.deepcopy(lights[2:])).start()
+    try:
+        pool = ClientPool.from_keys(['key1', 'key2'], first.endpoint)
+        pool.clients[1].http_base = second.endpoint
+        p = PIFX(client=pool)
+
+        def powers():
+            return [light['power'] for light in first.lights + second.lights]
+
+        # ownership unknown, every key is sent the selector
+        results = p.toggle_power('all')
+        assert len(results) == 4
+        assert powers() == ['off'] * 4
+
+        # ownership learned, every key is sent its own lights
+        pool.refresh()
+        p.toggle_power('all')
+        assert powers() == ['on'] * 4
+        assert first.requests[-1] == (
+            'PUT', '/v1/lights/id:d073d5000000,id:d073d5000001/state')
+    finally:
+        first.stop()
+        second.stop()
@@ -0,0 +1,89 @@
+import sys
+sys.path.insert(1, '..')
+
+from pifx.ratelimit import RateLimiter, limiter_for_key
+from pifx.testing import FakeClock
+
+
+def make_limiter():
+    clock = FakeClock(1000.0)
+    return clock, RateLimiter(period=60.0, clock=clock.time, sleep=clock.sleep)
+
+def headers(limit, remaining, reset):
+    return {
+        'X-RateLimit-Limit': str(limit),
+        'X-RateLimit-Remaining': str(remaining),
+        'X-RateLimit-Reset': str(reset),
+    }
+
+def test_unknown_quota_does_not_wait():
+    clock, limiter = make_limiter()
+    for _ in range(10):
+        limiter.acquire()
+    assert clock.sleeps == []
+    assert limiter.budget is None
+
+def test_budget_tracks_headers():
+    clock, limiter = make_limiter()
+    limiter.update(headers(120, 5, 1060))
+    assert limiter.budget == 5
+    limiter.acquire()
+    assert limiter.budget == 4
+    assert clock.sleeps == []
+
+def test_exhausted_quota_waits_for_reset():
+    clock, limiter = make_limiter()
+    limiter.update(headers(120, 0, 1030))
+    assert limiter.budget == 0
+    limiter.acquire()
+    assert clock.now == 1030.0
+    assert limiter.queue_depth == 0
+    assert limiter.budget == 119
+
+def test_empty_bucket_paces_at_refill_rate():
+    clock, limiter = make_limiter()
+    limiter.update(headers(60, 1, 1060))
+    limiter.acquire()
+    limiter.acquire()
+    # 60 requests per 60 seconds refills one token per second
+    assert abs(clock.now - 1001.0) < 1e-6
+
+def test_limiters_shared_per_key():
+    assert limiter_for_key("key-a") is limiter_for_key("key-a")
+    assert limiter_for_key("key-a") is not limiter_for_key("key-b")
+
+def test_deadline_exceeded_while_waiting():
+    from pifx.exceptions import DeadlineExceeded
+
+    clock, limiter = make_limiter()
+    limiter.update(headers(120, 0, 1030))
+    try:
+        limiter.acquire(deadline=1010)
+        assert False, "expected DeadlineExceeded"
+    except DeadlineExceeded:
+        pass
+    # dropped without waiting, and no longer queued
+    assert clock.sleeps == []
+    assert limiter.queue_depth == 0
+
+def test_higher_priority_served_first():
+    import threading
+    import time
+
+    limiter = RateLimiter(period=0.2)
+    limiter.update(headers(1, 0, time.time() + 0.2))
+    order = []
+
+    def acquire(name, priority):
+        limiter.acquire(priority)
+        order.append(name)
+
+    low = threading.Thread(target=acquire, args=('low', 0))
+    low.start()
+    time.sleep(0.05)
+    high = threading.Thread(target=acquire, args=('high', 10))
+    high.start()
+    low.join()
+    high.join()
+
+    assert order == ['high', 'low']
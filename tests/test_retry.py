@@ -0,0 +1,150 @@
+import sys
+sys.path.insert(1, '..')
+
+import json
+
+import requests
+
+from pifx.client import LIFXWebAPIClient
+from pifx.retry import RetryPolicy
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(
+            body if body is not None else {"results": []}).encode("utf-8")
+
+class FakeSession:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+def make_client(outcomes, **policy_kwargs):
+    sleeps = []
+    policy = RetryPolicy(sleep=sleeps.append, random=lambda: 1.0,
+        clock=lambda: 1000.0, **policy_kwargs)
+    client = LIFXWebAPIClient("abc123", rate_limit=False, retry_policy=policy)
+    client._s = FakeSession(outcomes)
+    return client, sleeps
+
+def test_backoff_is_capped_exponential_with_jitter():
+    policy = RetryPolicy(backoff_base=1.0, backoff_cap=5.0, random=lambda: 0.5)
+    assert policy.backoff(1) == 0.5
+    assert policy.backoff(2) == 1.0
+    assert policy.backoff(10) == 2.5
+
+def test_backoff_honours_retry_after():
+    policy = RetryPolicy(random=lambda: 0.0, clock=lambda: 1000.0)
+    assert policy.backoff(1, {'Retry-After': '3'}) == 3.0
+    assert policy.backoff(1, {'X-RateLimit-Reset': '1004'}, 429) == 4.0
+    # sent on every response, only a wait time when rate limited
+    assert policy.backoff(1, {'X-RateLimit-Remaining': '100',
+                              'X-RateLimit-Reset': '1050'}, 503) == 0.0
+
+def test_idempotent_request_retried_until_success():
+    ok = FakeResponse(200, {"results": ["done"]})
+    client, sleeps = make_client([FakeResponse(503), FakeResponse(502), ok])
+
+    assert client.perform_request('put', 'lights/{}/state', ['all']) == ["done"]
+    assert client._s.calls == 3
+    assert sleeps == [0.5, 1.0]
+
+def test_post_not_retried_unless_marked():
+    client, sleeps = make_client([FakeResponse(503)])
+    try:
+        client.perform_request('post', 'lights/{}/toggle', ['all'])
+    except Exception as e:
+        assert str(e).startswith("503")
+    else:
+        assert False, "expected failure"
+    assert client._s.calls == 1
+
+    client, sleeps = make_client([FakeResponse(503), FakeResponse(200)])
+    client.perform_request('post', 'lights/{}/toggle', ['all'], retry=True)
+    assert client._s.calls == 2
+
+def test_gives_up_after_max_attempts():
+    client, sleeps = make_client(
+        [requests.ConnectionError(), requests.ConnectionError()],
+        max_attempts=2)
+    try:
+        client.perform_request('get', 'scenes', parse_data=False)
+    except requests.ConnectionError:
+        pass
+    else:
+        assert False, "expected failure"
+    assert client._s.calls == 2
+    assert len(sleeps) == 1
+
+def test_client_errors_not_retried():
+    client, sleeps = make_client([FakeResponse(404)])
+    try:
+        client.perform_request('get', 'lights/{}', ['label:x'])
+    except Exception:
+        pass
+    assert client._s.calls == 1
+
+def test_error_status_checked_before_parsing_body():
+    html = FakeResponse(502)
+    html.content = b'<html>Bad Gateway</html>'
+    client, sleeps = make_client([html])
+    try:
+        client.perform_request('post', 'lights/{}/toggle', ['all'])
+    except ValueError:
+        assert False, "HTML body should not be parsed"
+    except Exception as e:
+        assert str(e).startswith("502")
+
+def test_reissue_failed_lights_only():
+    from pifx import PIFX
+    from pifx.retry import REISSUE_ENDPOINTS, ReissuePolicy
+    from pifx.testing import MockLIFXServer
+
+    with MockLIFXServer(light_count=4) as server:
+        p = PIFX('abc123', http_endpoint=server.endpoint,
+            reissue_policy=ReissuePolicy(max_attempts=3))
+        server.timed_out_ids.update(['d073d5000001', 'd073d5000002'])
+        server.offline_ids.add('d073d5000003')
+
+        results = p.set_state('all', power='on')
+        # 1 initial request, then 2 re-issues to the timed out lights only
+        assert server.requests[-2:] == [
+            ('PUT', '/v1/lights/id:d073d5000001,id:d073d5000002/state')] * 2
+        assert [result['status'] for result in results] == [
+            'ok', 'timed_out', 'timed_out', 'offline']
+
+        server.timed_out_ids.discard('d073d5000002')
+        results = p.set_states([
+            {'selector': 'group:Group 1', 'power': 'off'},
+            {'selector': 'group:Group 2', 'brightness': 0.5},
+        ])
+        assert server.requests[-1] == ('PUT', '/v1/lights/states')
+        assert [r['status'] for r in results[0]['results']] == ['timed_out']
+        assert [r['status'] for r in results[1]['results']] == ['ok']
+
+        # toggling a subset of lights could flip them the other way
+        requests_sent = len(server.requests)
+        p.toggle_power('all')
+        assert len(server.requests) == requests_sent + 1
+
+        # a timed out light may have applied the delta already
+        p.state_delta('all', hue=30)
+        assert len(server.requests) == requests_sent + 2
+
+        p.reissue_policy = ReissuePolicy(
+            endpoints=REISSUE_ENDPOINTS + ('lights/{}/state/delta',))
+        p.state_delta('all', hue=30)
+        assert server.requests[-1] == (
+            'POST', '/v1/lights/id:d073d5000001/state/delta')
+
+        server.timed_out_ids.clear()
+        assert p.list_lights('id:d073d5000002')[0]['brightness'] == 0.5
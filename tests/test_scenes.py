@@ -0,0 +1,72 @@
+import sys
+sys.path.insert(1, '..')
+
+from pifx import PIFX
+from pifx.util import iter_results
+from pifx.scenes import diff_scene, light_changes
+from pifx.testing import MockLIFXServer, make_lights
+
+
+def test_light_changes():
+    light = make_lights(1)[0]
+
+    assert light_changes(light, {'power': 'off', 'brightness': 1.0}) == {}
+    # within the tolerance of values reported by bulbs
+    assert light_changes(light, {'color': 'kelvin:3502 saturation:0.001'}) == {}
+    assert light_changes(light, {'color': 'hue:359.8', 'power': 'off'}) == {}
+
+    assert light_changes(light, {'power': 'on', 'color': 'kelvin:3500'}) == {
+        'power': 'on'}
+    # only the components which differ are sent
+    assert light_changes(light, {'color': 'red'}) == {'color': 'saturation:1'}
+    assert light_changes(light, {'color': 'blue brightness:0.5'}) == {
+        'color': 'hue:250 saturation:1', 'brightness': 0.5}
+
+def test_diff_scene_groups_lights():
+    lights = make_lights(6)
+    lights[5]['connected'] = False
+    targets = dict((light['id'], {'power': 'off', 'color': 'kelvin:3500'})
+                   for light in lights)
+    targets['d073d5000001'] = {'power': 'on'}
+    targets['d073d5000003'] = {'power': 'on'}
+    targets['d073d5000004'] = {'color': 'red'}
+    targets['d073d5000005'] = {'power': 'on'}
+    targets['d073d50000ff'] = {'power': 'on', 'color': None}
+
+    operations = sorted(diff_scene(lights, targets),
+                        key=lambda operation: operation['selector'])
+    assert operations == [
+        # lights missing from the snapshot receive their whole target
+        {'selector': 'id:d073d5000001,id:d073d5000003,id:d073d50000ff',
+         'power': 'on'},
+        {'selector': 'id:d073d5000004', 'color': 'saturation:1'},
+    ]
+
+    assert diff_scene(lights, {}) == []
+
+def test_apply_scene_sends_only_changes():
+    with MockLIFXServer(light_count=300) as server:
+        p = PIFX(api_key='key', http_endpoint=server.endpoint)
+
+        targets = dict((light['id'], {'power': 'off', 'brightness': 1.0})
+                       for light in server.lights)
+        changed = [light['id'] for light in server.lights[::15]]
+        for light_id in changed:
+            targets[light_id] = {'power': 'on', 'color': 'kelvin:2700',
+                                 'brightness': 0.4}
+
+        results = p.apply_scene(targets, duration=2.0)
+        assert sorted(result['id'] for result in iter_results(results)) == sorted(changed)
+        # one read and one write instead of a request per light
+        assert server.requests == [
+            ('GET', '/v1/lights/all'), ('PUT', '/v1/lights/states')]
+
+        for light in server.lights:
+            if light['id'] in changed:
+                assert light['power'] == 'on'
+                assert light['color']['kelvin'] == 2700
+                assert light['brightness'] == 0.4
+
+        # already applied, nothing is sent
+        assert p.apply_scene(targets, snapshot=p.list_lights()) == []
+        assert len(server.requests) == 3
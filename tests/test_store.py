@@ -0,0 +1,70 @@
+import sys
+sys.path.insert(1, '..')
+
+from pifx import PIFX
+from pifx.testing import LightsClient
+
+LIGHTS = [
+    {"id": "d1", "label": "Desk", "power": "off", "brightness": 0.5,
+     "color": {"hue": 0.0, "saturation": 0.0, "kelvin": 3500}},
+    {"id": "d2", "label": "Lamp", "power": "off", "brightness": 1.0,
+     "color": {"hue": 120.0, "saturation": 1.0, "kelvin": 3500}},
+]
+
+def make_pifx(results=None):
+    p = PIFX(client=LightsClient(LIGHTS, results), state_store=True)
+    p.list_lights()
+    return p
+
+def test_reads_after_writes_served_locally():
+    p = make_pifx()
+    p.set_state('label:Desk', power='on', color='blue', brightness=0.8)
+
+    desk = p.get_state('label:Desk')[0]
+    assert desk['power'] == 'on'
+    assert desk['color']['hue'] == 250.0
+    assert desk['color']['saturation'] == 1.0
+    assert desk['brightness'] == 0.8
+    assert len(p.client.requests) == 2
+
+def test_delta_and_toggle_predictions():
+    p = make_pifx()
+    p.state_delta('label:Lamp', hue=300, brightness=0.5)
+    lamp = p.get_state('label:Lamp')[0]
+    assert lamp['color']['hue'] == 60.0
+    assert lamp['brightness'] == 1.0
+
+    p.toggle_power()
+    assert [l['power'] for l in p.get_state()] == ['on', 'on']
+    p.toggle_power()
+    assert [l['power'] for l in p.get_state()] == ['off', 'off']
+    assert len(p.client.requests) == 4
+
+def test_failed_lights_not_updated():
+    p = make_pifx(results=[{"id": "d1", "status": "timed_out"},
+                           {"id": "d2", "status": "ok"}])
+    p.set_state(power='on')
+    assert [l['power'] for l in p.get_state()] == ['off', 'on']
+
+def test_unpredictable_writes_refetch():
+    p = make_pifx()
+    p.cycle_lights(states=[{"power": "on"}, {"power": "off"}], defaults={})
+    lights = p.get_state('label:Desk')
+    assert lights[0]['power'] == 'off'
+    assert p.client.requests[-1]['method'] == 'get'
+
+def test_narrower_read_does_not_answer_other_selectors():
+    p = PIFX(client=LightsClient(LIGHTS), state_store=True)
+    p.list_lights('label:Desk')
+
+    assert p.store.get('label:Desk') is not None
+    assert p.store.get('all') is None
+    assert p.store.get('label:Lamp') is None
+
+    assert len(p.get_state('all')) == 2
+    assert len(p.client.requests) == 2
+    assert p.client.requests[1]['endpoint_args'] == ['all']
+
+    # once all lights are listed, any selector is answered locally
+    assert len(p.get_state('label:Lamp')) == 1
+    assert len(p.client.requests) == 2
@@ -0,0 +1,47 @@
+import sys
+sys.path.insert(1, '..')
+
+from pifx import PIFX
+from pifx.retry import RetryPolicy
+from pifx.testing import MockLIFXServer
+
+
+def make_pifx(server, **kwargs):
+    return PIFX('abc123', http_endpoint=server.endpoint, **kwargs)
+
+def test_mock_server_reads_and_writes():
+    with MockLIFXServer(light_count=6) as server:
+        p = make_pifx(server)
+
+        assert len(p.list_lights()) == 6
+        assert len(p.list_lights('group:Group 1')) == 2
+        assert len(list(p.iter_lights())) == 6
+
+        results = p.set_state('id:d073d5000001', power='on', color='red')
+        assert results == [{'id': 'd073d5000001', 'label': 'Light 1', 'status': 'ok'}]
+
+        light = p.list_lights('id:d073d5000001')[0]
+        assert light['power'] == 'on'
+        assert light['color']['saturation'] == 1.0
+
+        results = p.set_states([{'selector': 'all', 'brightness': 0.5}])
+        assert len(results[0]['results']) == 6
+        assert all(light['brightness'] == 0.5 for light in p.list_lights())
+
+def test_mock_server_rate_limit_and_errors():
+    with MockLIFXServer(light_count=2, rate_limit=1, rate_limit_period=0.2) as server:
+        p = make_pifx(server, rate_limit=False,
+            retry_policy=RetryPolicy(max_attempts=5, backoff_base=0.01))
+
+        p.list_lights()
+        # the second request is answered 429 until the period resets
+        assert len(p.list_lights()) == 2
+        assert len(server.requests) >= 3
+
+    with MockLIFXServer(light_count=2, error_rate=1.0) as server:
+        p = make_pifx(server)
+        try:
+            p.list_lights()
+            assert False, "Expected a server error"
+        except Exception as e:
+            assert str(e).startswith('503')
@@ -49,3 +49,28 @@ def test_encode_url_path():
     actual_path = util.encode_url_path(url_path)
     assert actual_path == expected_path
     
+
+def test_chunk_list():
+    assert util.chunk_list([1, 2, 3, 4, 5], 2) == [[1, 2], [3, 4], [5]]
+    assert util.chunk_list([], 2) == []
+
+def test_iter_json_array_across_chunks():
+    body = u'[{"id": "a", "label": "Café"}, {"id": "b"}, 12345, "x"]'.encode('utf-8')
+    expected = [{"id": "a", "label": u"Café"}, {"id": "b"}, 12345, "x"]
+
+    for chunk_size in (1, 2, 3, 7, len(body)):
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        assert list(util.iter_json_array(chunks)) == expected
+
+    assert list(util.iter_json_array([b'[]'])) == []
+
+def test_iter_json_array_truncated():
+    try:
+        list(util.iter_json_array([b'[{"id": "a"}, {"id"']))
+    except ValueError:
+        pass
+    else:
+        assert False, "expected ValueError"
+
+def test_parse_text_accepts_bytes():
+    assert util.parse_text(b'{"results": [1]}') == {"results": [1]}
@@ -0,0 +1,51 @@
+import sys
+sys.path.insert(1, '..')
+
+import unittest
+
+try:
+    import numpy as np
+    from pifx import vector
+except ImportError:
+    raise unittest.SkipTest("numpy is not installed")
+
+from pifx import color
+
+
+def test_interpolate_takes_shortest_hue_path():
+    frames = vector.interpolate([350, 1, 0, 2500], [10, 1, 1, 6500], 3)
+    assert frames.shape == (3, 1, 4)
+    np.testing.assert_allclose(frames[:, 0, vector.HUE], [350, 0, 10])
+    np.testing.assert_allclose(frames[:, 0, vector.BRIGHTNESS], [0, 0.5, 1])
+    np.testing.assert_allclose(frames[:, 0, vector.KELVIN], [2500, 4500, 6500])
+
+def test_gradient_endpoints():
+    colors = vector.gradient([[0, 1, 1, 3500], [120, 1, 1, 3500], [240, 1, 1, 3500]], 5)
+    np.testing.assert_allclose(colors[:, vector.HUE], [0, 60, 120, 180, 240])
+
+def test_rgb_conversion_matches_scalar_version():
+    rgb = np.array([[255, 128, 0], [0, 0, 0], [12, 200, 90], [255, 255, 255]])
+    hsbk = vector.rgb_to_hsbk(rgb)
+    for row, expected in zip(hsbk, rgb):
+        scalar = color.rgb_to_hsbk(*expected)
+        np.testing.assert_allclose(row[:3], scalar[:3], atol=1e-9)
+    np.testing.assert_allclose(vector.hsbk_to_rgb(hsbk), rgb)
+
+def test_gamma_and_kelvin_blend():
+    hsbk = vector.apply_gamma([[0, 1, 0.5, 3500]], gamma=2.0)
+    assert hsbk[0, vector.BRIGHTNESS] == 0.25
+    blended = vector.blend_kelvin([[0, 0, 1, 2500], [0, 0, 1, 6500]], 4500, [0.5, 1.0])
+    np.testing.assert_allclose(blended[:, vector.KELVIN], [3500, 4500])
+
+def test_to_operations_groups_identical_colors():
+    ids = ['d1', 'd2', 'd3', 'd4']
+    hsbk = [[0, 1, 1, 3500], [120, 1, 1, 3500], [0.2, 1, 1, 3500], [120, 1, 1, 3510]]
+    operations = vector.to_operations(ids, hsbk, power='on', duration=0.5)
+
+    assert len(operations) == 2
+    by_selector = dict((op['selector'], op) for op in operations)
+    assert by_selector['id:d1,id:d3']['color'] == 'hue:0 saturation:1 kelvin:3500'
+    assert by_selector['id:d2,id:d4']['brightness'] == 1.0
+    assert by_selector['id:d2,id:d4']['power'] == 'on'
+    for operation in operations:
+        color.validate_color(operation['color'])
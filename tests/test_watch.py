@@ -0,0 +1,98 @@
+import sys
+sys.path.insert(1, '..')
+
+import threading
+import time
+
+from pifx import PIFX
+from pifx.exceptions import ServerUnavailable
+from pifx.testing import LightsClient
+from pifx.watch import FIELD_ADDED, FIELD_REMOVED, Watcher
+
+LIGHTS = [
+    {"id": "d1", "power": "on", "brightness": 0.5, "connected": True,
+     "color": {"hue": 0, "saturation": 1, "kelvin": 3500}},
+    {"id": "d2", "power": "off", "brightness": 1.0, "connected": True,
+     "color": {"hue": 120, "saturation": 1, "kelvin": 3500}},
+]
+
+def test_watch_emits_only_changes():
+    p = PIFX(client=LightsClient(LIGHTS))
+    watcher = p.watch(interval=1.0, max_interval=4.0)
+    received = []
+    watcher.subscribe(received.append)
+
+    assert watcher.poll() == []
+
+    p.client.lights[0]['power'] = 'off'
+    p.client.lights[1]['color']['hue'] = 240
+    events = watcher.poll()
+    assert sorted((e.light_id, e.field) for e in events) == [
+        ('d1', 'power'), ('d2', 'color')]
+    assert events == received
+    power_event = [e for e in events if e.field == 'power'][0]
+    assert (power_event.old, power_event.new) == ('on', 'off')
+
+    p.client.lights.append({"id": "d3", "power": "on"})
+    del p.client.lights[0]
+    fields = sorted((e.light_id, e.field) for e in watcher.poll())
+    assert fields == [('d1', FIELD_REMOVED), ('d3', FIELD_ADDED)]
+
+def test_interval_backs_off_and_tightens_after_writes():
+    p = PIFX(client=LightsClient(LIGHTS))
+    watcher = p.watch(interval=1.0, max_interval=4.0)
+
+    intervals = []
+    for _ in range(4):
+        watcher.poll()
+        intervals.append(watcher.interval)
+    assert intervals == [2.0, 4.0, 4.0, 4.0]
+
+    p.set_state('id:d1', power='off')
+    assert watcher.interval == 1.0
+
+def test_iteration_yields_events():
+    client = LightsClient(LIGHTS)
+    p = PIFX(client=client)
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        client.lights[0]['brightness'] += 0.1
+
+    watcher = Watcher(p, interval=1.0, sleep=sleep)
+    events = iter(watcher)
+    event = next(events)
+    assert (event.light_id, event.field) == ('d1', 'brightness')
+    # nothing changed at the baseline poll, so the interval backed off
+    assert sleeps == [2.0]
+
+def test_background_poller_survives_errors():
+    client = LightsClient(LIGHTS)
+    p = PIFX(client=client)
+    failures = [ServerUnavailable("503: Service Unavailable", status=503)]
+    perform_request = client.perform_request
+
+    def flaky_request(**kwargs):
+        if failures:
+            raise failures.pop()
+        return perform_request(**kwargs)
+    client.perform_request = flaky_request
+
+    watcher = p.watch(interval=0.01)
+    errors = []
+    polled = threading.Event()
+    watcher.subscribe_errors(errors.append)
+    watcher.subscribe(lambda event: polled.set())
+    watcher.start()
+    try:
+        # the poll after the error records the baseline, then sees this
+        while watcher._snapshot is None:
+            time.sleep(0.005)
+        client.lights[0]['power'] = 'off'
+        assert polled.wait(2.0)
+    finally:
+        watcher.stop()
+
+    assert [type(error) for error in errors] == [ServerUnavailable]
+    assert watcher.last_error is errors[0]